@@ -0,0 +1,243 @@
+# Backfill runner: rebuilds history for a range of years and genres in parallel
+#
+# Usage:
+#   python backfill.py --start-year 2014 --end-year 2023 --genres pop,hip-hop,rock,electronic,all
+#
+# Every (year, genre) pair is one partition, run through extract -> transform -> load
+# in its own process. Completed partitions are recorded in the state file so an
+# interrupted backfill picks up where it stopped.
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from enrich import enrich_dimensions
+from extract import GENRES, create_spotify_dataset, get_search_term
+from transform import transform_dataset
+from load import load_dataset, log_etl_run
+from staging import write_staging
+from summaries import refresh_summaries
+from utils.checkpoint import open_checkpoint
+from utils.logger_config import setup_logger
+from utils.metrics import recorder
+from utils.search_cache import create_search_cache
+from utils.state_file import load_state, save_state
+
+def build_partitions(start_year, end_year, genres):
+    """Split a year range and genre list into (year, genre) partitions, genre None is the whole year"""
+    return [
+        (year, None if genre == 'all' else genre)
+        for year in range(start_year, end_year + 1)
+        for genre in genres
+    ]
+
+def partition_key(year, genre):
+    return f"{year}:{genre or 'all'}"
+
+def run_partition(year, genre, tracks_per_term, requests_per_second, max_workers):
+    """
+    Run extract -> transform -> load for one partition, inside a worker process
+
+    Returns:
+        Dictionary with the partition's ETL run data
+    """
+    logger = setup_logger()
+    load_dotenv(dotenv_path=Path('.') / '.env')
+
+    etl_run_data = {
+        'status': 'failure',
+        'extract_status': 'failure',
+        'transform_status': 'failure',
+        'load_status': 'failure',
+        'tracks_extracted': 0,
+        'tracks_loaded': 0,
+        'error_message': None,
+        'duration_seconds': 0,
+        'release_months': set()
+    }
+    start_time = time.time()
+    recorder.reset()  # Pool processes run several partitions one after another
+    term = get_search_term(year, genre)
+    logger.info(f"Backfill partition {partition_key(year, genre)} started ({term})")
+
+    search_cache = create_search_cache(
+        backend=os.getenv('SEARCH_CACHE', 'sqlite'),
+        ttl=int(os.getenv('SEARCH_CACHE_TTL', 86400)),
+        max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 50000)),
+        redis_url=os.getenv('REDIS_URL')
+    )
+
+    # A partition that failed halfway resumes from its checkpoint on the next backfill
+    checkpoint = open_checkpoint(f"backfill-{year}-{genre or 'all'}-{tracks_per_term}", logger=logger)
+    
+    try:
+        df = create_spotify_dataset(os.getenv('CLIENT_ID'), os.getenv('CLIENT_SECRET'), year=year,
+                                    tracks_per_term=tracks_per_term, logger=logger, max_workers=max_workers,
+                                    requests_per_second=requests_per_second, cache=search_cache,
+                                    search_terms=[term], checkpoint=checkpoint)
+        etl_run_data['tracks_extracted'] = len(df)
+        if df.empty:
+            raise RuntimeError(f"No tracks found for {term}")
+        etl_run_data['extract_status'] = 'success'
+
+        df = transform_dataset(df)
+        etl_run_data['transform_status'] = 'success'
+        chunk_key = checkpoint.chunk_key(df)
+        if not checkpoint.is_chunk_done('staging', chunk_key):
+            write_staging(df, year, genre=genre or 'all', logger=logger)
+            checkpoint.mark_chunk_done('staging', chunk_key)
+
+        success, loaded_count = load_dataset(df, logger=logger, checkpoint=checkpoint,
+                                             months=etl_run_data['release_months'])
+        etl_run_data['load_status'] = 'success' if success else 'failure'
+        etl_run_data['tracks_loaded'] = loaded_count if success else 0
+        if success:
+            etl_run_data['status'] = 'success'
+
+    except Exception as e:
+        etl_run_data['error_message'] = str(e)
+        logger.error(f"Backfill partition {partition_key(year, genre)} failed: {e}")
+
+    finally:
+        if etl_run_data['status'] == 'success':
+            checkpoint.complete()
+        else:
+            checkpoint.close()
+        etl_run_data['duration_seconds'] = time.time() - start_time
+        try:
+            log_etl_run(etl_run_data, logger, stage_metrics=recorder.to_records())
+        except Exception as e:
+            etl_run_data['status'] = 'failure'
+            etl_run_data['error_message'] = etl_run_data['error_message'] or str(e)
+
+    return etl_run_data
+
+def run_backfill(start_year, end_year, genres, tracks_per_term=300, processes=4, requests_per_second=10,
+                 threads_per_partition=2, state_file='backfill_state.json', logger=None, release_months=None):
+    """
+    Run every pending (year, genre) partition across a process pool
+
+    The requests_per_second budget is global: each process gets an equal share for
+    its rate limiter, so the pool as a whole never goes over it. If release_months
+    is a set, the release months loaded by completed partitions are added to it.
+
+    Returns:
+        Tuple of (completed partitions, failed partitions) for this invocation
+    """
+    state = load_state(state_file, {'completed': {}})
+    partitions = build_partitions(start_year, end_year, genres)
+    pending = [p for p in partitions if partition_key(*p) not in state['completed']]
+
+    print(f"Backfill: {len(partitions)} partitions, {len(partitions) - len(pending)} already completed")
+    if logger:
+        logger.info(f"Backfill: {len(partitions)} partitions, {len(pending)} pending")
+    if not pending:
+        return [], []
+
+    processes = max(1, min(processes, len(pending)))
+    rate_per_process = requests_per_second / processes
+    # Only the concurrent search path goes through the rate limiter
+    threads_per_partition = max(2, threads_per_partition)
+
+    completed, failed = [], []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(run_partition, year, genre, tracks_per_term, rate_per_process, threads_per_partition): (year, genre)
+            for year, genre in pending
+        }
+        for future in as_completed(futures):
+            key = partition_key(*futures[future])
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'failure', 'error_message': str(e)}
+
+            if result['status'] == 'success':
+                state['completed'][key] = {
+                    'tracks_extracted': result['tracks_extracted'],
+                    'tracks_loaded': result['tracks_loaded'],
+                    'duration_seconds': round(result['duration_seconds'], 2),
+                    'completed_at': time.strftime('%Y-%m-%d %H:%M:%S')
+                }
+                save_state(state_file, state)
+                completed.append(key)
+                if release_months is not None:
+                    release_months.update(result['release_months'])
+                print(f"✓ Partition {key}: {result['tracks_loaded']} new tracks")
+                if logger:
+                    logger.info(f"Partition {key} completed: {result['tracks_loaded']} new tracks")
+            else:
+                failed.append(key)
+                print(f"✗ Partition {key} failed: {result['error_message']}")
+                if logger:
+                    logger.error(f"Partition {key} failed: {result['error_message']}")
+
+    return completed, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill Spotify tracks for a range of years and genres")
+    parser.add_argument('--start-year', type=int, required=True)
+    parser.add_argument('--end-year', type=int, required=True)
+    parser.add_argument('--genres', default=','.join(GENRES + ['all']),
+                        help="Comma separated genres, 'all' is a general search for the year")
+    parser.add_argument('--tracks-per-term', type=int, default=300)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads-per-partition', type=int, default=2)
+    parser.add_argument('--requests-per-second', type=float, default=10,
+                        help="API rate budget shared by all processes")
+    parser.add_argument('--state-file', default='backfill_state.json')
+    parser.add_argument('--reset', action='store_true', help="Forget completed partitions and start over")
+    parser.add_argument('--skip-enrich', action='store_true', help="Don't fill the artists / albums tables afterwards")
+    parser.add_argument('--skip-summaries', action='store_true', help="Don't refresh the dashboard summary tables afterwards")
+    args = parser.parse_args(argv)
+
+    logger = setup_logger()
+    load_dotenv(dotenv_path=Path('.') / '.env')
+
+    # Worker processes can't prompt for anything, so fail early
+    missing = [name for name in ('CLIENT_ID', 'CLIENT_SECRET', 'MYSQL_PASSWORD') if not os.getenv(name)]
+    if missing:
+        logger.error(f"Missing {', '.join(missing)} in environment (.env file)")
+        raise RuntimeError(f"Missing {', '.join(missing)} in environment (.env file)")
+
+    if args.reset and os.path.exists(args.state_file):
+        os.remove(args.state_file)
+
+    genres = [genre.strip() for genre in args.genres.split(',') if genre.strip()]
+    start_time = time.time()
+    months = set()
+    completed, failed = run_backfill(args.start_year, args.end_year, genres,
+                                     tracks_per_term=args.tracks_per_term, processes=args.processes,
+                                     requests_per_second=args.requests_per_second,
+                                     threads_per_partition=args.threads_per_partition,
+                                     state_file=args.state_file, logger=logger, release_months=months)
+
+    # Once for the whole backfill too, partitions refreshing concurrently would just queue up
+    if months and not args.skip_summaries:
+        try:
+            refresh_summaries(months, logger=logger)
+        except Exception as e:
+            print(f"Summary table refresh failed: {e}")
+            logger.error(f"Summary table refresh failed: {e}")
+
+    # Once for the whole backfill, partitions share most of their artists
+    if completed and not args.skip_enrich:
+        try:
+            enrich_dimensions(os.getenv('CLIENT_ID'), os.getenv('CLIENT_SECRET'), logger=logger,
+                              requests_per_second=args.requests_per_second)
+        except Exception as e:
+            print(f"Artist / album enrichment failed: {e}")
+            logger.error(f"Artist / album enrichment failed: {e}")
+
+    print(f"Backfill finished in {time.time() - start_time:.1f}s: "
+          f"{len(completed)} partitions completed, {len(failed)} failed")
+    logger.info(f"Backfill finished: {len(completed)} completed, {len(failed)} failed")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+# Per-partition client setup vs the shared client factory, against a local fake Spotify server
+# Usage: python benchmarks/bench_client.py --partitions 40 --processes 4 --searches 10
+#
+# A local keep-alive HTTP server stands in for accounts.spotify.com and api.spotify.com. Every
+# new connection waits --handshake-ms (the TCP + TLS handshake to Spotify) and every token
+# request waits --token-ms. Partitions run in a process pool like backfill.py, each one makes
+# a client and runs --searches searches. 'per-partition client' is what setup_spotify_client
+# used to do: a new SpotifyClientCredentials and spotipy.Spotify (and session) per call.
+# Reported per variant: token requests, connections opened, mean partition time and the mean
+# time to the first search result of a partition.
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
+
+SEARCH_PAGE = json.dumps({'tracks': {'items': [], 'total': 0, 'limit': 50, 'offset': 0}}).encode()
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, one handler per connection
+    wbufsize = 65536  # Headers and body in one write, or delayed ACKs stall every keep-alive response
+
+    def setup(self):
+        super().setup()
+        server = self.server
+        with server.lock:
+            server.counts['connections'] += 1
+        time.sleep(server.handshake)
+
+    def send_json(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.counts['tokens'] += 1
+        time.sleep(self.server.token_latency)
+        self.send_json(json.dumps({'access_token': 'fake', 'token_type': 'Bearer', 'expires_in': 3600}).encode())
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.counts['searches'] += 1
+        self.send_json(SEARCH_PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def init_worker(base_url, workdir):
+    """Point spotipy at the fake server, token files go to a scratch directory"""
+    import extract  # Imported up front in both variants, pandas is not what's measured
+    os.chdir(workdir)
+    os.environ['SPOTIFY_TOKEN_CACHE'] = 'file'
+    SpotifyClientCredentials.OAUTH_TOKEN_URL = f'{base_url}/api/token'
+    global API_PREFIX
+    API_PREFIX = f'{base_url}/v1/'
+
+
+def run_partition(shared, searches):
+    """Make a client like one partition does and run its searches"""
+    start = time.perf_counter()
+    if shared:
+        from extract import setup_spotify_client
+        sp = setup_spotify_client('bench-client', 'secret', retry_rate_limits=False)
+    else:
+        sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials('bench-client', 'secret'),
+                             status_forcelist=(500, 502, 503, 504))
+    sp.prefix = API_PREFIX
+    first = None
+    for i in range(searches):
+        sp.search(q='year:2023', type='track', limit=50, offset=i * 50)
+        if first is None:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first
+
+
+def run_variant(base_url, server, shared, partitions, processes, searches):
+    with server.lock:
+        server.counts.update(connections=0, tokens=0, searches=0)
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stderr(open(os.devnull, 'w')):
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                                 initargs=(base_url, workdir)) as executor:
+            results = list(executor.map(run_partition, [shared] * partitions, [searches] * partitions))
+        seconds = time.perf_counter() - start
+    return dict(server.counts, seconds=seconds,
+                partition_ms=sum(result[0] for result in results) / partitions * 1000,
+                first_ms=sum(result[1] for result in results) / partitions * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--partitions', type=int, default=40)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--searches', type=int, default=10, help='searches per partition')
+    parser.add_argument('--handshake-ms', type=float, default=40, help='delay of every new connection')
+    parser.add_argument('--token-ms', type=float, default=150, help='delay of every token request')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSpotifyHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.counts = {}
+    server.handshake = args.handshake_ms / 1000
+    server.token_latency = args.token_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    print(f"{args.partitions} partitions in {args.processes} processes, {args.searches} searches each")
+    print(f"{'variant':<22}{'tokens':>8}{'connections':>13}{'partition ms':>14}{'first result ms':>17}{'seconds':>9}")
+    for name, shared in [('per-partition client', False), ('shared factory', True)]:
+        result = run_variant(base_url, server, shared, args.partitions, args.processes, args.searches)
+        print(f"{name:<22}{result['tokens']:>8}{result['connections']:>13}{result['partition_ms']:>14.0f}"
+              f"{result['first_ms']:>17.0f}{result['seconds']:>9.2f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Compare load strategies: one big executemany vs chunked commits vs staging table + set-based merge
+# Usage: python benchmarks/bench_load.py --rows 200000 --chunk-size 5000
+#        python benchmarks/bench_load.py --rows 200000 --mysql   (scratch MySQL 8.0.19+ from MYSQL_* env vars)
+#
+# Without --mysql the strategies run against an in-memory SQLite stand-in, which has no
+# LOAD DATA INFILE: the staging table there is filled with executemany instead.
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract import compact_tracks, extract_record_frame
+from transform import transform_dataset
+from load import TRACK_COLUMNS, track_tuples
+from fake_spotify import FakeSpotify
+
+SQLITE_SCHEMA = """
+CREATE TABLE {name} (
+    id TEXT PRIMARY KEY, track_name TEXT, artist_name TEXT, artist_count INT, release_date TEXT,
+    duration_min REAL, popularity INT, cover_image_url TEXT, album_type TEXT, album_id TEXT,
+    total_streams INT, danceability INT, tempo REAL, row_hash INT
+)
+"""
+
+
+def make_frame(rows):
+    """Transformed DataFrame of `rows` synthetic tracks"""
+    fake = FakeSpotify()
+    tracks = [fake.make_track(i) for i in range(rows)]
+    for track in tracks:
+        track['name'] = f"Bench {track['name']}"
+    return transform_dataset(extract_record_frame(compact_tracks(tracks)))
+
+
+def sqlite_connection():
+    connection = sqlite3.connect(':memory:')
+    connection.execute(SQLITE_SCHEMA.format(name='tracks'))
+    return connection
+
+
+def insert_sql(table):
+    return (f"INSERT INTO {table} ({', '.join(TRACK_COLUMNS)}) VALUES ({', '.join(['?'] * len(TRACK_COLUMNS))}) "
+            f"ON CONFLICT(id) DO NOTHING")
+
+
+def sqlite_executemany_single(df, chunk_size):
+    connection = sqlite_connection()
+    connection.executemany(insert_sql('tracks'), track_tuples(df))
+    connection.commit()
+    return connection
+
+
+def sqlite_executemany_chunked(df, chunk_size):
+    connection = sqlite_connection()
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        connection.executemany(insert_sql('tracks'), track_tuples(chunk))
+        connection.commit()
+    return connection
+
+
+def sqlite_staging_merge(df, chunk_size):
+    connection = sqlite_connection()
+    connection.execute(SQLITE_SCHEMA.format(name='temp.tracks_staging'))
+    columns = ', '.join(TRACK_COLUMNS)
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        connection.execute("DELETE FROM tracks_staging")
+        connection.executemany(insert_sql('tracks_staging'), track_tuples(chunk))
+        connection.execute(f"INSERT INTO tracks ({columns}) SELECT {columns} FROM tracks_staging WHERE true "
+                           f"ON CONFLICT(id) DO NOTHING")
+        connection.commit()
+    return connection
+
+
+def run_sqlite(df, chunk_size):
+    strategies = {
+        'executemany, single transaction': sqlite_executemany_single,
+        f'executemany, commit per {chunk_size}': sqlite_executemany_chunked,
+        f'staging + merge, commit per {chunk_size}': sqlite_staging_merge,
+    }
+    for name, strategy in strategies.items():
+        start = time.perf_counter()
+        connection = strategy(df, chunk_size)
+        elapsed = time.perf_counter() - start
+        count = connection.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        connection.close()
+        print(f"{name:<40} {elapsed:8.2f}s {len(df) / elapsed:12,.0f} rows/s ({count} rows)")
+
+
+def run_mysql(df, chunk_size):
+    from load import get_connection, load_dataset
+
+    def cleanup():
+        connection = get_connection()
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM tracks WHERE track_name LIKE 'Bench Track %'")
+        connection.commit()
+        connection.close()
+
+    runs = {
+        'executemany, single transaction': {'chunk_size': len(df), 'method': 'executemany'},
+        f'executemany, commit per {chunk_size}': {'chunk_size': chunk_size, 'method': 'executemany'},
+        f'LOAD DATA INFILE + merge, per {chunk_size}': {'chunk_size': chunk_size, 'method': 'infile'},
+    }
+    for name, kwargs in runs.items():
+        start = time.perf_counter()
+        success, loaded = load_dataset(df, **kwargs)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<40} {elapsed:8.2f}s {len(df) / elapsed:12,.0f} rows/s ({loaded} new rows, success={success})")
+        cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--mysql', action='store_true', help='run against MYSQL_HOST instead of SQLite (writes to spotify_db.tracks)')
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    print(f"\n{len(df)} rows, chunk size {args.chunk_size}")
+    if args.mysql:
+        run_mysql(df, args.chunk_size)
+    else:
+        run_sqlite(df, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
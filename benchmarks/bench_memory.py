@@ -0,0 +1,68 @@
+# Peak memory of the batch search + extract stage: raw track dicts vs compact TrackRecords
+# Usage: python benchmarks/bench_memory.py --tracks 10000 40000
+#
+# Each variant runs in a fresh process against the fake Spotify client. Pages are decoded
+# from full-size JSON like real responses, and every track comes back from two search terms.
+# Python allocations are traced with tracemalloc: 'held' is what the deduplicated search
+# result holds once the search is done, 'peak' is the highest point of the whole stage
+# including the DataFrame. The two DataFrames are checked to be identical.
+import argparse
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_spotify import FakeSpotify
+
+
+def run_variant(tracks, tracks_per_term, compact):
+    """Search and extract once, inside a fresh worker process"""
+    import pandas as pd
+    from extract import compact_tracks, extract_record_frame, get_tracks_from_search
+
+    # Terms overlap by half, so every track is found twice
+    step = tracks_per_term // 2
+    terms = [f'year:2023 genre:synthetic-{i}' for i in range(tracks // step)]
+    sp = FakeSpotify(year=2023, results_per_term=tracks_per_term, catalog_size=tracks, latency=0,
+                     term_offsets={term: i * step for i, term in enumerate(terms)}, full_payload=True)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        found = get_tracks_from_search(sp, year=2023, tracks_per_term=tracks_per_term, max_workers=8,
+                                       requests_per_second=100000, search_terms=terms, compact=compact)
+    held = tracemalloc.get_traced_memory()[0]
+    df = extract_record_frame(found if compact else compact_tracks(found))
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'rows': len(df), 'held_mb': held / 2 ** 20, 'peak_mb': peak / 2 ** 20, 'seconds': seconds,
+            'frame': pd.util.hash_pandas_object(df, index=False).sum()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, nargs='+', default=[10000, 40000], help='unique tracks in the catalog')
+    parser.add_argument('--tracks-per-term', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'tracks':>9}  {'variant':<16}{'held MB':>9}{'peak MB':>9}{'seconds':>9}")
+    for tracks in args.tracks:
+        results = {}
+        for name, compact in [('raw dicts', False), ('compact records', True)]:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results[name] = result = executor.submit(run_variant, tracks, args.tracks_per_term, compact).result()
+            print(f"{tracks:>9,}  {name:<16}{result['held_mb']:>9.0f}{result['peak_mb']:>9.0f}{result['seconds']:>9.2f}")
+
+        raw, compact = results['raw dicts'], results['compact records']
+        print(f"{'':>9}  peak {raw['peak_mb'] / compact['peak_mb']:.1f}x lower, held {raw['held_mb'] / compact['held_mb']:.1f}x lower, "
+              f"identical DataFrames: {raw['frame'] == compact['frame'] and raw['rows'] == compact['rows']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# End-to-end offline benchmark: create_spotify_dataset -> transform_dataset -> load_dataset
+# against a synthetic catalog served by the fake Spotify client, with per-stage
+# rows/sec, API latency and peak memory compared against a stored baseline.
+#
+# Usage: python benchmarks/bench_pipeline.py --tracks 200000 1000000
+#        python benchmarks/bench_pipeline.py --tracks 200000 --save-baseline
+#        python benchmarks/bench_pipeline.py --mysql   (scratch MySQL 8.0.19+ from MYSQL_* env vars)
+#
+# Each scale runs in a fresh process, so peak RSS is per scale. Without --mysql the load
+# stage runs the real load_dataset code against a SQLite database through a small
+# adapter that speaks the subset of the mysql.connector API load.py uses (executemany
+# method only, SQLite has no LOAD DATA INFILE). Every stage is compared on rows/sec, a stage
+# shorter than --min-seconds is flagged as too noisy, so compare at a catalog size where every
+# stage runs longer (the default 200k does). The exit code is 1 on a regression.
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import re
+import sqlite3
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_load import SQLITE_SCHEMA
+from fake_spotify import FakeSpotify
+
+CACHE_GENERATION_SCHEMA = "CREATE TABLE cache_generation (name TEXT PRIMARY KEY, generation INT NOT NULL)"
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+
+
+class SQLiteCursor:
+    """Runs load.py's MySQL statements on SQLite"""
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    @staticmethod
+    def translate(query):
+        # Any unique key, like MySQL (needs SQLite 3.35)
+        query = query.replace('%s', '?').replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET')
+        # VALUES (...) AS new ... tracks.column = new.column -> VALUES (...) ... column = excluded.column
+        query = re.sub(r'\)\s+AS new\b', ')', query)
+        return re.sub(r'(?:\w+\.)?(\w+) = new\.(\w+)', r'\1 = excluded.\2', query)
+
+    def execute(self, query, params=()):
+        self.cursor.execute(self.translate(query), params)
+
+    def executemany(self, query, rows):
+        self.cursor.executemany(self.translate(query), rows)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """Stands in for a pooled connection, every checkout shares one SQLite database"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return SQLiteCursor(self.connection)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        pass  # Back to the "pool"
+
+
+def synthetic_catalog(tracks, tracks_per_term, year, latency):
+    """Fake client whose search terms cover `tracks` catalog entries without overlapping"""
+    terms = [f'year:{year} genre:synthetic-{i}' for i in range(math.ceil(tracks / tracks_per_term))]
+    offsets = {term: i * tracks_per_term for i, term in enumerate(terms)}
+    fake = FakeSpotify(year=year, results_per_term=tracks_per_term, catalog_size=len(terms) * tracks_per_term,
+                       latency=latency, term_offsets=offsets)
+    return fake, terms
+
+
+def run_scale(tracks, tracks_per_term, workers, rps, latency, chunk_size, use_mysql):
+    """Run the pipeline once for one catalog size, inside a fresh worker process"""
+    import extract
+    import load
+    from transform import transform_dataset
+    from utils.metrics import recorder
+
+    year = 2023
+    fake, terms = synthetic_catalog(tracks, tracks_per_term, year, latency)
+    extract.setup_spotify_client = lambda *args, **kwargs: fake
+
+    tmp_dir = tempfile.mkdtemp()
+    if not use_mysql:
+        db = sqlite3.connect(os.path.join(tmp_dir, 'bench.sqlite'), check_same_thread=False)
+        db.execute(SQLITE_SCHEMA.format(name='tracks'))
+        db.execute("CREATE TABLE track_artists (track_id TEXT, artist_id TEXT, artist_position INT, "
+                   "PRIMARY KEY (track_id, artist_id))")
+        db.execute(CACHE_GENERATION_SCHEMA)
+        db.execute("INSERT INTO cache_generation (name, generation) VALUES ('tracks', 0)")
+        load.get_connection = lambda *args, **kwargs: SQLiteConnection(db)
+
+    recorder.reset()
+    # The pipeline prints a line per search term, keep the report readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        df = extract.create_spotify_dataset(None, None, year=year, tracks_per_term=tracks_per_term,
+                                            max_workers=workers, requests_per_second=rps, search_terms=terms)
+        df = transform_dataset(df)
+        success, loaded = load.load_dataset(df, chunk_size=chunk_size)
+
+    if use_mysql:
+        # Leave the scratch database as we found it
+        connection = load.get_connection()
+        cursor = connection.cursor()
+        ids = df['id'].tolist()
+        for start in range(0, len(ids), 5000):
+            batch = ids[start:start + 5000]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM track_artists WHERE track_id IN ({placeholders})", batch)
+            cursor.execute(f"DELETE FROM tracks WHERE id IN ({placeholders})", batch)
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    return {'tracks': len(df), 'loaded': loaded, 'success': success,
+            'api_calls': fake.calls, 'stages': recorder.to_records()}
+
+
+def compare(result, baseline, tolerance):
+    """Regressions of one scale against its baseline: slower rows/sec or higher peak RSS"""
+    regressions = []
+    baseline_stages = {stage['stage']: stage for stage in baseline['stages']}
+    for stage in result['stages']:
+        before = baseline_stages.get(stage['stage'])
+        if before is None:
+            continue
+        if stage['rows_per_second'] < before['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{stage['stage']} rows/sec {stage['rows_per_second']:,.0f} "
+                               f"vs baseline {before['rows_per_second']:,.0f}")
+        if before['peak_rss_mb'] and stage['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{stage['stage']} peak RSS {stage['peak_rss_mb']:.0f}MB "
+                               f"vs baseline {before['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def short_stages(result, min_seconds):
+    """Stages of a run too short for their rows/sec to be compared reliably"""
+    return [f"{stage['stage']} ({stage['wall_seconds']:.3f}s)" for stage in result['stages']
+            if stage['wall_seconds'] < min_seconds]
+
+
+def print_result(tracks, result, baseline):
+    print(f"\n{tracks:,} catalog tracks -> {result['tracks']:,} rows, {result['api_calls']:,} API calls, "
+          f"{result['loaded']:,} loaded (success={result['success']})")
+    print(f"{'stage':<12}{'seconds':>10}{'rows/s':>14}{'p95 API ms':>12}{'peak RSS MB':>13}{'vs baseline':>13}")
+    baseline_stages = {stage['stage']: stage for stage in baseline['stages']} if baseline else {}
+    for stage in result['stages']:
+        before = baseline_stages.get(stage['stage'])
+        change = ''
+        if before and before['rows_per_second']:
+            change = f"{stage['rows_per_second'] / before['rows_per_second'] - 1:+.0%}"
+        p95 = stage['api_latency_p95_ms']
+        print(f"{stage['stage']:<12}{stage['wall_seconds']:>10.2f}{stage['rows_per_second']:>14,.0f}"
+              f"{p95 if p95 is not None else '-':>12}{stage['peak_rss_mb'] or 0:>13.0f}{change:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, nargs='+', default=[200000],
+                        help='synthetic catalog sizes to run (10k-10M, memory grows with the size)')
+    parser.add_argument('--tracks-per-term', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rps', type=float, default=10000, help='rate limiter budget, high so the API stage measures our code')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per fake API call')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--mysql', action='store_true', help='load into MYSQL_HOST instead of SQLite (rows are deleted afterwards)')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown / memory growth before failing')
+    parser.add_argument('--min-seconds', type=float, default=0.2,
+                        help='flag stages shorter than this, their rows/sec is too noisy to compare')
+    args = parser.parse_args()
+
+    baseline = {'results': {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    too_short = []
+    for tracks in args.tracks:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_scale, tracks, args.tracks_per_term, args.workers, args.rps,
+                                     args.latency, args.chunk_size, args.mysql).result()
+        results[str(tracks)] = result
+        scale_baseline = baseline['results'].get(str(tracks))
+        print_result(tracks, result, scale_baseline)
+        too_short += [f"{tracks:,} tracks: {stage}" for stage in short_stages(result, args.min_seconds)]
+        if scale_baseline:
+            too_short += [f"{tracks:,} tracks: {stage} in the baseline"
+                          for stage in short_stages(scale_baseline, args.min_seconds)]
+            regressions += [f"{tracks:,} tracks: {r}" for r in compare(result, scale_baseline, args.tolerance)]
+
+    if too_short:
+        print(f"\nStages under {args.min_seconds}s, their rows/sec is noisy, use a larger --tracks:")
+        for stage in too_short:
+            print(f"  {stage}")
+
+    if args.save_baseline:
+        baseline['machine'] = {'python': platform.python_version(), 'platform': platform.platform(),
+                               'cpus': os.cpu_count()}
+        baseline['settings'] = {key: getattr(args, key) for key in
+                                ('tracks_per_term', 'workers', 'rps', 'latency', 'chunk_size', 'mysql')}
+        # Only the scales just measured, results of older code would go stale
+        baseline['results'] = results
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print("\nRegressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against baseline" if baseline['results'] else "\nNo baseline yet, run with --save-baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+# Fixed search terms vs the query planner against a fake catalog with real result counts
+# Usage: python benchmarks/bench_planner.py --catalog 50000 --max-terms 25 50 100 200
+#
+# The fake search filters one catalog by genre / tag / keyword like the real API, reports
+# the real `total` and refuses offsets past 1000, so the fixed terms can't reach most of it.
+# Searching every genre up front is the unplanned way to reach more of it.
+# Reported per run: API calls, unique tracks from the year, unique tracks per call and the
+# share of returned tracks that were duplicates of earlier terms.
+import argparse
+import contextlib
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract import GENRES, get_search_terms, iter_tracks_from_search
+from fake_spotify import FakeSpotifyCatalog
+from utils.query_planner import SPLIT_GENRES
+
+
+def run(catalog, year, tracks_per_term, workers, max_search_terms, search_terms=None):
+    sp = FakeSpotifyCatalog(year=year, catalog_size=catalog)
+    returned = [0]  # Tracks from the year in all search results, duplicates included
+    search = sp.search
+
+    def counting_search(*args, **kwargs):
+        results = search(*args, **kwargs)
+        returned[0] += sum(track['album']['release_date'].startswith(str(year)) for track in results['tracks']['items'])
+        return results
+
+    sp.search = counting_search
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pages = list(iter_tracks_from_search(sp, year=year, tracks_per_term=tracks_per_term, max_workers=workers,
+                                             requests_per_second=100000, max_search_terms=max_search_terms,
+                                             search_terms=search_terms))
+    seconds = time.perf_counter() - start
+    unique = sum(len(page) for page in pages)
+    return {'calls': sp.calls, 'unique': unique, 'seconds': seconds, 'duplicates': 1 - unique / max(returned[0], 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--catalog', type=int, default=50000, help='tracks in the fake catalog')
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--tracks-per-term', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--max-terms', type=int, nargs='+', default=[25, 50, 100, 200],
+                        help='planner budgets (terms probed) to compare')
+    args = parser.parse_args()
+
+    print(f"{'search':<22}{'API calls':>10}{'unique tracks':>15}{'per call':>10}{'duplicates':>12}{'seconds':>9}")
+    # Every genre the planner can split on, searched up front without planning
+    fan_out = get_search_terms(args.year) + [f'year:{args.year} genre:{genre}'
+                                             for genre in SPLIT_GENRES if genre not in GENRES]
+    runs = [('fixed terms', None, None), (f'{len(fan_out)} terms, no planner', None, fan_out)]
+    runs += [(f'planner, {max_terms} terms', max_terms, None) for max_terms in args.max_terms]
+    for name, max_terms, search_terms in runs:
+        result = run(args.catalog, args.year, args.tracks_per_term, args.workers, max_terms, search_terms)
+        print(f"{name:<22}{result['calls']:>10,}{result['unique']:>15,}"
+              f"{result['unique'] / result['calls']:>10.1f}{result['duplicates']:>12.0%}{result['seconds']:>9.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Dashboard queries on the tracks table before and after the schema migrations
+# Usage: python benchmarks/bench_queries.py --rows 500000   (scratch MySQL 8.0.19+ from MYSQL_* env vars)
+#
+# Builds the version 0 schema in a scratch database, fills it with synthetic tracks spread
+# over several release years, and times each query. Then runs migrations.migrate on the same
+# data (right-sized columns, secondary indexes, year partitions) and times them again. The
+# EXPLAIN row estimate and the partitions read are printed next to the timings. The scratch
+# database is dropped at the end unless --keep is given.
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import mysql.connector
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract import compact_tracks, extract_record_frame
+from transform import transform_dataset
+from load import TRACK_COLUMNS, TRACKS_TABLE_QUERY, ensure_dimension_tables, get_db_config, track_tuples
+from migrations import migrate
+from fake_spotify import FakeSpotify
+
+QUERIES = {
+    'one month, top 50': """
+        SELECT id, track_name, popularity FROM tracks
+        WHERE release_date BETWEEN '2022-03-01' AND '2022-03-31'
+        ORDER BY popularity DESC LIMIT 50
+    """,
+    'one year by album type': """
+        SELECT album_type, COUNT(*), AVG(popularity) FROM tracks
+        WHERE release_date >= '2021-01-01' AND release_date < '2022-01-01'
+        GROUP BY album_type
+    """,
+    'popularity >= 95': "SELECT COUNT(*) FROM tracks WHERE popularity >= 95",
+    'compilations, popular': "SELECT id, track_name FROM tracks WHERE album_type = 'compilation' AND popularity > 90",
+    'yearly totals': "SELECT YEAR(release_date), COUNT(*), SUM(total_streams) FROM tracks GROUP BY YEAR(release_date)",
+}
+
+
+def make_frame(rows, first_year, last_year):
+    """Transformed DataFrame of `rows` synthetic tracks spread evenly over the release years"""
+    years = list(range(first_year, last_year + 1))
+    per_year = -(-rows // len(years))
+    tracks = []
+    for i, year in enumerate(years):
+        fake = FakeSpotify(year=year)
+        tracks += [fake.make_track(index) for index in range(i * per_year, min((i + 1) * per_year, rows))]
+    return transform_dataset(extract_record_frame(compact_tracks(tracks)))
+
+
+# The version 0 table predates row_hash
+V0_COLUMNS = [column for column in TRACK_COLUMNS if column != 'row_hash']
+
+
+def fill(connection, cursor, df, chunk_size=10000):
+    query = f"INSERT INTO tracks ({', '.join(V0_COLUMNS)}) VALUES ({', '.join(['%s'] * len(V0_COLUMNS))})"
+    for start in range(0, len(df), chunk_size):
+        cursor.executemany(query, track_tuples(df.iloc[start:start + chunk_size], V0_COLUMNS))
+        connection.commit()
+    cursor.execute("ANALYZE TABLE tracks")
+    cursor.fetchall()
+
+
+def run_queries(cursor, repeat):
+    """Median milliseconds, EXPLAIN row estimate and partitions read of every query"""
+    results = {}
+    for name, query in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(query)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        cursor.execute(f"EXPLAIN {query}")
+        columns = [column[0] for column in cursor.description]
+        plan = dict(zip(columns, cursor.fetchone()))
+        cursor.fetchall()
+        partitions = plan.get('partitions')
+        results[name] = {
+            'ms': statistics.median(timings),
+            'rows': plan.get('rows'),
+            'key': plan.get('key'),
+            'partitions': len(partitions.split(',')) if partitions else '-',
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--first-year', type=int, default=2010)
+    parser.add_argument('--last-year', type=int, default=2024)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query, the median is reported')
+    parser.add_argument('--database', default='spotify_db_bench', help='scratch database, dropped and recreated')
+    parser.add_argument('--keep', action='store_true', help="don't drop the scratch database afterwards")
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.first_year, args.last_year)
+    config = get_db_config()
+    # EXPLAIN and ANALYZE produce notes that aren't worth failing over
+    config['raise_on_warnings'] = False
+    connection = mysql.connector.connect(**config)
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS {args.database}")
+        cursor.execute(f"CREATE DATABASE {args.database}")
+        cursor.execute(f"USE {args.database}")
+        cursor.execute(TRACKS_TABLE_QUERY)
+        ensure_dimension_tables(cursor)
+
+        start = time.perf_counter()
+        fill(connection, cursor, df)
+        print(f"{len(df):,} tracks loaded in {time.perf_counter() - start:.1f}s")
+        before = run_queries(cursor, args.repeat)
+
+        start = time.perf_counter()
+        version = migrate(connection, cursor)
+        cursor.execute("ANALYZE TABLE tracks")
+        cursor.fetchall()
+        print(f"Migrated to schema version {version} in {time.perf_counter() - start:.1f}s")
+        after = run_queries(cursor, args.repeat)
+    finally:
+        if not args.keep:
+            cursor.execute(f"DROP DATABASE IF EXISTS {args.database}")
+        cursor.close()
+        connection.close()
+
+    print(f"\n{'query':<26}{'before ms':>11}{'after ms':>10}{'speedup':>9}"
+          f"{'rows before':>13}{'rows after':>12}{'partitions':>12}  index after")
+    for name in QUERIES:
+        b, a = before[name], after[name]
+        speedup = b['ms'] / a['ms'] if a['ms'] else float('inf')
+        print(f"{name:<26}{b['ms']:>11.1f}{a['ms']:>10.1f}{speedup:>8.1f}x"
+              f"{b['rows'] or 0:>13,}{a['rows'] or 0:>12,}{a['partitions']:>12}  {a['key'] or '-'}")
+
+
+if __name__ == '__main__':
+    main()
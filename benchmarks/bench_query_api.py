@@ -0,0 +1,178 @@
+# Repeated dashboard reads through query_api.py, with and without the query cache
+# Usage: python benchmarks/bench_query_api.py --rows 200000 --reads 2000 --load-every 500
+#
+# The tracks, artists and track_artists tables are filled through load.py into a SQLite
+# stand-in (see bench_pipeline.py), and every statement waits --db-latency-ms like a round trip
+# to MySQL. The reads are a fixed random mix of top tracks, tracks by year and tracks by
+# artist (a few artists are asked for much more often than the rest). Every --load-every
+# reads, a small load changes the popularity of --load-rows tracks, which bumps the cache
+# generation. Reported per variant: reads/sec, mean and p95 read latency, statements run
+# against the database and the share of reads answered from the cache. Both variants must
+# return identical results.
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_load import SQLITE_SCHEMA
+from bench_pipeline import CACHE_GENERATION_SCHEMA, SQLiteConnection, SQLiteCursor
+from fake_spotify import FakeSpotify
+
+YEARS = [2019, 2020, 2021, 2022, 2023]
+
+
+class SlowCursor(SQLiteCursor):
+    """SQLite cursor that counts statements and waits a network round trip for each"""
+    statements = 0
+    latency = 0.0
+
+    def execute(self, query, params=()):
+        SlowCursor.statements += 1
+        time.sleep(SlowCursor.latency)
+        super().execute(query, params)
+
+    def executemany(self, query, rows):
+        SlowCursor.statements += 1
+        time.sleep(SlowCursor.latency)
+        super().executemany(query, rows)
+
+
+class SlowConnection(SQLiteConnection):
+    def cursor(self):
+        return SlowCursor(self.connection)
+
+
+def use_database(db):
+    """Point load.py and query_api.py at a SQLite database"""
+    import load
+    import query_api
+    load.get_connection = query_api.get_connection = lambda *args, **kwargs: SlowConnection(db)
+
+
+def setup_database(path, rows):
+    """Fill a SQLite database through load.py, returns the transformed frame"""
+    import load
+    from extract import compact_tracks, extract_record_frame
+    from transform import transform_dataset
+
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute(SQLITE_SCHEMA.format(name='tracks'))
+    db.execute("CREATE TABLE track_artists (track_id TEXT, artist_id TEXT, artist_position INT, "
+               "PRIMARY KEY (track_id, artist_id))")
+    db.execute("CREATE TABLE artists (artist_id TEXT PRIMARY KEY, name TEXT, popularity INT, followers INT, "
+               "genres TEXT, image_url TEXT)")
+    db.execute("CREATE INDEX idx_tracks_release_date ON tracks (release_date)")
+    db.execute("CREATE INDEX idx_tracks_popularity ON tracks (popularity)")
+    db.execute("CREATE INDEX idx_artists_name ON artists (name)")
+    db.execute("CREATE INDEX idx_track_artists_artist_id ON track_artists (artist_id, track_id)")
+    db.execute(CACHE_GENERATION_SCHEMA)
+    db.execute("INSERT INTO cache_generation (name, generation) VALUES ('tracks', 0)")
+    use_database(db)
+
+    per_year = -(-rows // len(YEARS))
+    tracks = []
+    for i, year in enumerate(YEARS):
+        fake = FakeSpotify(year=year)
+        tracks += [fake.make_track(index) for index in range(i * per_year, min((i + 1) * per_year, rows))]
+    df = transform_dataset(extract_record_frame(compact_tracks(tracks)))
+    artists = {(artist['id'], artist['name'], None, None, None, None) for track in tracks[:5000]
+               for artist in track['artists']}
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        load.load_dataset(df, chunk_size=20000)
+    load.load_dimensions(sorted(artists), [])
+    return db, df
+
+
+def make_reads(count, seed=7):
+    """Fixed mix of dashboard reads: (function name, args)"""
+    rng = random.Random(seed)
+    reads = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.3:
+            reads.append(('top_tracks', (50,)))
+        elif kind < 0.7:
+            reads.append(('tracks_by_year', (rng.choice(YEARS), 100)))
+        else:
+            # Zipf-like: a handful of artists get most of the lookups
+            reads.append(('tracks_by_artist', (f'Artist {int(rng.paretovariate(1.2)) % 500}', 100)))
+    return reads
+
+
+def run_variant(reads, df, load_every, load_rows, cached):
+    import load
+    import query_api
+
+    os.environ['QUERY_CACHE'] = 'memory' if cached else 'none'
+    query_api._cache = None
+    rng = random.Random(11)
+    statements = SlowCursor.statements
+    latencies = []
+    digest = hashlib.sha1()
+    start = time.perf_counter()
+    for i, (name, args) in enumerate(reads):
+        if load_every and i and i % load_every == 0:
+            # A small load: changed popularity means a new row_hash, so the rows are written
+            changed = df.iloc[rng.sample(range(len(df)), load_rows)].copy()
+            changed['popularity'] = (changed['popularity'] + 1) % 101
+            changed['row_hash'] = changed['row_hash'] + 1
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                load.load_dataset(changed, chunk_size=load_rows)
+            df.loc[changed.index, ['popularity', 'row_hash']] = changed[['popularity', 'row_hash']]
+        read_start = time.perf_counter()
+        rows = getattr(query_api, name)(*args)
+        latencies.append(time.perf_counter() - read_start)
+        digest.update(json.dumps(rows).encode())
+    seconds = time.perf_counter() - start
+
+    cache = query_api.get_query_cache()
+    return {'reads_per_s': len(reads) / seconds, 'mean_ms': statistics.mean(latencies) * 1000,
+            'p95_ms': statistics.quantiles(latencies, n=20)[-1] * 1000,
+            'statements': SlowCursor.statements - statements,
+            'hit_rate': cache.stats()['hits'] / len(reads) if cache else 0.0, 'digest': digest.hexdigest()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--load-every', type=int, default=500, help='reads between two small loads (0 = none)')
+    parser.add_argument('--load-rows', type=int, default=100, help='tracks changed by each small load')
+    parser.add_argument('--db-latency-ms', type=float, default=0.5, help='added to every database statement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db, df = setup_database(os.path.join(tmp_dir, 'bench.sqlite'), args.rows)
+        SlowCursor.latency = args.db_latency_ms / 1000
+        reads = make_reads(args.reads)
+        print(f"{len(df):,} tracks, {args.reads:,} reads, a load of {args.load_rows} changed tracks "
+              f"every {args.load_every} reads")
+        print(f"{'variant':<12}{'reads/s':>10}{'mean ms':>9}{'p95 ms':>8}{'DB statements':>15}{'cache hits':>12}")
+
+        results = {}
+        for name, cached in [('no cache', False), ('LRU cache', True)]:
+            # Both variants start from the same data, and their loads change it the same way
+            variant_db = sqlite3.connect(':memory:', check_same_thread=False)
+            db.backup(variant_db)
+            use_database(variant_db)
+            results[name] = result = run_variant(reads, df.copy(), args.load_every, args.load_rows, cached)
+            variant_db.close()
+            print(f"{name:<12}{result['reads_per_s']:>10,.0f}{result['mean_ms']:>9.2f}{result['p95_ms']:>8.2f}"
+                  f"{result['statements']:>15,}{result['hit_rate']:>12.0%}")
+        db.close()
+    print(f"identical results: {results['no cache']['digest'] == results['LRU cache']['digest']}")
+
+
+if __name__ == '__main__':
+    main()
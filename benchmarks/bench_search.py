@@ -0,0 +1,45 @@
+# Compare sequential and concurrent search against the fake Spotify client
+# Usage: python benchmarks/bench_search.py --tracks-per-term 500 --workers 8
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract import get_tracks_from_search, get_tracks_from_search_concurrent
+from fake_spotify import FakeSpotify
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--tracks-per-term', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rps', type=float, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--rate-limit', type=int, default=None, help='calls/sec before the fake API returns 429')
+    args = parser.parse_args()
+
+    sp = FakeSpotify(year=args.year, latency=args.latency)
+    start = time.perf_counter()
+    sequential = get_tracks_from_search(sp, year=args.year, tracks_per_term=args.tracks_per_term)
+    sequential_time = time.perf_counter() - start
+
+    sp = FakeSpotify(year=args.year, latency=args.latency, rate_limit=args.rate_limit)
+    start = time.perf_counter()
+    concurrent = get_tracks_from_search_concurrent(sp, year=args.year, tracks_per_term=args.tracks_per_term,
+                                                   max_workers=args.workers, requests_per_second=args.rps)
+    concurrent_time = time.perf_counter() - start
+
+    same = [t['id'] for t in sequential] == [t['id'] for t in concurrent]
+    print()
+    print(f"sequential: {len(sequential)} tracks in {sequential_time:.2f}s")
+    print(f"concurrent: {len(concurrent)} tracks in {concurrent_time:.2f}s "
+          f"({sp.calls} calls, {sp.rate_limited} rate limited)")
+    print(f"speedup: {sequential_time / concurrent_time:.1f}x, identical results: {same}")
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
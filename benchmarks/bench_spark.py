@@ -0,0 +1,67 @@
+# Compare the pandas and Spark (local[*]) extract + transform paths at catalog scale
+# Usage: python benchmarks/bench_spark.py --rows 100000 1000000 10000000
+#
+# Needs pyspark and a Java runtime. Raw tracks are generated inside Spark for the Spark
+# path, and in chunks for the pandas path, so neither side holds 10M raw dicts at once.
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract import compact_tracks, extract_record_frame
+from transform import transform_dataset
+from fake_spotify import FakeSpotify
+from spark_backend import RAW_TRACK_SCHEMA, get_spark_session, flatten_raw_tracks, transform_dataset_spark
+
+
+def bench_pandas(rows, chunk_size=100000):
+    fake = FakeSpotify()
+    start = time.perf_counter()
+    total = 0
+    for offset in range(0, rows, chunk_size):
+        tracks = [fake.make_track(i) for i in range(offset, min(rows, offset + chunk_size))]
+        total += len(transform_dataset(extract_record_frame(compact_tracks(tracks))))
+    return total, time.perf_counter() - start
+
+
+def generate_tracks(indexes):
+    """Raw track JSON for a partition of indexes, runs on the executors"""
+    fake = FakeSpotify(latency=0)
+    for i in indexes:
+        yield json.dumps(fake.make_track(i))
+
+
+def bench_spark(spark, rows, partitions):
+    start = time.perf_counter()
+    raw = spark.sparkContext.range(rows, numSlices=partitions).mapPartitions(generate_tracks)
+    sdf = flatten_raw_tracks(spark.read.schema(RAW_TRACK_SCHEMA).json(raw))
+    total = transform_dataset_spark(sdf).count()
+    return total, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--partitions', type=int, default=None)
+    parser.add_argument('--skip-pandas-above', type=int, default=10000000)
+    args = parser.parse_args()
+
+    spark = get_spark_session(app_name='spotify_etl_bench')
+    spark.sparkContext.addPyFile(str(Path(__file__).resolve().parent / 'fake_spotify.py'))
+    partitions = args.partitions or spark.sparkContext.defaultParallelism
+
+    print(f"{'rows':>10} {'pandas rows/s':>15} {'spark rows/s':>15}")
+    for rows in args.rows:
+        pandas_rate = '-'
+        if rows <= args.skip_pandas_above:
+            total, elapsed = bench_pandas(rows)
+            pandas_rate = f"{total / elapsed:,.0f}"
+        total, elapsed = bench_spark(spark, rows, partitions)
+        print(f"{rows:>10,} {pandas_rate:>15} {total / elapsed:>15,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Startup cost of the entry points, measured with `python -X importtime`
+# Usage: python benchmarks/bench_startup.py --repeat 5
+#
+# Every case runs in a fresh interpreter inside a scratch directory holding a fresh
+# etl_state.json, so `cli.py run` takes the "nothing to do" path. Reported per case: the
+# median wall time of the process, the summed import time from -X importtime and the
+# heaviest top-level imports. 'eager imports' is what etl.py used to import up front.
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from etl import run_name, search_cache_settings
+
+CASES = {
+    'eager imports': ['-c', 'import extract, transform, load, staging, enrich, summaries'],
+    'import etl': ['-c', 'import etl'],
+    'cli.py --help': [str(REPO / 'cli.py'), '--help'],
+    'cli.py status': [str(REPO / 'cli.py'), 'status'],
+    'cli.py run (nothing to do)': [str(REPO / 'cli.py'), 'run'],
+}
+
+# import time:       self [us] |  cumulative | imported package
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_case(argv, cwd, env):
+    """Wall seconds, total import microseconds and top-level (module, cumulative us) of one run"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', *argv], cwd=cwd, env=env,
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        total += int(self_us)
+        if len(indent) == 1:
+            top_level.append((module, int(cumulative_us)))
+    return wall, total, top_level
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case, the median is reported')
+    parser.add_argument('--top', type=int, default=4, help='heaviest top-level imports to list per case')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=str(REPO), PYTHONDONTWRITEBYTECODE='1')
+    with tempfile.TemporaryDirectory() as cwd:
+        # A run that just succeeded, so the pre-check has nothing to do
+        with open(os.path.join(cwd, 'etl_state.json'), 'w', encoding='utf-8') as f:
+            json.dump({run_name(): {'started_at': time.time(), 'completed_at': time.time(),
+                                    'search_cache': search_cache_settings()[0],
+                                    'tracks_extracted': 0, 'tracks_loaded': 0, 'duration_seconds': 0}}, f)
+
+        # Warm the bytecode and OS file caches first
+        for argv in CASES.values():
+            run_case(argv, cwd, env)
+
+        print(f"{'case':<28}{'wall ms':>9}{'import ms':>11}  heaviest imports (cumulative ms)")
+        for name, argv in CASES.items():
+            runs = [run_case(argv, cwd, env) for _ in range(args.repeat)]
+            wall = statistics.median(run[0] for run in runs) * 1000
+            imports = statistics.median(run[1] for run in runs) / 1000
+            heaviest = sorted(runs[-1][2], key=lambda item: -item[1])[:args.top]
+            print(f"{name:<28}{wall:>9.0f}{imports:>11.0f}  "
+                  + ', '.join(f"{module} {us / 1000:.0f}" for module, us in heaviest))
+
+
+if __name__ == '__main__':
+    main()
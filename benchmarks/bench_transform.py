@@ -0,0 +1,96 @@
+# Time and memory of transform + building load rows: the old float64 frame vs TRACK_SCHEMA dtypes
+# Usage: python benchmarks/bench_transform.py --rows 1000000
+#
+# Each variant runs twice in a fresh process on the same extracted frame, once timed and once
+# with Python allocations traced by tracemalloc (which slows everything down). 'peak' is the
+# highest point above the extracted frame while transforming, 'frame' is the size of the
+# transformed frame. 'rows' is the time to turn the frame into the tuples executemany sends.
+# Everything is scaled to one million rows.
+# 'float64 frame' is the transform as it was before TRACK_SCHEMA, with whole-column
+# temporaries, and rows built with DataFrame.itertuples.
+import argparse
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_spotify import FakeSpotify
+
+
+def transform_float64(df):
+    """transform_dataset before TRACK_SCHEMA"""
+    import numpy as np
+    from transform import generate_synthetic_features, hash_rows
+
+    minutes = df['duration_ms'] // 60000
+    seconds = (df['duration_ms'] % 60000) / 1000
+    df['duration_ms'] = (minutes + (seconds / 100)).round(2)
+    df.rename(columns={'duration_ms': 'duration_min', 'artist(s)_name': 'artist_names'}, inplace=True)
+    features = generate_synthetic_features(df['id'].to_numpy(), df['popularity'].to_numpy(), dtype=np.float64)
+    for column, values in features.items():
+        df[column] = values
+    df['row_hash'] = hash_rows(df)
+    return df
+
+
+def itertuples_rows(df):
+    from load import FRAME_COLUMNS, TRACK_COLUMNS
+    return list(df[[FRAME_COLUMNS.get(column, column) for column in TRACK_COLUMNS]].itertuples(index=False, name=None))
+
+
+def run_variant(rows, distinct, schema, trace):
+    """Extract, then transform and build load rows once, inside a fresh worker process"""
+    from extract import compact_tracks, extract_record_frame
+    from load import track_tuples
+    from transform import transform_dataset
+
+    fake = FakeSpotify()
+    tracks = [fake.make_track(i) for i in range(min(distinct, rows))]
+    tracks = (tracks * (rows // len(tracks) + 1))[:rows]
+    df = extract_record_frame(compact_tracks(tracks))
+    del tracks
+
+    if trace:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        df = transform_dataset(df) if schema else transform_float64(df)
+        peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        return {'peak_mb': peak / 2 ** 20, 'frame_mb': df.memory_usage(deep=True).sum() / 2 ** 20}
+
+    start = time.perf_counter()
+    df = transform_dataset(df) if schema else transform_float64(df)
+    transform_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    data = track_tuples(df) if schema else itertuples_rows(df)
+    return {'transform_s': transform_seconds, 'rows_s': time.perf_counter() - start, 'first_row': data[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--distinct', type=int, default=20000,
+                        help='distinct raw tracks, repeated to reach --rows (keeps the input in memory)')
+    args = parser.parse_args()
+
+    scale = 1000000 / args.rows
+    print(f"{args.rows:,} rows, figures per million rows")
+    print(f"{'variant':<16}{'transform s':>13}{'peak MB':>9}{'frame MB':>10}{'rows s':>8}")
+    results = {}
+    for name, schema in [('float64 frame', False), ('TRACK_SCHEMA', True)]:
+        result = {}
+        for trace in (False, True):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result.update(executor.submit(run_variant, args.rows, args.distinct, schema, trace).result())
+        results[name] = result
+        print(f"{name:<16}{result['transform_s'] * scale:>13.2f}{result['peak_mb'] * scale:>9.0f}"
+              f"{result['frame_mb'] * scale:>10.0f}{result['rows_s'] * scale:>8.2f}")
+    print(f"first row, float64 frame: {results['float64 frame']['first_row']}")
+    print(f"first row, TRACK_SCHEMA:  {results['TRACK_SCHEMA']['first_row']}")
+
+
+if __name__ == '__main__':
+    main()
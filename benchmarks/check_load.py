@@ -0,0 +1,190 @@
+# Correctness check of write_tracks / diff_tracks: new, changed, moved and unchanged tracks
+# Usage: python benchmarks/check_load.py
+#        python benchmarks/check_load.py --mysql   (scratch MySQL 8.0.19+ from MYSQL_* env vars)
+#
+# Loads a small synthetic catalog, then a second version of it with changed popularities,
+# moved release dates and new tracks, then the second version again. After each load the
+# reported counts, the tracks, track_artists and track_popularity_history rows, the cache
+# generation and the release months handed to the summary refresh are compared with what
+# they must be. Every statement load.py sends is also
+# checked for MySQL syntax that warns (VALUES() in an upsert, INSERT IGNORE, IF NOT EXISTS),
+# since the pooled connections raise on warnings and the SQLite stand-in would hide that.
+# With --mysql the loads run on the real connection pool and the rows are deleted afterwards.
+# The exit code is 1 if anything is off.
+import argparse
+import contextlib
+import copy
+import os
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_load import SQLITE_SCHEMA
+from bench_pipeline import CACHE_GENERATION_SCHEMA, SQLiteConnection
+from fake_spotify import FakeSpotify
+
+# MySQL syntax that raises a warning (and so an exception with raise_on_warnings)
+WARNING_SQL = [re.compile(r'VALUES\s*\(\s*\w+\s*\)', re.I), re.compile(r'INSERT\s+IGNORE', re.I),
+               re.compile(r'IF\s+NOT\s+EXISTS', re.I)]
+
+
+class RecordingCursor:
+    """Passes every statement through, keeping its SQL text"""
+
+    def __init__(self, cursor, statements):
+        self.cursor = cursor
+        self.statements = statements
+
+    def execute(self, query, params=()):
+        self.statements.append(query)
+        return self.cursor.execute(query, params)
+
+    def executemany(self, query, rows):
+        self.statements.append(query)
+        return self.cursor.executemany(query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def make_versions(rows, changed, moved, new):
+    """Raw tracks of a first load, and a second version of them"""
+    fake = FakeSpotify()
+    first = [fake.make_track(i) for i in range(rows)]
+    second = copy.deepcopy(first) + [fake.make_track(i) for i in range(rows, rows + new)]
+    for track in second[:changed]:
+        track['popularity'] = (track['popularity'] + 1) % 101
+    for track in second[changed:changed + moved]:
+        track['album']['release_date'] = '2019-06-15'
+    return first, second
+
+
+def sqlite_database():
+    db = sqlite3.connect(':memory:', check_same_thread=False)
+    db.execute(SQLITE_SCHEMA.format(name='tracks'))
+    db.execute("CREATE TABLE track_artists (track_id TEXT, artist_id TEXT, artist_position INT, "
+               "PRIMARY KEY (track_id, artist_id))")
+    db.execute("CREATE TABLE track_popularity_history (track_id TEXT, observed_on TEXT, popularity INT, "
+               "PRIMARY KEY (track_id, observed_on))")
+    db.execute(CACHE_GENERATION_SCHEMA)
+    db.execute("INSERT INTO cache_generation (name, generation) VALUES ('tracks', 0)")
+    return db
+
+
+def fetch_state(cursor, ids):
+    """Rows of the checked tracks: {id: (release_date, popularity)}, artist links, history rows, generation"""
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"SELECT id, release_date, popularity FROM tracks WHERE id IN ({placeholders})", ids)
+    tracks = {}
+    for track_id, release_date, popularity in cursor.fetchall():
+        tracks.setdefault(track_id, []).append((str(release_date), popularity))
+    cursor.execute(f"SELECT COUNT(*) FROM track_artists WHERE track_id IN ({placeholders})", ids)
+    links = cursor.fetchone()[0]
+    cursor.execute(f"SELECT track_id, popularity FROM track_popularity_history WHERE track_id IN ({placeholders}) "
+                   f"AND observed_on = CURRENT_DATE", ids)
+    history = dict(cursor.fetchall())
+    cursor.execute("SELECT generation FROM cache_generation WHERE name = 'tracks'")
+    return tracks, links, history, cursor.fetchone()[0]
+
+
+def delete_tracks(connection, cursor, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    for table, column in [('track_popularity_history', 'track_id'), ('track_artists', 'track_id'), ('tracks', 'id')]:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50)
+    parser.add_argument('--changed', type=int, default=5, help='tracks whose popularity changes')
+    parser.add_argument('--moved', type=int, default=3, help='tracks whose release date changes')
+    parser.add_argument('--new', type=int, default=4, help='tracks only in the second load')
+    parser.add_argument('--chunk-size', type=int, default=20)
+    parser.add_argument('--mysql', action='store_true', help='load into MYSQL_HOST instead of SQLite')
+    args = parser.parse_args()
+
+    import load
+    from extract import compact_tracks, extract_record_frame
+    from transform import transform_dataset
+
+    if not args.mysql:
+        db = sqlite_database()
+        load.get_connection = lambda *a, **kwargs: SQLiteConnection(db)
+
+    first, second = make_versions(args.rows, args.changed, args.moved, args.new)
+    frames = [transform_dataset(extract_record_frame(compact_tracks(tracks))) for tracks in (first, second)]
+    ids = frames[1]['id'].tolist()
+    artist_links = sum(len(track['artists']) for track in second)
+    # Summary months of the second load: changed and new rows, and both months of a moved track
+    months = [frame.set_index('id')['release_date'].dt.strftime('%Y-%m') for frame in frames]
+    written = [*range(args.changed + args.moved), *range(args.rows, args.rows + args.new)]
+    changed_months = set(months[1][[ids[i] for i in written]]) | set(
+        months[0][ids[args.changed:args.changed + args.moved]])
+    # Only chunks with a new, changed or moved track write anything and bump the generation
+    written_chunks = len({i // args.chunk_size for i in written})
+
+    connection = load.get_connection()
+    statements = []
+    cursor = RecordingCursor(connection.cursor(), statements)
+    failures = []
+
+    def check(label, actual, expected):
+        status = 'ok' if actual == expected else 'FAILED'
+        print(f"{label:<44}{str(actual):>12}{str(expected):>12}  {status}")
+        if actual != expected:
+            failures.append(label)
+
+    try:
+        delete_tracks(connection, cursor, ids)
+        generation = fetch_state(cursor, ids)[3]
+        print(f"{'':<44}{'actual':>12}{'expected':>12}")
+        loads = [('first load', frames[0], (args.rows, args.rows, 0), set(months[0])),
+                 ('second load', frames[1], (len(ids), args.new, args.changed + args.moved), changed_months),
+                 ('second load again', frames[1], (len(ids), 0, 0), set())]
+        for name, df, expected, expected_months in loads:
+            written_months = set()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                counts = load.write_tracks(connection, cursor, df.copy(), chunk_size=args.chunk_size,
+                                           popularity_history=True, months=written_months)
+            tracks, links, history, current = fetch_state(cursor, ids)
+            check(f"{name}: attempted, inserted, updated", counts, expected)
+            check(f"{name}: summary months off", len(written_months ^ expected_months), 0)
+            check(f"{name}: tracks stored", sum(len(rows) for rows in tracks.values()), len(df))
+            check(f"{name}: history rows today", len(history), len(df))
+            if name == 'first load':
+                check(f"{name}: cache generation bumps", current - generation, -(-args.rows // args.chunk_size))
+            elif name == 'second load':
+                check(f"{name}: cache generation bumps", current - generation, written_chunks)
+                check(f"{name}: artist links", links, artist_links)
+                check(f"{name}: tracks with one row", sum(len(rows) == 1 for rows in tracks.values()), len(ids))
+                stored = frames[1].set_index('id')
+                check(f"{name}: release dates moved", sum(
+                    rows[0][0] == '2019-06-15' for rows in tracks.values()), args.moved)
+                check(f"{name}: popularities stored", sum(
+                    rows[0][1] == stored.at[track_id, 'popularity'] for track_id, rows in tracks.items()), len(ids))
+                check(f"{name}: history popularities", sum(
+                    history[track_id] == stored.at[track_id, 'popularity'] for track_id in ids), len(ids))
+            else:
+                check(f"{name}: cache generation bumps", current - generation, 0)
+            generation = current
+
+        warning_statements = {' '.join(query.split())[:60] for query in statements
+                              if any(pattern.search(query) for pattern in WARNING_SQL)}
+        check("statements with warning syntax", len(warning_statements), 0)
+        for query in sorted(warning_statements):
+            print(f"  {query}...")
+    finally:
+        delete_tracks(connection, cursor, ids)
+        cursor.close()
+        connection.close()
+
+    print("All checks passed" if not failures else f"{len(failures)} checks failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+# fake_spotify.py
+# Offline stand-in for spotipy.Spotify so the pipeline can be benchmarked without credentials
+import hashlib
+import json
+import threading
+import time
+
+from spotipy.exceptions import SpotifyException
+
+
+# Markets a track is available in, real responses list around 185 of them
+MARKETS = [f'{first}{second}' for first in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' for second in 'ADEGILMNORSTUZ'][:185]
+
+
+class FakeSpotify:
+    """
+    Mimics spotipy.Spotify.search with deterministic results
+
+    Every query has `results_per_term` tracks, drawn from a shared catalog of
+    `catalog_size` ids so different terms overlap like the real API does. Each call
+    sleeps for `latency` seconds, and if `rate_limit` is set any call beyond that
+    many per second gets a 429 with a Retry-After header. `term_offsets` pins a
+    term's starting point in the catalog, so terms can be laid out without overlap.
+    With `full_payload`, tracks carry every field the real search returns (both market
+    lists, urls, external ids, full album artists) and pages are decoded from JSON like
+    spotipy does, so their memory footprint matches real responses.
+    """
+
+    def __init__(self, year=2023, results_per_term=1000, catalog_size=3000, latency=0.05,
+                 rate_limit=None, retry_after=1, term_offsets=None, full_payload=False):
+        self.year = year
+        self.results_per_term = results_per_term
+        self.catalog_size = catalog_size
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.term_offsets = term_offsets or {}
+        self.full_payload = full_payload
+        self.calls = 0
+        self.rate_limited = 0
+        self._window = []
+        self._lock = threading.Lock()
+
+    def _check_rate_limit(self):
+        with self._lock:
+            self.calls += 1
+            if not self.rate_limit:
+                return
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                self.rate_limited += 1
+                raise SpotifyException(429, -1, 'API rate limit exceeded',
+                                       headers={'Retry-After': str(self.retry_after)})
+            self._window.append(now)
+
+    def make_track(self, index):
+        """Build one track dict shaped like a search result item"""
+        track_id = hashlib.md5(f'track-{index}'.encode()).hexdigest()[:22]
+        year = self.year if index % 7 else self.year - 1  # some results fall outside the year
+        release_date = [f'{year}-{index % 12 + 1:02d}-{index % 28 + 1:02d}', f'{year}-{index % 12 + 1:02d}', f'{year}'][index % 3]
+        images = [] if index % 11 == 0 else [
+            {'url': f'https://i.scdn.co/image/{track_id}640', 'height': 640, 'width': 640},
+            {'url': f'https://i.scdn.co/image/{track_id}300', 'height': 300, 'width': 300},
+        ]
+        artists = [
+            {'id': f'artist{(index + k) % 500:06d}', 'name': f'Artist {(index + k) % 500}', 'type': 'artist'}
+            for k in range(index % 3 + 1)
+        ]
+        return {
+            'id': track_id,
+            'name': f'Track {index}',
+            'artists': artists,
+            'duration_ms': 120000 + (index * 7919) % 240000,
+            'popularity': index % 101,
+            'explicit': bool(index % 2),
+            'available_markets': ['US', 'GB', 'DE', 'FR', 'SE', 'JP', 'BR', 'CA'],
+            'album': {
+                'id': f'album{index % 2000:06d}',
+                'name': f'Album {index % 2000}',
+                'album_type': ['album', 'single', 'compilation'][index % 3],
+                'release_date': release_date,
+                'images': images,
+                'artists': artists[:1],
+            },
+        }
+
+    def add_full_payload(self, track):
+        """Add the fields of a real search result track that the pipeline doesn't read"""
+        track_id = track['id']
+        album = track['album']
+        for item, kind in [(track, 'track'), (album, 'album')] + [(artist, 'artist') for artist in track['artists']]:
+            item['href'] = f'https://api.spotify.com/v1/{kind}s/{item["id"]}'
+            item['uri'] = f'spotify:{kind}:{item["id"]}'
+            item['external_urls'] = {'spotify': f'https://open.spotify.com/{kind}/{item["id"]}'}
+        track.update({'available_markets': MARKETS, 'disc_number': 1, 'track_number': int(track_id[:2], 16) % 15 + 1,
+                      'is_local': False, 'preview_url': f'https://p.scdn.co/mp3-preview/{track_id}',
+                      'external_ids': {'isrc': f'US{track_id[:10].upper()}'}, 'type': 'track'})
+        album.update({'available_markets': MARKETS, 'total_tracks': 12, 'release_date_precision': 'day',
+                      'type': 'album', 'artists': [dict(artist) for artist in track['artists']]})
+        album['images'] = album['images'] + [
+            {'url': f'https://i.scdn.co/image/{track_id}64', 'height': 64, 'width': 64}] if album['images'] else []
+        return track
+
+    def artists(self, artists):
+        """Batch artist lookup like spotipy's, at most 50 ids"""
+        self._check_rate_limit()
+        if self.latency:
+            time.sleep(self.latency)
+        return {'artists': [
+            {'id': artist_id, 'name': f'Artist {int(artist_id[6:])}', 'type': 'artist',
+             'popularity': int(artist_id[6:]) % 101, 'followers': {'total': int(artist_id[6:]) * 1000},
+             'genres': ['pop'], 'images': [{'url': f'https://i.scdn.co/image/{artist_id}'}]}
+            if artist_id.startswith('artist') else None
+            for artist_id in artists[:50]
+        ]}
+
+    def albums(self, albums, market=None):
+        """Batch album lookup like spotipy's, at most 20 ids"""
+        self._check_rate_limit()
+        if self.latency:
+            time.sleep(self.latency)
+        return {'albums': [
+            {'id': album_id, 'name': f'Album {int(album_id[5:])}', 'album_type': 'album',
+             'release_date': f'{self.year}-01', 'total_tracks': 12, 'label': 'Bench Records',
+             'popularity': int(album_id[5:]) % 101, 'images': []}
+            if album_id.startswith('album') else None
+            for album_id in albums[:20]
+        ]}
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        self._check_rate_limit()
+        if self.latency:
+            time.sleep(self.latency)
+
+        # Each term walks the catalog from its own starting point
+        start = self.term_offsets.get(q)
+        if start is None:
+            start = int(hashlib.md5(q.encode()).hexdigest(), 16) % self.catalog_size
+        end = min(offset + limit, self.results_per_term)
+        items = [self.make_track((start + i) % self.catalog_size) for i in range(offset, end)]
+        results = {'tracks': {'items': items, 'total': self.results_per_term,
+                              'limit': limit, 'offset': offset}}
+        if self.full_payload:
+            for track in items:
+                self.add_full_payload(track)
+            results = json.loads(json.dumps(results))
+        return results
+
+
+class FakeSpotifyCatalog(FakeSpotify):
+    """
+    FakeSpotify whose search filters one catalog like the real API, for the query planner
+
+    Every catalog track has one or two genres (or none of the split genres), a tag:hipster
+    (popularity under 10) or tag:new flag and a set of matching free-text keywords. A query
+    returns its matching tracks in catalog order with their real count as `total`, and
+    paging past offset + limit 1000 fails with a 400 like the real endpoint.
+    """
+
+    def __init__(self, year=2023, catalog_size=50000, latency=0.0, rate_limit=None, retry_after=1,
+                 genres=None, unlisted_genre_share=0.2):
+        super().__init__(year=year, catalog_size=catalog_size, latency=latency, rate_limit=rate_limit,
+                         retry_after=retry_after)
+        self.genres = genres or ['pop', 'hip-hop', 'rock', 'electronic', 'dance', 'r-n-b', 'latin', 'country',
+                                 'indie', 'alternative', 'metal', 'punk', 'jazz', 'soul', 'blues', 'folk',
+                                 'classical', 'house', 'k-pop', 'reggaeton']
+        self._track_genres = [self._genres_of(index, unlisted_genre_share) for index in range(catalog_size)]
+        self._matches = {}
+
+    @staticmethod
+    def _hash(*parts):
+        return int(hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()[:8], 16)
+
+    def _genres_of(self, index, unlisted_genre_share):
+        if self._hash(index, 'unlisted') % 100 < unlisted_genre_share * 100:
+            return set()
+        return {self.genres[self._hash(index, 'genre') % len(self.genres)],
+                self.genres[self._hash(index, 'genre2') % len(self.genres)]}
+
+    def _track_matches(self, index, filters, keywords):
+        for name, value in filters:
+            if name == 'genre' and value not in self._track_genres[index]:
+                return False
+            if name == 'tag' and value == 'hipster' and index % 101 >= 10:
+                return False
+            if name == 'tag' and value == 'new' and index % 20:
+                return False
+        return all(self._hash(index, keyword) % 4 == 0 for keyword in keywords)
+
+    def _matching(self, q):
+        """Catalog indexes matching a query, computed once per query"""
+        with self._lock:
+            matches = self._matches.get(q)
+        if matches is None:
+            tokens = q.split()
+            filters = [tuple(token.split(':', 1)) for token in tokens if ':' in token and not token.startswith('year:')]
+            keywords = [token for token in tokens if ':' not in token]
+            matches = [index for index in range(self.catalog_size) if self._track_matches(index, filters, keywords)]
+            with self._lock:
+                self._matches[q] = matches
+        return matches
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        self._check_rate_limit()
+        if self.latency:
+            time.sleep(self.latency)
+        if offset + limit > 1000:
+            raise SpotifyException(400, -1, 'Invalid limit/offset: maximum offset (including limit) is 1000')
+
+        matches = self._matching(q)
+        items = [self.make_track(index) for index in matches[offset:offset + limit]]
+        return {'tracks': {'items': items, 'total': len(matches), 'limit': limit, 'offset': offset}}
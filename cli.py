@@ -0,0 +1,130 @@
+# Command line entry point for the ETL
+#
+# Usage:
+#   python cli.py run [--force]          run etl.py, unless the pre-check finds nothing to do
+#   python cli.py backfill --start-year 2014 --end-year 2023 [backfill.py options]
+#   python cli.py status [--db]          last runs, pending checkpoints and backfill progress
+#   python cli.py sample [--rows 10]     a few loaded tracks from the database (load.query_sample_data)
+#
+# Only the subcommand that does the work imports pandas, spotipy and mysql.connector, so
+# `status` and a cron-triggered `run` with nothing to do exit before paying for them.
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import etl
+from utils.state_file import load_state
+
+def cmd_run(args):
+    if not args.force:
+        should_run, reason = etl.pending_work()
+        if not should_run:
+            print(f"Nothing to do: {reason} (use --force to run anyway)")
+            return 0
+        print(f"Running: {reason}")
+    return 0 if etl.main() else 1
+
+def cmd_backfill(args):
+    from backfill import main as backfill_main
+    return backfill_main(args.backfill_args)
+
+def checkpoint_pages(path):
+    """Number of search pages journaled by a checkpoint"""
+    manifest_path = os.path.join(path, 'manifest.jsonl')
+    if not os.path.exists(manifest_path):
+        return 0
+    with open(manifest_path, encoding='utf-8') as f:
+        return sum(1 for line in f if '"page"' in line)
+
+def print_db_status():
+    # The only part of status that needs mysql.connector
+    from load import get_connection
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        print(f"\nSchema version {cursor.fetchone()[0]}")
+        cursor.execute("""
+            SELECT run_timestamp, status, tracks_extracted, tracks_loaded, duration_seconds
+            FROM etl_log ORDER BY log_id DESC LIMIT 5
+        """)
+        print("Latest etl_log entries:")
+        for run_timestamp, status, extracted, loaded, duration in cursor.fetchall():
+            print(f"  {run_timestamp}  {status:<8}{extracted or 0:>8} extracted{loaded or 0:>8} loaded"
+                  f"{duration or 0:>9.1f}s")
+    finally:
+        cursor.close()
+        connection.close()
+
+def cmd_status(args):
+    name = etl.run_name()
+    should_run, reason = etl.pending_work()
+    print(f"Run {name} ({etl.BACKEND} backend): {'pending' if should_run else 'up to date'}, {reason}")
+
+    runs = load_state(etl.RUN_STATE_FILE)
+    if runs:
+        print("\nLast successful runs:")
+        for run, info in sorted(runs.items()):
+            completed_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['completed_at']))
+            print(f"  {run:<20}{completed_at}  {info['tracks_loaded']} loaded of {info['tracks_extracted']} extracted"
+                  f" in {info['duration_seconds']:.1f}s")
+
+    checkpoints = sorted(path for path in Path('checkpoints').glob('*') if path.is_dir())
+    print(f"\nCheckpoints waiting to be resumed: {len(checkpoints) or 'none'}")
+    for path in checkpoints:
+        print(f"  {path.name:<32}{checkpoint_pages(path)} pages journaled")
+
+    if os.path.exists(args.backfill_state):
+        completed = load_state(args.backfill_state).get('completed', {})
+        loaded = sum(partition['tracks_loaded'] for partition in completed.values())
+        last = max((partition['completed_at'] for partition in completed.values()), default='-')
+        print(f"\nBackfill: {len(completed)} partitions completed, {loaded} tracks loaded, last at {last}")
+
+    if args.db:
+        print_db_status()
+    return 0
+
+def cmd_sample(args):
+    from load import query_sample_data
+
+    query_sample_data(args.rows)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spotify ETL")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    run = subcommands.add_parser('run', help="Run the ETL if there is anything to do")
+    run.add_argument('--force', action='store_true', help="Skip the pre-check and always run")
+    run.set_defaults(func=cmd_run)
+
+    backfill = subcommands.add_parser('backfill', help="Backfill a range of years (options as for backfill.py)",
+                                      add_help=False)
+    backfill.set_defaults(func=cmd_backfill)
+
+    status = subcommands.add_parser('status', help="Show the last runs, checkpoints and backfill progress")
+    status.add_argument('--db', action='store_true', help="Also show the schema version and the etl_log")
+    status.add_argument('--backfill-state', default='backfill_state.json')
+    status.set_defaults(func=cmd_status)
+
+    sample = subcommands.add_parser('sample', help="Show a few tracks from the database")
+    sample.add_argument('--rows', type=int, default=10)
+    sample.set_defaults(func=cmd_sample)
+
+    # Everything after `backfill` goes to backfill.py's own parser
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'backfill':
+        args.backfill_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    load_dotenv(dotenv_path=Path('.') / '.env')
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,143 @@
+# Enrichment phase - artist and album dimension tables
+#
+# Loaded tracks reference their artists (track_artists) and album (tracks.album_id) by id.
+# This fills the artists and albums tables for ids that aren't there yet, using Spotify's
+# batch endpoints. An in-process LRU cache makes sure each id is fetched at most once
+# per process, across runs and backfill partitions. Ids Spotify doesn't know get a row
+# with only the id, so later runs don't ask for them again.
+
+from extract import call_with_limiter, normalize_release_date, setup_spotify_client
+from load import fetch_missing_dimension_ids, load_dimensions
+from utils.lru_cache import LRUCache
+from utils.metrics import recorder
+from utils.rate_limiter import TokenBucket
+
+# Maximum ids per call of the batch endpoints
+ARTIST_BATCH_SIZE = 50
+ALBUM_BATCH_SIZE = 20
+
+_artist_cache = LRUCache(max_entries=100000)
+_album_cache = LRUCache(max_entries=50000)
+
+def fetch_batched(fetch, ids, batch_size, cache, limiter, description, logger=None):
+    """
+    Look up objects by id through `cache`, fetching the misses `batch_size` ids per call
+
+    Args:
+        fetch: Function taking a list of ids and returning the list of objects
+        ids: Ids to look up
+        batch_size: Maximum ids per API call
+        cache: LRUCache of objects by id
+        limiter: TokenBucket shared by the calls
+        description: Name used in rate limit warnings
+
+    Returns:
+        Dictionary of id -> object, ids Spotify doesn't know are left out
+    """
+    found = {}
+    missing = []
+    for object_id in dict.fromkeys(ids):  # Dedupe, keeping order
+        cached = cache.get(object_id)
+        if cached is None:
+            missing.append(object_id)
+        else:
+            found[object_id] = cached
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        items = call_with_limiter(limiter, lambda: fetch(batch), f"{description} batch {start // batch_size + 1}",
+                                  logger=logger)
+        for item in items:
+            if item:  # Unknown ids come back as None
+                cache.set(item['id'], item)
+                found[item['id']] = item
+
+    return found
+
+def fetch_artists(sp, artist_ids, limiter, logger=None):
+    """Full artist objects for `artist_ids`, 50 per call"""
+    return fetch_batched(lambda batch: sp.artists(batch)['artists'], artist_ids, ARTIST_BATCH_SIZE,
+                         _artist_cache, limiter, 'artists', logger=logger)
+
+def fetch_albums(sp, album_ids, limiter, logger=None):
+    """Full album objects for `album_ids`, 20 per call"""
+    return fetch_batched(lambda batch: sp.albums(batch)['albums'], album_ids, ALBUM_BATCH_SIZE,
+                         _album_cache, limiter, 'albums', logger=logger)
+
+def first_image_url(item):
+    images = item.get('images') or []
+    return images[0]['url'] if images else None
+
+def artist_row(artist):
+    """Row of the artists table, fields Spotify no longer returns for every app are left NULL"""
+    followers = artist.get('followers') or {}
+    genres = artist.get('genres')
+    return (
+        artist['id'],
+        artist['name'],
+        artist.get('popularity'),
+        followers.get('total'),
+        ', '.join(genres) if genres is not None else None,
+        first_image_url(artist)
+    )
+
+def album_row(album):
+    """Row of the albums table"""
+    release_date = album.get('release_date')
+    return (
+        album['id'],
+        album['name'],
+        album.get('album_type'),
+        normalize_release_date(release_date) if release_date else None,
+        album.get('total_tracks'),
+        album.get('label'),
+        album.get('popularity'),
+        first_image_url(album)
+    )
+
+def unknown_row(object_id, width):
+    """Row of an id Spotify doesn't know, every other column NULL"""
+    return (object_id,) + (None,) * (width - 1)
+
+@recorder.timed('enrich', count_rows=False)
+def enrich_dimensions(client_id, client_secret, logger=None, requests_per_second=10):
+    """
+    Fetch and load the artists and albums referenced by loaded tracks but missing from
+    the dimension tables
+
+    Returns:
+        Tuple of (artists loaded, albums loaded)
+    """
+    print("=== Enriching artists and albums ===")
+    if logger:
+        logger.info("=== Enriching artists and albums ===")
+
+    artist_ids, album_ids = fetch_missing_dimension_ids(logger)
+    print(f"Missing: {len(artist_ids)} artists, {len(album_ids)} albums")
+    if logger:
+        logger.info(f"Missing: {len(artist_ids)} artists, {len(album_ids)} albums")
+    if not artist_ids and not album_ids:
+        return 0, 0
+
+    sp = setup_spotify_client(client_id, client_secret, retry_rate_limits=False)
+    limiter = TokenBucket(rate=requests_per_second)
+
+    artists = fetch_artists(sp, artist_ids, limiter, logger=logger)
+    albums = fetch_albums(sp, album_ids, limiter, logger=logger)
+
+    artist_rows = [artist_row(artist) for artist in artists.values()]
+    album_rows = [album_row(album) for album in albums.values()]
+    recorder.add_rows(len(artist_rows) + len(album_rows))
+    # Unknown ids are recorded too, or they would be missing and fetched again on every run
+    unknown_artists = [unknown_row(artist_id, 6) for artist_id in dict.fromkeys(artist_ids) if artist_id not in artists]
+    unknown_albums = [unknown_row(album_id, 8) for album_id in dict.fromkeys(album_ids) if album_id not in albums]
+    load_dimensions(artist_rows + unknown_artists, album_rows + unknown_albums, logger=logger)
+
+    print(f"✓ Loaded {len(artist_rows)} artists and {len(album_rows)} albums")
+    if logger:
+        logger.info(f"Loaded {len(artist_rows)} artists and {len(album_rows)} albums")
+    if unknown_artists or unknown_albums:
+        print(f"✓ Recorded {len(unknown_artists)} artists and {len(unknown_albums)} albums Spotify doesn't know")
+        if logger:
+            logger.info(f"Recorded {len(unknown_artists)} artists and {len(unknown_albums)} albums Spotify doesn't know")
+    return len(artist_rows), len(album_rows)
@@ -5,13 +5,251 @@ from dotenv import load_dotenv
 from pathlib import Path
 import time
 
-from extract import create_spotify_dataset
-from transform import transform_dataset
-from load import load_dataset, log_etl_run
+# extract, transform, load and friends pull in pandas, spotipy and mysql.connector, so they are
+# imported by the functions that use them. `python cli.py status` and a run with nothing to do
+# never pay for them.
+from utils.checkpoint import open_checkpoint
 from utils.logger_config import setup_logger
+from utils.metrics import recorder
+from utils.search_cache import create_search_cache
+from utils.state_file import load_state, save_state
+
+# Configuration
+YEAR = 2023  # Change this to extract from different years
+TRACKS_PER_TERM = 300  # Number of tracks to get from each search term
+MAX_SEARCH_TERMS = None  # Search planner: terms probed per run, terms paged up to the 1000 offset cap are split (None = fixed terms)
+MAX_WORKERS = 4  # Parallel search requests (1 = sequential)
+REQUESTS_PER_SECOND = 10  # Starting rate for the adaptive rate limiter
+STREAMING = True  # Extract, transform and load chunk by chunk to keep memory flat
+CHUNK_SIZE = 500  # Rows per chunk in streaming mode
+LOADER_THREADS = 2  # Streaming mode: threads loading chunks while the next ones are extracted (0 = inline)
+LOAD_QUEUE_SIZE = 4  # Chunks allowed to wait for a loader before extraction is paused
+INCREMENTAL = False  # Skip tracks already in the database up front (faster, but their changes go unseen)
+POPULARITY_HISTORY = True  # Append new / changed popularity values to track_popularity_history
+LOAD_METHOD = 'executemany'  # or 'infile' for LOAD DATA LOCAL INFILE (server needs local_infile=ON)
+LOAD_CHUNK_SIZE = 5000  # Rows per load transaction
+BACKEND = 'pandas'  # or 'spark' to transform and load with PySpark (local[*]) for catalog-scale runs
+CHECKPOINT = True  # Journal fetched pages and loaded chunks so a failed run resumes where it stopped
+ENRICH = True  # Fill the artists / albums tables for newly referenced ids after the load
+SUMMARIES = True  # Refresh the dashboard summary tables for the release months the load changed
+RUN_STATE_FILE = 'etl_state.json'  # Last successful run of each configuration, for the pre-check
+MIN_RUN_INTERVAL = 6 * 3600  # Pre-check: seconds from a successful run's start until the next one, at most SEARCH_CACHE_TTL
+
+def run_name(year=None, tracks_per_term=None):
+    """Name of a run configuration, shared by its checkpoint and its run state entry"""
+    return f"run-{year or YEAR}-{tracks_per_term or TRACKS_PER_TERM}"
+
+def search_cache_settings():
+    """Search cache backend and TTL from the environment"""
+    return os.getenv('SEARCH_CACHE', 'sqlite'), int(os.getenv('SEARCH_CACHE_TTL', 86400))
+
+def record_run(name, etl_run_data, started_at, state_file=RUN_STATE_FILE):
+    """Remember a successful run, so the pre-check can tell when the next one has nothing to do"""
+    state = load_state(state_file)
+    state[name] = {
+        'started_at': started_at,
+        'completed_at': time.time(),
+        'search_cache': search_cache_settings()[0],
+        'tracks_extracted': etl_run_data['tracks_extracted'],
+        'tracks_loaded': etl_run_data['tracks_loaded'],
+        'duration_seconds': round(etl_run_data['duration_seconds'], 2)
+    }
+    save_state(state_file, state)
+
+def pending_work(name=None, state_file=RUN_STATE_FILE, checkpoint_dir='checkpoints', now=None):
+    """
+    Cheap check for whether a run could change anything, without the API or the database
+
+    A run has nothing to do when its last success started less than MIN_RUN_INTERVAL ago.
+    The interval is capped at the search cache TTL, and pages cached by that run are at
+    most this old, so every search would be answered from the cache and the loader skips
+    rows whose hash didn't change. An unfinished checkpoint or a disabled cache always
+    means work.
+
+    Returns:
+        Tuple of (True if the run should go ahead, reason)
+    """
+    name = name or run_name()
+    if os.path.isdir(os.path.join(checkpoint_dir, name)):
+        return True, f"checkpoint '{name}' is waiting to be resumed"
+
+    backend, ttl = search_cache_settings()
+    if backend == 'none':
+        return True, "the search cache is disabled"
+
+    last_run = load_state(state_file).get(name)
+    if last_run is None:
+        return True, f"no successful {name} yet"
+    if last_run.get('search_cache') != backend:
+        return True, f"the last run used the {last_run.get('search_cache')} search cache"
+
+    if 'started_at' not in last_run:
+        return True, "the last run didn't record its start time"
+
+    # Measured from the start, the first pages of a long run were cached that much earlier
+    interval = min(MIN_RUN_INTERVAL, ttl)
+    age = (now or time.time()) - last_run['started_at']
+    if age >= interval:
+        return True, f"the last run started {age / 3600:.1f}h ago"
+    return False, (f"the last run started {age / 60:.0f} min ago, the next one is due in "
+                   f"{(interval - age) / 60:.0f} min")
+
+def save_staging(df, year, checkpoint, logger):
+    """Append to the staging dataset, unless an earlier attempt of this run already did"""
+    from staging import write_staging
+    
+    if checkpoint is not None:
+        chunk_key = checkpoint.chunk_key(df)
+        if checkpoint.is_chunk_done('staging', chunk_key):
+            return None
+    
+    partition_dir = write_staging(df, year, logger=logger)
+    if checkpoint is not None:
+        checkpoint.mark_chunk_done('staging', chunk_key)
+    return partition_dir
+
+def transform_chunks(chunks, etl_run_data, year, checkpoint, logger):
+    """Transform each extracted chunk, append it to the staging dataset and pass it on to load"""
+    from transform import transform_dataset
+    
+    for df in chunks:
+        etl_run_data['tracks_extracted'] += len(df)
+        etl_run_data['extract_status'] = 'success'
+        
+        df = transform_dataset(df)
+        etl_run_data['transform_status'] = 'success'
+        
+        save_staging(df, year, checkpoint, logger)
+        yield df
+
+def nothing_new(extract_stats, etl_run_data, logger):
+    """True if the search found tracks but all of them were already loaded"""
+    if etl_run_data['tracks_extracted'] or not extract_stats.get('tracks_skipped'):
+        return False
+    
+    print(f"✓ No new tracks: all {extract_stats['tracks_skipped']} tracks found are already loaded")
+    logger.info(f"No new tracks: all {extract_stats['tracks_skipped']} tracks found are already loaded")
+    etl_run_data['extract_status'] = 'success'
+    etl_run_data['transform_status'] = 'success'
+    return True
+
+def run_batch(client_id, client_secret, extract_kwargs, load_kwargs, etl_run_data, logger):
+    """Extract everything, then transform, save and load it in one go"""
+    from extract import create_spotify_dataset
+    from transform import transform_dataset
+    from load import load_dataset
+    
+    extract_stats = extract_kwargs['stats']
+    
+    # EXTRACT
+    # Create dataset
+    df = create_spotify_dataset(client_id, client_secret, **extract_kwargs)
+    
+    etl_run_data['tracks_extracted'] = len(df)
+    etl_run_data['extract_status'] = 'success' if not df.empty else 'failure'
+    
+    if nothing_new(extract_stats, etl_run_data, logger):
+        return True, 0
+
+    # TRANSFROM
+    # Carry out transformations
+    df = transform_dataset(df)
+    
+    etl_run_data['transform_status'] = 'success'
+
+    # Display results
+    if not df.empty:
+        print("\nFirst 5 rows of the dataset:")
+        print(df.head())
+        
+        print(f"\nDataset shape: {df.shape}")
+        logger.info(f"Dataset created with {len(df)} tracks")
+        
+        # Append to the Parquet staging dataset, partitioned by year
+        partition_dir = save_staging(df, extract_kwargs['year'], extract_kwargs['checkpoint'], logger)
+        if partition_dir:
+            print(f"\nDataset staged to '{partition_dir}'")
+        
+    else:
+        print("Failed to create dataset")
+        logger.error("Failed to create dataset")
+
+    # LOAD
+    return load_dataset(df, logger=logger, months=etl_run_data['release_months'], **load_kwargs)
+
+def run_streaming(client_id, client_secret, extract_kwargs, load_kwargs, etl_run_data, logger,
+                  num_loaders=2, queue_size=4):
+    """
+    Extract, transform and load chunk by chunk
+
+    With num_loaders > 0 this thread extracts and transforms while loader threads
+    write the previous chunks, otherwise each chunk is loaded before the next is
+    extracted.
+    """
+    from extract import iter_spotify_dataset
+    from load import load_dataset_stream, load_dataset_concurrent
+    
+    extract_stats = extract_kwargs['stats']
+    
+    chunks = recorder.iter_stage('extract', iter_spotify_dataset(client_id, client_secret, **extract_kwargs))
+    chunks = transform_chunks(chunks, etl_run_data, extract_kwargs['year'], extract_kwargs['checkpoint'], logger)
+    if num_loaders > 0:
+        success, loaded_count = load_dataset_concurrent(chunks, logger=logger, num_loaders=num_loaders,
+                                                        queue_size=queue_size,
+                                                        months=etl_run_data['release_months'], **load_kwargs)
+    else:
+        success, loaded_count = load_dataset_stream(chunks, logger=logger, months=etl_run_data['release_months'],
+                                                    **load_kwargs)
+    
+    if not success and nothing_new(extract_stats, etl_run_data, logger):
+        return True, 0
+    return success, loaded_count
+
+def run_spark(client_id, client_secret, extract_kwargs, load_kwargs, etl_run_data, logger):
+    """Search for tracks, then transform and load them with the Spark backend"""
+    # Only imported when the Spark backend is selected, pyspark is heavy
+    from spark_backend import get_spark_session, create_spark_dataset, transform_dataset_spark, load_dataset_spark
+    from extract import setup_spotify_client, get_tracks_from_search
+    
+    extract_stats = extract_kwargs['stats']
+    known_ids = extract_kwargs['known_ids']
+    
+    # EXTRACT
+    with recorder.stage('extract'):
+        sp = setup_spotify_client(client_id, client_secret, retry_rate_limits=extract_kwargs['max_workers'] <= 1,
+                                  cache=extract_kwargs['cache'], checkpoint=extract_kwargs['checkpoint'])
+        tracks = get_tracks_from_search(sp, year=extract_kwargs['year'], tracks_per_term=extract_kwargs['tracks_per_term'],
+                                        logger=logger, max_workers=extract_kwargs['max_workers'],
+                                        requests_per_second=extract_kwargs['requests_per_second'],
+                                        max_search_terms=extract_kwargs['max_search_terms'])
+        if known_ids:
+            new_tracks = [track for track in tracks if track['id'] not in known_ids]
+            extract_stats['tracks_skipped'] = len(tracks) - len(new_tracks)
+            tracks = new_tracks
+        recorder.add_rows(len(tracks))
+    
+    etl_run_data['tracks_extracted'] = len(tracks)
+    etl_run_data['extract_status'] = 'success' if tracks else 'failure'
+    if nothing_new(extract_stats, etl_run_data, logger):
+        return True, 0
+    
+    # TRANSFORM
+    spark = get_spark_session()
+    sdf = transform_dataset_spark(create_spark_dataset(spark, tracks))
+    etl_run_data['transform_status'] = 'success'
+    
+    # LOAD - Spark evaluates lazily, so this stage includes the transform work too
+    with recorder.stage('load'):
+        recorder.add_rows(len(tracks))
+        return load_dataset_spark(sdf, logger=logger, popularity_history=load_kwargs['popularity_history'],
+                                  months=etl_run_data['release_months'])
 
 # Main execution
 def main():
+    from load import log_etl_run, fetch_loaded_track_ids
+    from enrich import enrich_dimensions
+    from summaries import refresh_summaries
+    
     # Setup logging
     logger = setup_logger()
 
@@ -24,10 +262,12 @@ def main():
         'tracks_extracted': 0,
         'tracks_loaded': 0,
         'error_message': None,
-        'duration_seconds': 0
+        'duration_seconds': 0,
+        'release_months': set()  # Release months of the rows the load changed, for the summary tables
     }
     
     start_time = time.time()
+    recorder.reset()
     
     # Replace with your actual credentials in .env file 
     # Automatically load .env from project root
@@ -42,44 +282,53 @@ def main():
         logger.error("Missing CLIENT_ID or CLIENT_SECRET in environment (.env file)")
         raise RuntimeError("Missing CLIENT_ID or CLIENT_SECRET in environment (.env file)")
     
-    # Configuration
-    YEAR = 2023  # Change this to extract from different years
-    TRACKS_PER_TERM = 300  # Number of tracks to get from each search term
+    # Search response cache: 'sqlite' (default), 'redis' or 'none'
+    cache_backend, cache_ttl = search_cache_settings()
+    search_cache = create_search_cache(
+        backend=cache_backend,
+        ttl=cache_ttl,
+        max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 50000)),
+        redis_url=os.getenv('REDIS_URL')
+    )
+    
+    extract_kwargs = {
+        'year': YEAR,
+        'tracks_per_term': TRACKS_PER_TERM,
+        'logger': logger,
+        'max_workers': MAX_WORKERS,
+        'requests_per_second': REQUESTS_PER_SECOND,
+        'max_search_terms': MAX_SEARCH_TERMS,
+        'cache': search_cache,
+        'known_ids': None,
+        'stats': {}
+    }
+    load_kwargs = {
+        'chunk_size': LOAD_CHUNK_SIZE,
+        'method': LOAD_METHOD,
+        'popularity_history': POPULARITY_HISTORY
+    }
+    
+    # One checkpoint per run configuration, removed once the run succeeds
+    checkpoint = None
+    if CHECKPOINT:
+        checkpoint = open_checkpoint(run_name(), logger=logger)
+    extract_kwargs['checkpoint'] = checkpoint
+    load_kwargs['checkpoint'] = checkpoint
     
     try:
-        # EXTRACT
-        # Create dataset
-        df = create_spotify_dataset(CLIENT_ID, CLIENT_SECRET, year=YEAR, tracks_per_term=TRACKS_PER_TERM, logger=logger)
+        # Incremental mode: skip tracks that are already in the database
+        if INCREMENTAL:
+            extract_kwargs['known_ids'] = fetch_loaded_track_ids(logger=logger)
         
-        etl_run_data['tracks_extracted'] = len(df)
-        etl_run_data['extract_status'] = 'success' if not df.empty else 'failure'
-
-        # TRANSFROM
-        # Carry out transformations
-        df = transform_dataset(df)
-        
-        etl_run_data['transform_status'] = 'success'
-
-        # Display results
-        if not df.empty:
-            print("\nFirst 5 rows of the dataset:")
-            print(df.head())
-            
-            print(f"\nDataset shape: {df.shape}")
-            logger.info(f"Dataset created with {len(df)} tracks")
-            
-            # Save to CSV with year in filename
-            filename = f'csv/spotify_tracks_{YEAR}.csv'
-            df.to_csv(filename, index=False)
-            print(f"\nDataset saved to '{filename}'")
-            logger.info(f"Dataset saved to '{filename}'")
-            
+        if BACKEND == 'spark':
+            success, loaded_count = run_spark(CLIENT_ID, CLIENT_SECRET, extract_kwargs, load_kwargs, etl_run_data, logger)
+        elif STREAMING:
+            extract_kwargs['chunk_size'] = CHUNK_SIZE
+            success, loaded_count = run_streaming(CLIENT_ID, CLIENT_SECRET, extract_kwargs, load_kwargs, etl_run_data, logger,
+                                                  num_loaders=LOADER_THREADS, queue_size=LOAD_QUEUE_SIZE)
         else:
-            print("Failed to create dataset")
-            logger.error("Failed to create dataset")
-
-        # LOAD
-        success, loaded_count = load_dataset(df, logger=logger)
+            success, loaded_count = run_batch(CLIENT_ID, CLIENT_SECRET, extract_kwargs, load_kwargs, etl_run_data, logger)
+        
         etl_run_data['load_status'] = 'success' if success else 'failure'
         etl_run_data['tracks_loaded'] = loaded_count if success else 0
 
@@ -87,6 +336,22 @@ def main():
             print("✓ ETL process completed successfully!")
             logger.info("ETL process completed successfully!")
             etl_run_data['status'] = 'success'
+            
+            # Summaries are rebuilt from tracks, a failed refresh is redone by the next one
+            if SUMMARIES:
+                try:
+                    refresh_summaries(etl_run_data['release_months'], logger=logger)
+                except Exception as e:
+                    print(f"Summary table refresh failed: {e}")
+                    logger.error(f"Summary table refresh failed: {e}")
+            
+            # Dimension tables are best effort, the tracks are already loaded
+            if ENRICH:
+                try:
+                    enrich_dimensions(CLIENT_ID, CLIENT_SECRET, logger=logger, requests_per_second=REQUESTS_PER_SECOND)
+                except Exception as e:
+                    print(f"Artist / album enrichment failed: {e}")
+                    logger.error(f"Artist / album enrichment failed: {e}")
         
         else:
             print("✗ ETL process completed with errors in load phase")
@@ -100,8 +365,27 @@ def main():
         # Calculate duration
         etl_run_data['duration_seconds'] = time.time() - start_time
         
+        if etl_run_data['status'] == 'success':
+            record_run(run_name(), etl_run_data, start_time)
+        
+        if checkpoint is not None:
+            if etl_run_data['status'] == 'success':
+                checkpoint.complete()
+            else:
+                checkpoint.close()
+                print("Checkpoint kept, the next run resumes from it")
+                logger.info("Checkpoint kept, the next run resumes from it")
+        
+        # Per-stage timings, optionally exported for Prometheus' node_exporter textfile collector
+        recorder.log_summary(logger)
+        metrics_file = os.getenv('METRICS_TEXTFILE')
+        if metrics_file:
+            recorder.write_prometheus(metrics_file, labels={'year': YEAR})
+        
         # Log the ETL run to database
-        log_etl_run(etl_run_data, logger)
+        log_etl_run(etl_run_data, logger, stage_metrics=recorder.to_records())
+    
+    return etl_run_data['status'] == 'success'
             
 
 
@@ -1,51 +1,325 @@
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.exceptions import SpotifyException
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import attrgetter
+import gc
+import numpy as np
 import pandas as pd
+import sys
+import threading
 import time
 
-def setup_spotify_client(client_id, client_secret):
-    """Initialize Spotify API client"""
-    client_credentials_manager = SpotifyClientCredentials(
-        client_id=client_id,
-        client_secret=client_secret
-    )
-    return spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+from utils.checkpoint import CheckpointedSpotify
+from utils.metrics import recorder
+from utils.query_planner import PRUNE_DUPLICATE_RATE, duplicate_rate, plan_search_terms, summarize_plan
+from utils.rate_limiter import TokenBucket, retry_after_seconds
+from utils.search_cache import CachedSpotify
+from utils.spotify_client import get_spotify_client
 
-def get_tracks_from_search(sp, year=2023, tracks_per_term=200, logger=None):
-    """Get tracks using search only"""
-    all_tracks = []
-    
-    # Search terms for different genres
-    search_terms = [
-        f'year:{year} genre:pop',
-        f'year:{year} genre:hip-hop', 
-        f'year:{year} genre:rock',
-        f'year:{year} genre:electronic',
-        f'year:{year}'  # General search for the year
+def setup_spotify_client(client_id, client_secret, retry_rate_limits=True, cache=None, checkpoint=None):
+    """
+    Get the shared Spotify API client of this process, reading search pages through `cache`
+    if given and replaying / journaling them through a run `checkpoint` if given
+    """
+    # With retry_rate_limits False, 429s surface to our own rate limiter instead of blocking retries
+    sp = get_spotify_client(client_id, client_secret, retry_rate_limits=retry_rate_limits)
+
+    if cache is not None:
+        sp = CachedSpotify(sp, cache)
+    if checkpoint is not None:
+        sp = CheckpointedSpotify(sp, checkpoint)
+    return sp
+
+# Genres searched for each year, on top of a general search for the year
+GENRES = ['pop', 'hip-hop', 'rock', 'electronic']
+
+def get_search_term(year, genre=None):
+    """Search term for one (year, genre) partition, genre None searches the whole year"""
+    if genre:
+        return f'year:{year} genre:{genre}'
+    return f'year:{year}'
+
+def get_search_terms(year):
+    """Search terms for different genres"""
+    return [get_search_term(year, genre) for genre in GENRES] + [
+        get_search_term(year)  # General search for the year
     ]
+
+def call_with_limiter(limiter, call, description, max_retries=5, logger=None):
+    """Run a single API call through the shared rate limiter, retrying on 429"""
+    for attempt in range(max_retries + 1):
+        recorder.record_rate_limit_wait(limiter.acquire())
+        start = time.perf_counter()
+        try:
+            results = call()
+        except SpotifyException as e:
+            recorder.record_api_call(time.perf_counter() - start)
+            if e.http_status != 429 or attempt == max_retries:
+                raise
+            recorder.record_retry()
+            retry_after = retry_after_seconds(e)
+            limiter.backoff(retry_after)
+            if logger:
+                logger.warning(f"Rate limited on {description}, retrying in {retry_after}s")
+            continue
+        recorder.record_api_call(time.perf_counter() - start)
+        limiter.success()
+        return results
+
+def cached_page(sp, term, limit, offset):
+    """Search page the client already has (search cache or run checkpoint), None if it must be fetched"""
+    cached_search = getattr(sp, 'cached_search', None)
+    if cached_search is None:
+        return None
+    return cached_search(q=term, type='track', limit=limit, offset=offset, market='US')
+
+def search_with_limiter(sp, limiter, term, limit, offset, max_retries=5, logger=None):
+    """Run a single search call through the shared rate limiter, retrying on 429"""
+    # Cached pages don't cost a request, so they don't wait for a token
+    results = cached_page(sp, term, limit, offset)
+    if results is not None:
+        return results
+    return call_with_limiter(
+        limiter,
+        lambda: sp.search(q=term, type='track', limit=limit, offset=offset, market='US'),
+        f"{term} (offset {offset})", max_retries=max_retries, logger=logger
+    )
+
+def search_sequential(sp, term, limit, offset):
+    """Run a single search call on the sequential path, which sleeps between calls instead of using a limiter"""
+    results = cached_page(sp, term, limit, offset)
+    if results is not None:
+        return results
+    start = time.perf_counter()
+    results = sp.search(q=term, type='track', limit=limit, offset=offset, market='US')
+    recorder.record_api_call(time.perf_counter() - start)
+    time.sleep(0.1)  # Rate limiting
+    recorder.record_rate_limit_wait(0.1)
+    return results
+
+def plan_search(sp, year=2023, tracks_per_term=200, logger=None, max_workers=1, limiter=None,
+                search_terms=None, max_search_terms=100):
+    """
+    Probe the first page of each search term and plan the search with utils.query_planner
+
+    Returns:
+        Tuple of (terms to page, {term: first page}, {term: tracks to page})
+    """
+    first_batch = min(50, tracks_per_term)
     
-    for term in search_terms:
+    def probe_term(term):
         try:
+            if limiter is None:
+                return search_sequential(sp, term, first_batch, 0)
+            return search_with_limiter(sp, limiter, term, first_batch, 0, logger=logger)
+        except Exception:
+            return None  # Searched again when the term is paged, which reports the error
+    
+    def probe(terms):
+        if limiter is None:
+            return {term: probe_term(term) for term in terms}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(terms, executor.map(probe_term, terms)))
+    
+    plan = plan_search_terms(probe, search_terms or get_search_terms(year), tracks_per_term,
+                             max_terms=max_search_terms)
+    print(f"Search plan: {summarize_plan(plan)}")
+    if logger:
+        logger.info(f"Search plan: {summarize_plan(plan)}")
+    
+    terms = [entry['term'] for entry in plan]
+    first_pages = {entry['term']: entry['first_page'] for entry in plan if entry['first_page'] is not None}
+    term_limits = {entry['term']: entry['limit'] for entry in plan}
+    return terms, first_pages, term_limits
+
+def iter_term_pages(get_page, term, year, tracks_per_term, seen_terms=None, prune_duplicate_rate=PRUNE_DUPLICATE_RATE):
+    """
+    Yield the tracks from `year` on each page of one search term, in offset order
+
+    With a `seen_terms` dict shared by the terms of a run (see query_planner.duplicate_rate),
+    the term stops early once a page is mostly tracks that other terms already returned.
+    """
+    # Get tracks in batches since API limit is 50 per request
+    for offset in range(0, tracks_per_term, 50):
+        batch_size = min(50, tracks_per_term - offset)  # Don't exceed tracks_per_term
+        
+        tracks = get_page(term, offset, batch_size)['tracks']['items']
+        
+        overlapping = False
+        if seen_terms is not None:
+            ids = [track['id'] for track in tracks if track]
+            overlapping = duplicate_rate(ids, term, seen_terms) >= prune_duplicate_rate
+        
+        # Filter for the specified year
+        yield [track for track in tracks if track['album']['release_date'].startswith(str(year))]
+        
+        # Stop if we didn't get a full batch (no more results), or the rest would be duplicates too
+        if len(tracks) < batch_size or overlapping:
+            break
+
+def iter_search_pages(sp, year=2023, tracks_per_term=200, logger=None,
+                      max_workers=1, requests_per_second=10, limiter=None, search_terms=None,
+                      max_search_terms=None):
+    """
+    Yield (term, pages) for each search term, where pages is a generator of
+    year-filtered track lists in offset order
+
+    With max_workers > 1 pages are fetched in parallel: the first page of each term
+    tells us the total number of results and the rest of its pages are then queued
+    on a bounded worker pool. Errors are raised while iterating the term's pages.
+    Defaults to get_search_terms(year) when no search_terms are given. With
+    max_search_terms, the terms are planned first (see plan_search): terms past the
+    offset cap are split into sub-queries, up to that many terms in total, and a term
+    stops paging once its pages are mostly tracks that earlier terms returned.
+    """
+    if search_terms is None:
+        search_terms = get_search_terms(year)
+    
+    if max_workers > 1 and limiter is None:
+        limiter = TokenBucket(rate=requests_per_second)
+    
+    first_pages = {}
+    term_limits = {}
+    seen_terms = None
+    if max_search_terms:
+        seen_terms = {}
+        search_terms, first_pages, term_limits = plan_search(
+            sp, year=year, tracks_per_term=tracks_per_term, logger=logger, max_workers=max_workers,
+            limiter=limiter if max_workers > 1 else None, search_terms=search_terms,
+            max_search_terms=max_search_terms
+        )
+    
+    if max_workers <= 1:
+        def get_page(term, offset, batch_size):
+            if offset == 0 and term in first_pages:
+                return first_pages[term]
+            return search_sequential(sp, term, batch_size, offset)
+        
+        for term in search_terms:
+            print(f"Searching for: {term}")
+            yield term, iter_term_pages(get_page, term, year, term_limits.get(term, tracks_per_term), seen_terms)
+        return
+    
+    futures = {}
+    scheduled = {term: threading.Event() for term in search_terms}
+    rest_offsets = {}  # Offsets after the first page of each term, once its total is known
+    page_order = deque()  # (term, offset) of the pages not queued yet, in the order they're consumed
+    finished = set()
+    queue_state = {'next_term': 0, 'outstanding': 0}
+    lock = threading.Lock()
+    max_ahead = max_workers * 4  # Pages queued ahead of the consumer
+    
+    def fetch(term, offset):
+        batch_size = min(50, term_limits.get(term, tracks_per_term) - offset)
+        return search_with_limiter(sp, limiter, term, batch_size, offset, logger=logger)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit_ahead():
+            # Queue pages in the order they're consumed and only max_ahead of them, so raw
+            # pages don't pile up while the consumer is slower than the API (e.g. waiting on loads)
+            with lock:
+                while (queue_state['next_term'] < len(search_terms)
+                       and search_terms[queue_state['next_term']] in rest_offsets):
+                    term = search_terms[queue_state['next_term']]
+                    page_order.extend((term, offset) for offset in rest_offsets[term])
+                    queue_state['next_term'] += 1
+                while page_order and queue_state['outstanding'] < max_ahead:
+                    term, offset = page_order.popleft()
+                    if term not in finished:
+                        futures[(term, offset)] = executor.submit(fetch, term, offset)
+                        queue_state['outstanding'] += 1
+        
+        def schedule_rest(term, future):
+            # Once we know the total for a term, the rest of its pages can be queued
+            offsets = []
+            try:
+                results = future.result()
+                limit = term_limits.get(term, tracks_per_term)
+                if len(results['tracks']['items']) == min(50, limit):
+                    last = min(limit, results['tracks'].get('total', limit))
+                    offsets = list(range(50, last, 50))
+            except Exception:
+                pass  # Surfaced when the consumer reaches this page
+            finally:
+                rest_offsets[term] = offsets
+                scheduled[term].set()
+            submit_ahead()
+        
+        for term in search_terms:
+            if term in first_pages:  # Already fetched by the planner
+                futures[(term, 0)] = Future()
+                futures[(term, 0)].set_result(first_pages[term])
+            else:
+                futures[(term, 0)] = executor.submit(fetch, term, 0)
+        for term in search_terms:
+            futures[(term, 0)].add_done_callback(lambda future, term=term: schedule_rest(term, future))
+        
+        def get_page(term, offset, batch_size):
+            scheduled[term].wait()
+            if offset and offset not in rest_offsets[term]:  # Past the total reported by the first page
+                return {'tracks': {'items': []}}
+            with lock:
+                # Popped so a page's raw JSON is freed once it's consumed
+                future = futures.pop((term, offset), None)
+                if future is not None and offset:
+                    queue_state['outstanding'] -= 1
+                elif future is None and (term, offset) in page_order:
+                    page_order.remove((term, offset))
+            if future is None:  # Not queued yet
+                future = executor.submit(fetch, term, offset)
+            submit_ahead()
+            return future.result()
+        
+        for term in search_terms:
             print(f"Searching for: {term}")
+            yield term, iter_term_pages(get_page, term, year, term_limits.get(term, tracks_per_term), seen_terms)
             
-            # Get tracks in batches since API limit is 50 per request
-            term_tracks = []
-            for offset in range(0, tracks_per_term, 50):
-                batch_size = min(50, tracks_per_term - offset)  # Don't exceed tracks_per_term
-                
-                results = sp.search(q=term, type='track', limit=batch_size, offset=offset, market='US')
-                tracks = results['tracks']['items']
-                
-                # Filter for the specified year
-                for track in tracks:
-                    if track['album']['release_date'].startswith(str(year)):
-                        term_tracks.append(track)
-                
-                time.sleep(0.1)  # Rate limiting
+            # Drop the queued pages of a term that failed or was cut short as a duplicate
+            with lock:
+                finished.add(term)
+                for offset in rest_offsets.get(term, []):
+                    future = futures.pop((term, offset), None)
+                    if future is not None:
+                        future.cancel()
+                        queue_state['outstanding'] -= 1
+            submit_ahead()
+
+def get_tracks_from_search(sp, year=2023, tracks_per_term=200, logger=None,
+                           max_workers=1, requests_per_second=10, limiter=None, search_terms=None,
+                           max_search_terms=None, compact=False):
+    """
+    Get tracks using search only
+
+    Returns raw track dicts, or with compact=True a TrackRecord per unique track: each
+    page is then projected as it arrives and duplicates are dropped against the ids seen
+    so far, so the raw JSON of the whole search is never held at once.
+    """
+    all_tracks = []
+    seen_ids = set()
+    found = 0
+    
+    pages = iter_search_pages(sp, year=year, tracks_per_term=tracks_per_term, logger=logger,
+                              max_workers=max_workers, requests_per_second=requests_per_second,
+                              limiter=limiter, search_terms=search_terms, max_search_terms=max_search_terms)
+    for term, term_pages in pages:
+        try:
+            if compact:
+                # A term that fails halfway adds nothing, like the raw path
+                term_records = {}
+                term_found = 0
+                for page in term_pages:
+                    term_found += len(page)
+                    for track in page:
+                        if track and track['id'] not in seen_ids and track['id'] not in term_records:
+                            term_records[track['id']] = compact_track(track)
                 
-                # Stop if we didn't get a full batch (no more results)
-                if len(tracks) < batch_size:
-                    break
+                print(f"  Found {term_found} tracks from {year}")
+                found += term_found
+                seen_ids.update(term_records)
+                all_tracks.extend(record for record in term_records.values() if record is not None)
+                continue
+            
+            term_tracks = [track for page in term_pages for track in page]
             
             print(f"  Found {len(term_tracks)} tracks from {year}")
             all_tracks.extend(term_tracks)
@@ -56,11 +330,70 @@ def get_tracks_from_search(sp, year=2023, tracks_per_term=200, logger=None):
                 logger.error(f"Error searching for {term}: {e}")
             continue
     
+    if not compact:
+        return remove_duplicate_tracks(all_tracks, logger=logger)
+    
+    print(f"Total tracks found across all searches: {found}")
+    print(f"Unique tracks after removing duplicates: {len(seen_ids)}")
+    if logger:
+        logger.info(f"Total tracks found across all searches: {found}")
+        logger.info(f"Unique tracks after removing duplicates: {len(seen_ids)}")
+    return all_tracks
+
+def get_tracks_from_search_concurrent(sp, year=2023, tracks_per_term=200, logger=None,
+                                      max_workers=4, requests_per_second=10, limiter=None, search_terms=None,
+                                      max_search_terms=None):
+    """Get tracks using search, fetching (term, offset) pages in parallel"""
+    return get_tracks_from_search(sp, year=year, tracks_per_term=tracks_per_term, logger=logger,
+                                  max_workers=max_workers, requests_per_second=requests_per_second,
+                                  limiter=limiter, search_terms=search_terms, max_search_terms=max_search_terms)
+
+def iter_tracks_from_search(sp, year=2023, tracks_per_term=200, logger=None,
+                            max_workers=1, requests_per_second=10, limiter=None, search_terms=None,
+                            max_search_terms=None):
+    """
+    Streaming version of get_tracks_from_search, yields each page of new unique
+    tracks as soon as it arrives
+
+    Duplicates are dropped on the fly against the ids seen so far. Unlike the batch
+    version, pages from a term that fails halfway have already been yielded.
+    """
+    seen_ids = set()
+    total = 0
+    
+    pages = iter_search_pages(sp, year=year, tracks_per_term=tracks_per_term, logger=logger,
+                              max_workers=max_workers, requests_per_second=requests_per_second,
+                              limiter=limiter, search_terms=search_terms, max_search_terms=max_search_terms)
+    for term, term_pages in pages:
+        try:
+            for page in term_pages:
+                total += len(page)
+                unique = []
+                for track in page:
+                    if track and track['id'] not in seen_ids:
+                        seen_ids.add(track['id'])
+                        unique.append(track)
+                if unique:
+                    yield unique
+        
+        except Exception as e:
+            print(f"Error searching for {term}: {e}")
+            if logger:
+                logger.error(f"Error searching for {term}: {e}")
+            continue
+    
+    print(f"Total tracks found across all searches: {total}")
+    print(f"Unique tracks after removing duplicates: {len(seen_ids)}")
+    if logger:
+        logger.info(f"Total tracks found across all searches: {total}")
+        logger.info(f"Unique tracks after removing duplicates: {len(seen_ids)}")
+
+def remove_duplicate_tracks(all_tracks, logger=None):
+    """Remove duplicates based on track ID, keeping the first occurrence"""
     print(f"Total tracks found across all searches: {len(all_tracks)}")
     if logger:
         logger.info(f"Total tracks found across all searches: {len(all_tracks)}")
     
-    # Remove duplicates based on track ID
     unique_tracks = {}
     for track in all_tracks:
         if track and track['id'] not in unique_tracks:
@@ -71,6 +404,9 @@ def get_tracks_from_search(sp, year=2023, tracks_per_term=200, logger=None):
     
     return result
 
+# Fallback cover image (tame impala)
+DEFAULT_COVER_IMAGE_URL = 'https://i.scdn.co/image/ab67616d0000b2739e1cfc756886ac782e363d79'
+
 def get_cover_image_url(track):
     """Get cover image URL with fallback to default"""
     try:
@@ -79,9 +415,9 @@ def get_cover_image_url(track):
             return track['album']['images'][0]['url']
         else:
             # Fallback to default image (tame impala)
-            return 'https://i.scdn.co/image/ab67616d0000b2739e1cfc756886ac782e363d79'
+            return DEFAULT_COVER_IMAGE_URL
     except:
-        return 'https://i.scdn.co/image/ab67616d0000b2739e1cfc756886ac782e363d79'
+        return DEFAULT_COVER_IMAGE_URL
 
 def normalize_release_date(release_date):
     """Convert release date to YYYY-MM-DD format"""
@@ -92,52 +428,117 @@ def normalize_release_date(release_date):
     else:  # YYYY format
         return f"{release_date}-01-01"  # Add month and day as 01
 
-def extract_track_info(track):
-    """Extract track information and return as dictionary"""
+class TrackRecord:
+    """
+    The fields of a search result track that the extract columns are built from
+
+    Slots instead of a dict, and the strings that repeat across tracks (artists, album
+    ids and types, release dates, cover URLs) are interned so tracks share them. Release
+    dates are kept as Spotify sends them and cover_image_url is None for an album without
+    images, extract_record_frame normalizes both a whole chunk at a time.
+    """
+    __slots__ = ('id', 'name', 'artist_names', 'artist_ids', 'artist_count', 'release_date',
+                 'duration_ms', 'popularity', 'cover_image_url', 'album_type', 'album_id')
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+def compact_track(track):
+    """Project a raw track into a TrackRecord, None if it is missing a field (logged and skipped)"""
     try:
-        # Basic track info
-        track_id = track['id']
-        track_name = track['name']
-        artists = [artist['name'] for artist in track['artists']]
-        artist_names = ', '.join(artists)
-        artist_count = len(artists)
-        
-        # Release date - keep as YYYY-MM-DD
-        release_date = normalize_release_date(track['album']['release_date'])
-        
-        # Duration in milliseconds
-        duration_ms = track['duration_ms']
-        
-        # Popularity
-        popularity = track['popularity']
-        
-        # Cover image with fallback
-        cover_image_url = get_cover_image_url(track)
-        
-        # Album type
-        album_type = track['album']['album_type']  # single, album, compilation
-        
-        # Create row data with id as first column
-        row_data = {
-            'id': track_id,
-            'track_name': track_name,
-            'artist(s)_name': artist_names,
-            'artist_count': artist_count,
-            'release_date': release_date,
-            'duration_ms': duration_ms,
-            'popularity': popularity,
-            'cover_image_url': cover_image_url,
-            'album_type': album_type
-        }
-        
-        return row_data
-        
+        album = track['album']
+        artists = track['artists']
+        record = TrackRecord()
+        record.id = track['id']
+        record.name = track['name']
+        record.artist_names = sys.intern(', '.join([artist['name'] for artist in artists]))
+        record.artist_ids = sys.intern(','.join([artist['id'] for artist in artists]))
+        record.artist_count = len(artists)
+        record.release_date = _intern(album['release_date'])
+        record.duration_ms = track['duration_ms']
+        record.popularity = track['popularity']
+        try:
+            images = album['images']
+            record.cover_image_url = _intern(images[0]['url']) if images else None
+        except (KeyError, TypeError, IndexError):
+            record.cover_image_url = None  # Default cover, like get_cover_image_url
+        record.album_type = _intern(album['album_type'])
+        record.album_id = _intern(album['id'])
+        return record
     except Exception as e:
         print(f"Error extracting data for track {track.get('name', 'Unknown')}: {e}")
         return None
 
-def create_spotify_dataset(client_id, client_secret, year=2023, tracks_per_term=200, logger=None):
-    """Main function to create the dataset"""
+def compact_tracks(tracks):
+    """
+    TrackRecords of a page of raw tracks, malformed tracks are dropped
+
+    The garbage collector is paused while the records are built: they only hold strings
+    and ints, but each one is a tracked object and a chunk of them would otherwise set
+    off collections that walk every raw track dict still alive.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        records = (compact_track(track) for track in tracks if track)
+        return [record for record in records if record is not None]
+    finally:
+        if enabled:
+            gc.enable()
+
+# Extract DataFrame columns, in order, and the TrackRecord slot each one is read from
+RECORD_COLUMNS = {
+    'id': 'id', 'track_name': 'name', 'artist(s)_name': 'artist_names', 'artist_ids': 'artist_ids',
+    'artist_count': 'artist_count', 'release_date': 'release_date', 'duration_ms': 'duration_ms',
+    'popularity': 'popularity', 'cover_image_url': 'cover_image_url', 'album_type': 'album_type',
+    'album_id': 'album_id'
+}
+
+def normalize_release_dates(release_dates):
+    """
+    normalize_release_date over a column of release dates, one string operation per
+    distinct date (a chunk has a few hundred at most)
+    """
+    codes, uniques = pd.factorize(np.array(release_dates, dtype=object))
+    lengths = np.fromiter(map(len, uniques), dtype=np.int64, count=len(uniques))
+    suffixes = np.where(lengths == 10, '', np.where(lengths == 7, '-01', '-01-01')).astype(object)
+    return (uniques.astype(object) + suffixes)[codes]
+
+def extract_record_frame(records):
+    """
+    Build the extract DataFrame from TrackRecords, column by column
+
+    Each column is read straight off its slot. Release dates are normalized per distinct
+    date and missing covers get DEFAULT_COVER_IMAGE_URL. Counts, durations and popularities
+    are int64 columns, a record with a non-integer duration or popularity makes the chunk
+    fall back to inferred dtypes.
+    """
+    if not records:
+        return pd.DataFrame()
+    
+    columns = {column: list(map(attrgetter(slot), records)) for column, slot in RECORD_COLUMNS.items()}
+    columns['release_date'] = normalize_release_dates(columns['release_date'])
+    columns['cover_image_url'] = [url or DEFAULT_COVER_IMAGE_URL for url in columns['cover_image_url']]
+    try:
+        for column in ('artist_count', 'duration_ms', 'popularity'):
+            columns[column] = np.array(columns[column], dtype=np.int64)
+    except (TypeError, ValueError):
+        pass
+    return pd.DataFrame(columns)
+
+@recorder.timed('extract')
+def create_spotify_dataset(client_id, client_secret, year=2023, tracks_per_term=200, logger=None,
+                           max_workers=1, requests_per_second=10, cache=None, search_terms=None,
+                           known_ids=None, stats=None, checkpoint=None, max_search_terms=None):
+    """
+    Main function to create the dataset
+
+    Tracks whose id is in `known_ids` (already loaded) are skipped before any row is
+    built. If a `stats` dict is given, it's filled with tracks_found / tracks_skipped.
+    With a `checkpoint`, pages journaled by an earlier attempt of the run are replayed
+    instead of searched again. `max_search_terms` turns on the search planner, see
+    iter_search_pages.
+    """
     print(f"Starting extraction of tracks from {year}...")
     print(f"Target: {tracks_per_term} tracks per search term")
     
@@ -146,12 +547,20 @@ def create_spotify_dataset(client_id, client_secret, year=2023, tracks_per_term=
         logger.info(f"Target: {tracks_per_term} tracks per search term")
     
     # Setup Spotify client
-    sp = setup_spotify_client(client_id, client_secret)
+    sp = setup_spotify_client(client_id, client_secret, retry_rate_limits=max_workers <= 1, cache=cache,
+                              checkpoint=checkpoint)
     
     # Get tracks using search only
     print(f"Searching for tracks from {year}...")
-    tracks = get_tracks_from_search(sp, year=year, tracks_per_term=tracks_per_term, logger=logger)
+    tracks = get_tracks_from_search(sp, year=year, tracks_per_term=tracks_per_term, logger=logger,
+                                    max_workers=max_workers, requests_per_second=requests_per_second,
+                                    search_terms=search_terms, max_search_terms=max_search_terms, compact=True)
     print(f"Found {len(tracks)} unique tracks from {year}")
+    log_client_stats(sp, cache, checkpoint, logger)
+    
+    if stats is not None:
+        stats['tracks_found'] = len(tracks)
+        stats['tracks_skipped'] = 0
     
     if not tracks:
         print("No tracks found. Please check your API credentials and connection.")
@@ -159,18 +568,86 @@ def create_spotify_dataset(client_id, client_secret, year=2023, tracks_per_term=
             logger.error("No tracks found. Please check your API credentials and connection.")
         return pd.DataFrame()
     
+    # Incremental mode: drop tracks that are already loaded
+    if known_ids:
+        new_tracks = [track for track in tracks if track.id not in known_ids]
+        skipped = len(tracks) - len(new_tracks)
+        tracks = new_tracks
+        if stats is not None:
+            stats['tracks_skipped'] = skipped
+        print(f"Skipping {skipped} tracks already loaded, {len(tracks)} new tracks")
+        if logger:
+            logger.info(f"Skipping {skipped} tracks already loaded, {len(tracks)} new tracks")
+        if not tracks:
+            return pd.DataFrame()
+    
     # Extract data for each track
     print("Extracting track data...")
-    dataset = []
+    df = extract_record_frame(tracks)
     
-    for track in tracks:
-        row_data = extract_track_info(track)
-        if row_data:
-            dataset.append(row_data)
+    print(f"Dataset created with {len(df)} tracks")
     
-    # Create DataFrame
-    df = pd.DataFrame(dataset)
+    return df
+
+def log_client_stats(sp, cache, checkpoint, logger=None):
+    """Report search cache hits and checkpoint replays of the client made by setup_spotify_client"""
+    if cache is not None:
+        print(f"Search cache: {sp.hits} hits, {sp.misses} misses")
+        if logger:
+            logger.info(f"Search cache: {sp.hits} hits, {sp.misses} misses")
+    if checkpoint is not None:
+        print(f"Checkpoint: {sp.replayed} pages replayed, {sp.fetched} fetched")
+        if logger:
+            logger.info(f"Checkpoint: {sp.replayed} pages replayed, {sp.fetched} fetched")
+
+def iter_spotify_dataset(client_id, client_secret, year=2023, tracks_per_term=200, logger=None,
+                         max_workers=1, requests_per_second=10, cache=None, chunk_size=500,
+                         search_terms=None, known_ids=None, stats=None, checkpoint=None,
+                         max_search_terms=None):
+    """
+    Streaming version of create_spotify_dataset
+
+    Yields DataFrames of at most `chunk_size` rows as search pages arrive, so only
+    one chunk of raw tracks is held in memory at a time. `known_ids`, `stats`,
+    `checkpoint` and `max_search_terms` work as in create_spotify_dataset.
+    """
+    if stats is None:
+        stats = {}
+    stats['tracks_found'] = 0
+    stats['tracks_skipped'] = 0
+    print(f"Starting streaming extraction of tracks from {year}...")
+    print(f"Target: {tracks_per_term} tracks per search term, {chunk_size} rows per chunk")
     
-    print(f"Dataset created with {len(df)} tracks")
+    if logger:
+        logger.info(f"Starting streaming extraction of tracks from {year}...")
+        logger.info(f"Target: {tracks_per_term} tracks per search term, {chunk_size} rows per chunk")
+    
+    # Setup Spotify client
+    sp = setup_spotify_client(client_id, client_secret, retry_rate_limits=max_workers <= 1, cache=cache,
+                              checkpoint=checkpoint)
+    
+    pending = []
+    pages = iter_tracks_from_search(sp, year=year, tracks_per_term=tracks_per_term, logger=logger,
+                                    max_workers=max_workers, requests_per_second=requests_per_second,
+                                    search_terms=search_terms, max_search_terms=max_search_terms)
+    for page in pages:
+        stats['tracks_found'] += len(page)
+        if known_ids:
+            new_tracks = [track for track in page if track['id'] not in known_ids]
+            stats['tracks_skipped'] += len(page) - len(new_tracks)
+            page = new_tracks
+        
+        pending.extend(compact_tracks(page))
+        while len(pending) >= chunk_size:
+            chunk, pending = pending[:chunk_size], pending[chunk_size:]
+            yield extract_record_frame(chunk)
+    
+    if pending:
+        yield extract_record_frame(pending)
+    
+    if known_ids:
+        print(f"Skipped {stats['tracks_skipped']} tracks already loaded")
+        if logger:
+            logger.info(f"Skipped {stats['tracks_skipped']} tracks already loaded")
     
-    return df
\ No newline at end of file
+    log_client_stats(sp, cache, checkpoint, logger)
\ No newline at end of file
@@ -3,144 +3,661 @@
 # Load phase - saving to MySQL database
 
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 import os
+import tempfile
+import json
+import queue
+import threading
+import time
 from dotenv import load_dotenv
+import numpy as np
 
-def load_dataset(df, logger=None):
+from migrations import migrate
+from utils.metrics import recorder
+from utils.query_cache import note_load
+
+# Columns of the tracks table, in the order they are written
+TRACK_COLUMNS = [
+    'id', 'track_name', 'artist_name', 'artist_count', 'release_date', 'duration_min',
+    'popularity', 'cover_image_url', 'album_type', 'album_id', 'total_streams', 'danceability', 'tempo', 'row_hash'
+]
+
+# Columns rewritten when a loaded track's row_hash changed, the key columns stay as they are
+UPDATE_COLUMNS = [column for column in TRACK_COLUMNS if column not in ('id', 'release_date')]
+# The incoming row is aliased `new` (VALUES (...) AS new, or the SELECT's table), VALUES(column)
+# is deprecated since MySQL 8.0.20 and warns. The row alias needs MySQL 8.0.19+, MariaDB has none
+UPSERT_ASSIGNMENTS = ', '.join(f'tracks.{column} = new.{column}' for column in UPDATE_COLUMNS)
+
+# Transformed DataFrame columns that are named differently from their table column
+FRAME_COLUMNS = {'artist_name': 'artist_names'}
+
+# tracks as first created (schema version 0), migrations.py brings it up to date
+TRACKS_TABLE_QUERY = """
+CREATE TABLE tracks (
+    id VARCHAR(255) PRIMARY KEY,
+    track_name TEXT,
+    artist_name TEXT,
+    artist_count INT,
+    release_date DATE,
+    duration_min FLOAT,
+    popularity INT,
+    cover_image_url TEXT,
+    album_type VARCHAR(50),
+    album_id VARCHAR(255),
+    total_streams BIGINT,
+    danceability INT,
+    tempo FLOAT,
+    INDEX idx_tracks_album_id (album_id)
+)
+"""
+
+# Ways of writing rows to the tracks table, see write_tracks
+LOAD_METHODS = ('executemany', 'infile')
+
+# Connection pools shared by every function in this module, one per allow_local_infile
+# setting. The schema is checked once per process, when the first pool is created.
+_pools = {}
+_pool_lock = threading.Lock()
+_schema_ready = False
+
+def get_db_config(allow_local_infile=False):
     """
-    Load pandas DataFrame to MySQL database using incremental loading
-    
+    Database connection parameters from the environment
+
     Args:
-        df: Transformed pandas DataFrame
-        logger: Logger instance for logging
-    
-    Returns:
-        Boolean indicating success
+        allow_local_infile: Allow LOAD DATA LOCAL INFILE (needs local_infile=ON on the server)
     """
-    
-    if df.empty:
-        print("Cannot load empty dataset")
-        if logger:
-            logger.error("Cannot load empty dataset")
-        return False
-    
-    # Load environment variables
-    load_dotenv()
-    
-    # Rename column to avoid SQL issues
-    df_copy = df.copy()
-    if 'artist(s)_name' in df_copy.columns:
-        df_copy.rename(columns={'artist(s)_name': 'artist_name'}, inplace=True)
-    
-    # Database connection parameters
     config = {
         'user': os.getenv('MYSQL_USER', 'root'),
         'password': os.getenv('MYSQL_PASSWORD'),
         'host': os.getenv('MYSQL_HOST', 'localhost'),
         'raise_on_warnings': True
     }
+    if allow_local_infile:
+        config['allow_local_infile'] = True
     
     # Get password if not in environment
     if not config['password']:
         config['password'] = input("Enter MySQL root password: ")
     
-    connection = None
-    cursor = None
+    return config
+
+def get_connection(logger=None, allow_local_infile=False):
+    """
+    Get a connection to spotify_db from the shared pool
+    
+    The first call in a process creates the schema (if needed) and the pool, later
+    calls just check out a pooled connection. Closing it returns it to the pool.
+    
+    Args:
+        logger: Logger instance for logging
+        allow_local_infile: Use the pool whose connections allow LOAD DATA LOCAL INFILE
+    """
+    global _schema_ready
+    
+    with _pool_lock:
+        pool = _pools.get(allow_local_infile)
+        if pool is None:
+            load_dotenv()
+            config = get_db_config(allow_local_infile=allow_local_infile)
+            
+            if not _schema_ready:
+                ensure_schema(config, logger)
+                _schema_ready = True
+            
+            pool = pooling.MySQLConnectionPool(
+                pool_name='spotify_etl_infile' if allow_local_infile else 'spotify_etl',
+                pool_size=int(os.getenv('MYSQL_POOL_SIZE', 5)),
+                database='spotify_db',
+                **config
+            )
+            _pools[allow_local_infile] = pool
     
+    return pool.get_connection()
+
+def ensure_schema(config, logger=None):
+    """Create the database and tables over a one-off connection and migrate them, once per process"""
+    connection = mysql.connector.connect(**config)
+    cursor = connection.cursor()
     try:
-        print("=== Loading to MySQL Database ===")
+        ensure_tracks_table(cursor, logger)
+        ensure_dimension_tables(cursor, logger)
+        ensure_log_table(cursor, logger)
+        ensure_stage_metrics_table(cursor, logger)
+        migrate(connection, cursor, logger)
+    finally:
+        cursor.close()
+        connection.close()
+
+def ensure_tracks_table(cursor, logger=None):
+    """Create the spotify_db database and tracks table if they don't exist yet"""
+    # Check if database exists and create if it doesn't
+    try:
+        cursor.execute("CREATE DATABASE spotify_db")
+        print("✓ Database 'spotify_db' created")
         if logger:
-            logger.info("=== Loading to MySQL Database ===")
-        
-        # Connect to MySQL server
-        connection = mysql.connector.connect(**config)
-        cursor = connection.cursor()
+            logger.info("Database 'spotify_db' created")
+    except mysql.connector.Error as e:
+        if e.errno == 1007:  # Database already exists
+            print("✓ Database 'spotify_db' already exists")
+            if logger:
+                logger.info("Database 'spotify_db' already exists")
+        else:
+            raise e  # Re-raise if it's a different error
         
-        # Check if database exists and create if it doesn't
-        try:
-            cursor.execute("CREATE DATABASE spotify_db")
-            print("✓ Database 'spotify_db' created")
+    cursor.execute("USE spotify_db")
+    print("✓ Database 'spotify_db' ready")
+    if logger:
+        logger.info("Database 'spotify_db' ready")
+    
+    try:
+        cursor.execute(TRACKS_TABLE_QUERY)
+        print("✓ Table 'tracks' created")
+        if logger:
+            logger.info("Table 'tracks' created")
+    except mysql.connector.Error as e:
+        if e.errno == 1050:  # Table already exists
+            print("✓ Table 'tracks' already exists")
             if logger:
-                logger.info("Database 'spotify_db' created")
-        except mysql.connector.Error as e:
-            if e.errno == 1007:  # Database already exists
-                print("✓ Database 'spotify_db' already exists")
-                if logger:
-                    logger.info("Database 'spotify_db' already exists")
-            else:
-                raise e  # Re-raise if it's a different error
-            
-        cursor.execute("USE spotify_db")
-        print("✓ Database 'spotify_db' ready")
+                logger.info("Table 'tracks' already exists")
+        else:
+            raise e  # Re-raise if it's a different error
+    
+    # Tables created before the album dimension existed don't have album_id yet
+    try:
+        cursor.execute("ALTER TABLE tracks ADD COLUMN album_id VARCHAR(255) AFTER album_type, "
+                       "ADD INDEX idx_tracks_album_id (album_id)")
         if logger:
-            logger.info("Database 'spotify_db' ready")
-        
-        # Create table with explicit error handling
-        create_table_query = """
-        CREATE TABLE tracks (
-            id VARCHAR(255) PRIMARY KEY,
-            track_name TEXT,
-            artist_name TEXT,
-            artist_count INT,
-            release_date DATE,
-            duration_min FLOAT,
-            popularity INT,
-            cover_image_url TEXT,
-            album_type VARCHAR(50),
-            total_streams BIGINT,
-            danceability INT,
-            tempo FLOAT
-        )
+            logger.info("Column 'tracks.album_id' added")
+    except mysql.connector.Error as e:
+        if e.errno != 1060:  # Duplicate column name
+            raise e
+
+def ensure_dimension_tables(cursor, logger=None):
+    """Create the artists, albums and track_artists tables if they don't exist yet"""
+    create_queries = {
+        'artists': """
+            CREATE TABLE artists (
+                artist_id VARCHAR(255) PRIMARY KEY,
+                name TEXT,
+                popularity INT,
+                followers INT,
+                genres TEXT,
+                image_url TEXT,
+                INDEX idx_artists_name (name(191))
+            )
+        """,
+        'albums': """
+            CREATE TABLE albums (
+                album_id VARCHAR(255) PRIMARY KEY,
+                name TEXT,
+                album_type VARCHAR(50),
+                release_date DATE,
+                total_tracks INT,
+                label TEXT,
+                popularity INT,
+                cover_image_url TEXT
+            )
+        """,
+        # One row per (track, artist), artist_position keeps the credited order
+        'track_artists': """
+            CREATE TABLE track_artists (
+                track_id VARCHAR(255) NOT NULL,
+                artist_id VARCHAR(255) NOT NULL,
+                artist_position INT NOT NULL,
+                PRIMARY KEY (track_id, artist_id),
+                INDEX idx_track_artists_artist_id (artist_id, track_id)
+            )
         """
+    }
+    for table, create_query in create_queries.items():
         try:
-            cursor.execute(create_table_query)
-            print("✓ Table 'tracks' created")
+            cursor.execute(create_query)
             if logger:
-                logger.info("Table 'tracks' created")
+                logger.info(f"Table '{table}' created")
         except mysql.connector.Error as e:
             if e.errno == 1050:  # Table already exists
-                print("✓ Table 'tracks' already exists")
                 if logger:
-                    logger.info("Table 'tracks' already exists")
+                    logger.info(f"Table '{table}' already exists")
             else:
                 raise e  # Re-raise if it's a different error
+
+def ensure_log_table(cursor, logger=None):
+    """Create the etl_log table if it doesn't exist yet"""
+    # Check if etl_log table exists, create if it doesn't
+    create_log_query="""
+        CREATE TABLE etl_log (
+            log_id INT AUTO_INCREMENT PRIMARY KEY,
+            run_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            status ENUM('success', 'failure') NOT NULL,
+            extract_status ENUM('success', 'failure'),
+            transform_status ENUM('success', 'failure'),
+            load_status ENUM('success', 'failure'),
+            tracks_extracted INT,
+            tracks_loaded INT,
+            error_message TEXT,
+            duration_seconds FLOAT
+        )
+    """
+    try:
+        cursor.execute(create_log_query)
+    except mysql.connector.Error as e:
+        if e.errno == 1050:  # Table already exists
+            if logger:
+                logger.info("Table 'etl_log' already exists")
+        else:
+            raise e  # Re-raise if it's a different error
+
+def ensure_stage_metrics_table(cursor, logger=None):
+    """Create the etl_stage_metrics table (per-stage timings of each etl_log run) if it doesn't exist yet"""
+    create_metrics_query = """
+        CREATE TABLE etl_stage_metrics (
+            metric_id INT AUTO_INCREMENT PRIMARY KEY,
+            log_id INT NOT NULL,
+            stage VARCHAR(50) NOT NULL,
+            wall_seconds FLOAT,
+            rows_processed INT,
+            rows_per_second FLOAT,
+            api_calls INT,
+            api_latency_avg_ms FLOAT,
+            api_latency_p95_ms FLOAT,
+            api_latency_histogram JSON,
+            retries INT,
+            rate_limit_wait_seconds FLOAT,
+            cache_hits INT,
+            db_round_trips INT,
+            peak_rss_mb FLOAT,
+            INDEX idx_etl_stage_metrics_log_id (log_id)
+        )
+    """
+    try:
+        cursor.execute(create_metrics_query)
+    except mysql.connector.Error as e:
+        if e.errno == 1050:  # Table already exists
+            if logger:
+                logger.info("Table 'etl_stage_metrics' already exists")
+        else:
+            raise e  # Re-raise if it's a different error
+
+def column_values(series):
+    """
+    A column as a list of Python values the connector can send, converted straight from its
+    array: dates become datetime.date and missing categories None
+    """
+    if series.dtype == 'category':
+        categories = np.append(series.cat.categories.to_numpy(dtype=object), None)  # Code -1 -> None
+        return categories[series.cat.codes.to_numpy()].tolist()
+    if series.dtype.kind == 'M':
+        return series.to_numpy().astype('datetime64[D]').tolist()
+    return series.to_numpy().tolist()
+
+def track_tuples(df, columns=TRACK_COLUMNS):
+    """
+    The DataFrame's rows as tuples of the given tracks table columns
+
+    Each column is read from its own array and only zipped into rows at the end, the frame
+    is never copied or turned into one object array.
+    """
+    return list(zip(*(column_values(df[FRAME_COLUMNS.get(column, column)]) for column in columns)))
+
+def track_artist_rows(df):
+    """(track_id, artist_id, artist_position) for every artist credited on every track"""
+    return [
+        (track_id, artist_id, position)
+        for track_id, artist_ids in zip(df['id'], df['artist_ids'])
+        for position, artist_id in enumerate(artist_ids.split(','))
+        if artist_id
+    ]
+
+def insert_track_artists(cursor, df):
+    """Link the chunk's tracks to their artists, existing links are left alone"""
+    rows = track_artist_rows(df)
+    if rows:
+        # A no-op update rather than INSERT IGNORE, which warns on every existing link and
+        # fails on connections with raise_on_warnings
+        cursor.executemany("""
+            INSERT INTO track_artists (track_id, artist_id, artist_position) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE artist_position = artist_position
+        """, rows)
+        recorder.record_db_round_trips()
+
+def fetch_stored_tracks(cursor, ids):
+    """
+    (release_date, popularity, row_hash) of the given track ids that are already loaded,
+    fetched in one round trip
+
+    Returns:
+        Dictionary of id -> tuple
+    """
+    if not ids:
+        return {}
+    cursor.execute(
+        f"SELECT id, release_date, popularity, row_hash FROM tracks WHERE id IN ({', '.join(['%s'] * len(ids))})",
+        ids
+    )
+    recorder.record_db_round_trips()
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+def diff_tracks(df, stored):
+    """
+    Compare a chunk with the stored version of its tracks (see fetch_stored_tracks)
+
+    Returns:
+        Tuple of (DataFrame of new and changed rows, number of new rows, (id, release_date)
+        of stored rows whose release date changed, (id, popularity) of tracks whose
+        popularity is new or changed)
+    """
+    ids = column_values(df['id'])
+    popularities = column_values(df['popularity'])
+    changed = np.fromiter((track_id not in stored for track_id in ids), dtype=bool, count=len(ids))
+    new = int(changed.sum())
+    popularity_changes = [(ids[i], popularities[i]) for i in changed.nonzero()[0]]
+    moved = []
+    
+    # Only tracks that are already loaded need a row by row comparison
+    if new < len(ids):
+        release_dates = column_values(df['release_date'])
+        row_hashes = column_values(df['row_hash'])
+        for i in (~changed).nonzero()[0]:
+            stored_date, stored_popularity, stored_hash = stored[ids[i]]
+            if stored_hash == row_hashes[i]:
+                continue  # Unchanged, nothing to send
+            changed[i] = True
+            # release_date is part of the primary key, a moved track would otherwise get a second row
+            if str(stored_date) != str(release_dates[i]):
+                moved.append((ids[i], stored_date))
+            if stored_popularity != popularities[i]:
+                popularity_changes.append((ids[i], popularities[i]))
+    
+    return df[changed], new, moved, popularity_changes
+
+def release_months(df, moved=()):
+    """
+    Release months ('YYYY-MM') whose summary rows a write changes: those of the rows in `df`
+    and the old month of each moved track, (id, release_date) as returned by diff_tracks
+    """
+    months = {str(release_date)[:7] for _, release_date in moved}
+    if not df.empty:
+        months.update(np.unique(df['release_date'].to_numpy().astype('datetime64[M]')).astype(str).tolist())
+    return months
+
+def bump_cache_generation(cursor):
+    """
+    Invalidate the cached query results of query_api.py, in the transaction that changes
+    the rows they were read from. Run it last before the commit, every loader updates the
+    same row and holds its lock until it commits.
+    """
+    cursor.execute("UPDATE cache_generation SET generation = generation + 1 WHERE name = 'tracks'")
+    recorder.record_db_round_trips()
+
+def record_popularity_history(cursor, popularity_changes):
+    """Append today's popularity of new / changed tracks to track_popularity_history"""
+    if popularity_changes:
+        cursor.executemany("""
+            INSERT INTO track_popularity_history (track_id, observed_on, popularity)
+            VALUES (%s, CURRENT_DATE, %s) AS new
+            ON DUPLICATE KEY UPDATE popularity = new.popularity
+        """, popularity_changes)
+        recorder.record_db_round_trips()
+
+def insert_tracks(cursor, df):
+    """
+    Upsert a transformed DataFrame into the tracks table, existing ids get the DataFrame's values
+
+    Returns:
+        Tuple of (rows attempted, rows affected)
+    """
+    # write_tracks only sends new and changed rows, so the update never rewrites an unchanged track
+    insert_query = f"""
+    INSERT INTO tracks 
+    ({', '.join(TRACK_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(TRACK_COLUMNS))}) AS new
+    ON DUPLICATE KEY UPDATE {UPSERT_ASSIGNMENTS}
+    """
+
+    # Rows go straight from the DataFrame's table columns to tuples
+    data_tuples = track_tuples(df)
+    
+    # Use executemany for better performance (the connector sends it as one multi-row INSERT)
+    cursor.executemany(insert_query, data_tuples)
+    recorder.record_db_round_trips()
+    
+    return len(data_tuples), cursor.rowcount
+
+def bulk_load_tracks(cursor, df):
+    """
+    Fast path: stream the DataFrame through a temporary CSV and LOAD DATA LOCAL INFILE
+    into a staging table, then merge it into tracks with one set-based INSERT ... SELECT
+    
+    Returns:
+        Tuple of (rows attempted, rows affected)
+    """
+    columns = ', '.join(TRACK_COLUMNS)
+    
+    # Staging table lives for the session only and is emptied for every chunk. Temporary
+    # tables can't be partitioned, so copy the columns only, not LIKE tracks. Not IF NOT EXISTS,
+    # its note on every later chunk fails with raise_on_warnings
+    try:
+        cursor.execute("CREATE TEMPORARY TABLE tracks_staging SELECT * FROM tracks LIMIT 0")
+    except Error as e:
+        if e.errno != 1050:  # Already created earlier in this session
+            raise e
+    cursor.execute("TRUNCATE TABLE tracks_staging")
+    
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8', newline='') as f:
+        df.to_csv(f, columns=[FRAME_COLUMNS.get(column, column) for column in TRACK_COLUMNS], header=False,
+                  index=False, lineterminator='\n')
+        path = f.name
+    
+    try:
+        cursor.execute(f"""
+        LOAD DATA LOCAL INFILE '{path.replace(os.sep, '/')}'
+        INTO TABLE tracks_staging
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+        LINES TERMINATED BY '\\n'
+        ({columns})
+        """)
         
-        # Get current count before insertion for comparison
-        cursor.execute("SELECT COUNT(*) FROM tracks")
-        count_before = cursor.fetchone()[0]
-        print(f"✓ Current records in database: {count_before}")
-        if logger:
-            logger.info(f"Current records in database: {count_before}")
+        # Existing ids are updated, same as the executemany path
+        cursor.execute(f"""
+        INSERT INTO tracks ({columns})
+        SELECT {columns} FROM tracks_staging new
+        ON DUPLICATE KEY UPDATE {UPSERT_ASSIGNMENTS}
+        """)
+        inserted = cursor.rowcount
+        recorder.record_db_round_trips(4)
+    finally:
+        os.remove(path)
+    
+    return len(df), inserted
+
+def write_tracks(connection, cursor, df, chunk_size=5000, method='executemany', logger=None, checkpoint=None,
+                 popularity_history=False, months=None):
+    """
+    Write a transformed DataFrame to the tracks table in chunks, committing after each
+    one so no single transaction holds locks for the whole load
+    
+    Each chunk is diffed against the row_hash of its tracks already in the table, and
+    only new and changed rows are sent, so write volume follows the rate of change.
+    With a run checkpoint, chunks committed by an earlier attempt of the run are
+    skipped and newly committed ones are recorded.
+    
+    Args:
+        connection: Open MySQL connection
+        cursor: Cursor on that connection, with spotify_db selected
+        df: Transformed pandas DataFrame
+        chunk_size: Rows per chunk / transaction
+        method: 'executemany' (multi-row INSERT) or 'infile' (LOAD DATA LOCAL INFILE + merge)
+        logger: Logger instance for logging
+        checkpoint: Optional RunCheckpoint (utils/checkpoint.py)
+        popularity_history: Also append new and changed popularity values to track_popularity_history
+        months: Optional set, gets the release months of every committed chunk's new, changed and
+            moved rows (see release_months). A chunk skipped thanks to the checkpoint adds all of
+            its months, what the earlier attempt changed is not known.
+    
+    Returns:
+        Tuple of (rows attempted, rows inserted, rows updated)
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Unknown load method: {method}")
+    write_chunk = bulk_load_tracks if method == 'infile' else insert_tracks
+    
+    attempted = 0
+    inserted = 0
+    updated = 0
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        if checkpoint is not None:
+            chunk_key = checkpoint.chunk_key(chunk)
+            if checkpoint.is_chunk_done('load', chunk_key):
+                attempted += len(chunk)
+                if months is not None:
+                    months.update(release_months(chunk))
+                if logger:
+                    logger.info(f"Skipping chunk of {len(chunk)} records, already loaded by an earlier attempt")
+                continue
         
+        changed, chunk_inserted, moved, popularity_changes = diff_tracks(
+            chunk, fetch_stored_tracks(cursor, chunk['id'].tolist()))
+        if moved:
+            cursor.executemany("DELETE FROM tracks WHERE id = %s AND release_date = %s", moved)
+            recorder.record_db_round_trips()
+        if not changed.empty:
+            write_chunk(cursor, changed)
+            if 'artist_ids' in changed:
+                insert_track_artists(cursor, changed)
+        if popularity_history:
+            record_popularity_history(cursor, popularity_changes)
+        written = moved or not changed.empty
+        if written:
+            bump_cache_generation(cursor)
+        connection.commit()
+        recorder.record_db_round_trips()
+        if written:
+            note_load()
+            if months is not None:
+                months.update(release_months(changed, moved))
+        if checkpoint is not None:
+            checkpoint.mark_chunk_done('load', chunk_key)
+        chunk_updated = len(changed) - chunk_inserted
+        recorder.add_rows(len(chunk))
+        attempted += len(chunk)
+        inserted += chunk_inserted
+        updated += chunk_updated
+        if logger:
+            logger.info(f"Committed chunk of {len(chunk)} records ({chunk_inserted} new, {chunk_updated} changed)")
+    
+    return attempted, inserted, updated
 
-        # Insert data using batch insert (more efficient than row by row)
-        # Insert data using ON DUPLICATE KEY UPDATE for incremental loading (effectively ignoring duplicate key rows)
-        insert_query = """
-        INSERT INTO tracks 
-        (id, track_name, artist_name, artist_count, release_date, duration_min, 
-         popularity, cover_image_url, album_type, total_streams, danceability, tempo)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE id=id
-        """
+def count_tracks(cursor):
+    """Current number of rows in the tracks table"""
+    cursor.execute("SELECT COUNT(*) FROM tracks")
+    recorder.record_db_round_trips()
+    return cursor.fetchone()[0]
 
-        # Convert DataFrame to list of tuples for batch insert
-        data_tuples = [tuple(row) for row in df_copy.values]
+@recorder.timed('known_ids')
+def fetch_loaded_track_ids(logger=None, batch_size=50000):
+    """
+    Read the ids already in spotify_db.tracks, used to skip known tracks in incremental runs
+    
+    Args:
+        logger: Logger instance for logging
+        batch_size: Rows fetched per round trip
+    
+    Returns:
+        Set of track ids
+    """
+    connection = None
+    cursor = None
+    known_ids = set()
+    
+    try:
+        connection = get_connection(logger)
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM tracks")
+        recorder.record_db_round_trips()
         
-        # Use executemany for better performance
-        cursor.executemany(insert_query, data_tuples)
+        # Fetch in batches so the driver never materialises the whole result twice
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            recorder.record_db_round_trips()
+            if not rows:
+                break
+            known_ids.update(row[0] for row in rows)
         
-        connection.commit()
+        print(f"✓ {len(known_ids)} tracks already loaded")
+        if logger:
+            logger.info(f"{len(known_ids)} tracks already loaded")
+    
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+    
+    return known_ids
+
+@recorder.timed('load', count_rows=False)
+def load_dataset(df, logger=None, chunk_size=5000, method='executemany', checkpoint=None, popularity_history=False,
+                 months=None):
+    """
+    Load pandas DataFrame to MySQL database using incremental loading
+    
+    Rows are committed chunk by chunk, if a chunk fails the chunks before it stay loaded.
+    
+    Args:
+        df: Transformed pandas DataFrame
+        logger: Logger instance for logging
+        chunk_size: Rows per chunk / transaction
+        method: 'executemany' or 'infile', see write_tracks
+        checkpoint: Optional RunCheckpoint, see write_tracks
+        popularity_history: Record popularity changes, see write_tracks
+        months: Optional set of release months written to, see write_tracks
+    
+    Returns:
+        Boolean indicating success
+    """
+    
+    if df.empty:
+        print("Cannot load empty dataset")
+        if logger:
+            logger.error("Cannot load empty dataset")
+        return False, 0
+    
+    connection = None
+    cursor = None
+    
+    try:
+        print("=== Loading to MySQL Database ===")
+        if logger:
+            logger.info("=== Loading to MySQL Database ===")
+        
+        # Pooled connection, schema already checked when the pool was created
+        connection = get_connection(logger, allow_local_infile=(method == 'infile'))
+        cursor = connection.cursor()
+        
+        # Get current count before insertion for comparison
+        count_before = count_tracks(cursor)
+        print(f"✓ Current records in database: {count_before}")
+        if logger:
+            logger.info(f"Current records in database: {count_before}")
+        
+        attempted, inserted, updated = write_tracks(connection, cursor, df, chunk_size=chunk_size, method=method,
+                                                    logger=logger, checkpoint=checkpoint,
+                                                    popularity_history=popularity_history, months=months)
         
-        print(f"✓ Attempted to insert {len(data_tuples)} records")
-        print(f"✓ Actually inserted {cursor.rowcount} unique new records")
+        print(f"✓ Attempted to insert {attempted} records")
+        print(f"✓ Actually inserted {inserted} unique new records")
+        print(f"✓ Updated {updated} changed records")
         if logger:
-            logger.info(f"Attempted to insert {len(data_tuples)} records")
-            logger.info(f"Actually inserted {cursor.rowcount} unique new records")
+            logger.info(f"Attempted to insert {attempted} records")
+            logger.info(f"Actually inserted {inserted} unique new records")
+            logger.info(f"Updated {updated} changed records")
         
         # Quick verification
-        cursor.execute("SELECT COUNT(*) FROM tracks")
-        count_after = cursor.fetchone()[0]
+        count_after = count_tracks(cursor)
         print(f"✓ Total records in database: {count_after}")
         if logger:
             logger.info(f"Total records in database: {count_after}")
@@ -156,69 +673,348 @@ def load_dataset(df, logger=None):
         return False, 0
         
     finally:
-        # Ensure connections are properly closed
+        # Ensure connections are returned to the pool
         if cursor:
             cursor.close()
-        if connection and connection.is_connected():
+        if connection:
             connection.close()
-            print("✓ Database connection closed")
+            print("✓ Database connection returned to pool")
             if logger:
-                logger.info("Database connection closed")
+                logger.info("Database connection returned to pool")
 
-# For logging ETL run info to log table in database
-def log_etl_run(run_data, logger=None):
+@recorder.timed('load', count_rows=False)
+def load_dataset_stream(chunks, logger=None, chunk_size=5000, method='executemany', checkpoint=None,
+                        popularity_history=False, months=None):
     """
-    Log ETL run information to the database
+    Load an iterable of transformed DataFrame chunks, committing after each chunk
+    
+    Chunks are written as they arrive, so loading starts before extraction has
+    finished. Chunks committed before an error stay in the database.
     
     Args:
-        connection: MySQL connection object
-        run_data: Dictionary containing log data
+        chunks: Iterable of transformed pandas DataFrames
         logger: Logger instance for logging
-    """
-
-    # Database connection parameters
-    config = {
-        'user': os.getenv('MYSQL_USER', 'root'),
-        'password': os.getenv('MYSQL_PASSWORD'),
-        'host': os.getenv('MYSQL_HOST', 'localhost'),
-        'raise_on_warnings': True
-    }
+        chunk_size: Maximum rows per transaction
+        method: 'executemany' or 'infile', see write_tracks
+        checkpoint: Optional RunCheckpoint, see write_tracks
+        popularity_history: Record popularity changes, see write_tracks
+        months: Optional set of release months written to, see write_tracks
     
-    # Get password if not in environment
-    if not config['password']:
-        config['password'] = input("Enter MySQL root password: ")
+    Returns:
+        Tuple of (success, count of new records)
+    """
     
     connection = None
     cursor = None
+    
     try:
-        connection = mysql.connector.connect(**config)
+        print("=== Streaming load to MySQL Database ===")
+        if logger:
+            logger.info("=== Streaming load to MySQL Database ===")
+        
+        connection = get_connection(logger, allow_local_infile=(method == 'infile'))
         cursor = connection.cursor()
         
-        cursor.execute("USE spotify_db")
-
-        # Check if etl_log table exists, create if it doesn't
-        create_log_query="""
-            CREATE TABLE etl_log (
-                log_id INT AUTO_INCREMENT PRIMARY KEY,
-                run_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status ENUM('success', 'failure') NOT NULL,
-                extract_status ENUM('success', 'failure'),
-                transform_status ENUM('success', 'failure'),
-                load_status ENUM('success', 'failure'),
-                tracks_extracted INT,
-                tracks_loaded INT,
-                error_message TEXT,
-                duration_seconds FLOAT
-            )
-        """
+        count_before = count_tracks(cursor)
+        print(f"✓ Current records in database: {count_before}")
+        if logger:
+            logger.info(f"Current records in database: {count_before}")
+        
+        attempted = 0
+        for df in chunks:
+            if df.empty:
+                continue
+            chunk_attempted, chunk_inserted, chunk_updated = write_tracks(
+                connection, cursor, df, chunk_size=chunk_size, method=method, checkpoint=checkpoint,
+                popularity_history=popularity_history, months=months)
+            attempted += chunk_attempted
+            print(f"✓ Chunk loaded: {chunk_inserted} new, {chunk_updated} changed of {chunk_attempted} records")
+            if logger:
+                logger.info(f"Chunk loaded: {chunk_inserted} new, {chunk_updated} changed of {chunk_attempted} records")
+        
+        if attempted == 0:
+            print("No records to load")
+            if logger:
+                logger.warning("No records to load")
+            return False, 0
+        
+        count_after = count_tracks(cursor)
+        print(f"✓ Attempted to insert {attempted} records")
+        print(f"✓ Total records in database: {count_after}")
+        if logger:
+            logger.info(f"Attempted to insert {attempted} records")
+            logger.info(f"Total records in database: {count_after}")
+        
+        return True, count_after - count_before
+        
+    except Error as e:
+        print(f"Error loading data to MySQL: {e}")
+        if logger:
+            logger.error(f"Error loading data to MySQL: {e}")
+        if connection:
+            connection.rollback()
+        return False, 0
+        
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+            print("✓ Database connection returned to pool")
+            if logger:
+                logger.info("Database connection returned to pool")
+
+def load_dataset_concurrent(chunks, logger=None, chunk_size=5000, method='executemany', checkpoint=None,
+                            num_loaders=2, queue_size=4, popularity_history=False, months=None):
+    """
+    Producer/consumer version of load_dataset_stream
+    
+    The calling thread pulls chunks from `chunks` (running extraction and transform
+    as it goes) and puts them on a bounded queue. `num_loaders` threads take them off
+    and write them to MySQL, each on its own pooled connection. When the loaders fall
+    behind, the full queue blocks the producer, so at most `queue_size` chunks wait in
+    memory. Chunks committed before an error stay in the database.
+    
+    Args:
+        chunks: Iterable of transformed pandas DataFrames
+        logger: Logger instance for logging
+        chunk_size: Maximum rows per transaction
+        method: 'executemany' or 'infile', see write_tracks
+        checkpoint: Optional RunCheckpoint, see write_tracks
+        num_loaders: Loader threads, keep below MYSQL_POOL_SIZE
+        queue_size: Maximum chunks waiting for a loader
+        popularity_history: Record popularity changes, see write_tracks
+        months: Optional set of release months written to, see write_tracks
+    
+    Returns:
+        Tuple of (success, count of new records)
+    """
+    print(f"=== Concurrent load to MySQL Database ({num_loaders} loaders) ===")
+    if logger:
+        logger.info(f"=== Concurrent load to MySQL Database ({num_loaders} loaders) ===")
+    
+    allow_local_infile = (method == 'infile')
+    
+    def count_pooled():
+        connection = get_connection(logger, allow_local_infile=allow_local_infile)
+        cursor = connection.cursor()
         try:
-            cursor.execute(create_log_query)
-        except mysql.connector.Error as e:
-            if e.errno == 1050:  # Table already exists
+            return count_tracks(cursor)
+        finally:
+            cursor.close()
+            connection.close()
+    
+    try:
+        count_before = count_pooled()
+    except Error as e:
+        print(f"Error loading data to MySQL: {e}")
+        if logger:
+            logger.error(f"Error loading data to MySQL: {e}")
+        return False, 0
+    print(f"✓ Current records in database: {count_before}")
+    if logger:
+        logger.info(f"Current records in database: {count_before}")
+    
+    work = queue.Queue(maxsize=queue_size)
+    failed = threading.Event()
+    errors = []
+    totals = {'attempted': 0}
+    totals_lock = threading.Lock()
+    
+    def loader():
+        connection = None
+        cursor = None
+        try:
+            connection = get_connection(logger, allow_local_infile=allow_local_infile)
+            cursor = connection.cursor()
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+        
+        while True:
+            df = work.get()
+            if df is None:
+                break
+            if failed.is_set():
+                continue  # Keep draining so the producer never blocks on a full queue
+            try:
+                with recorder.stage('load'):
+                    chunk_attempted, chunk_inserted, chunk_updated = write_tracks(
+                        connection, cursor, df, chunk_size=chunk_size, method=method, checkpoint=checkpoint,
+                        popularity_history=popularity_history, months=months)
+                with totals_lock:
+                    totals['attempted'] += chunk_attempted
+                print(f"✓ Chunk loaded: {chunk_inserted} new, {chunk_updated} changed of {chunk_attempted} records")
                 if logger:
-                    logger.info("Table 'etl_log' already exists")
-            else:
-                raise e  # Re-raise if it's a different error
+                    logger.info(f"Chunk loaded: {chunk_inserted} new, {chunk_updated} changed of {chunk_attempted} records")
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+                try:
+                    connection.rollback()
+                except Error:
+                    pass
+        
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+    
+    loaders = [threading.Thread(target=loader, name=f'loader-{i}', daemon=True) for i in range(num_loaders)]
+    for thread in loaders:
+        thread.start()
+    
+    blocked = 0.0
+    try:
+        for df in chunks:
+            if failed.is_set():
+                break
+            if df.empty:
+                continue
+            start = time.perf_counter()
+            work.put(df)
+            blocked += time.perf_counter() - start
+    finally:
+        # Let the loaders finish what's queued, even if extraction failed
+        for _ in loaders:
+            work.put(None)
+        for thread in loaders:
+            thread.join()
+    
+    # Time the producer spent blocked means loading is the slowest stage
+    print(f"✓ Producer waited {blocked:.2f}s on a full load queue")
+    if logger:
+        logger.info(f"Producer waited {blocked:.2f}s on a full load queue")
+    
+    if errors:
+        print(f"Error loading data to MySQL: {errors[0]}")
+        if logger:
+            logger.error(f"Error loading data to MySQL: {errors[0]}")
+        return False, 0
+    
+    if totals['attempted'] == 0:
+        print("No records to load")
+        if logger:
+            logger.warning("No records to load")
+        return False, 0
+    
+    count_after = count_pooled()
+    print(f"✓ Attempted to insert {totals['attempted']} records")
+    print(f"✓ Total records in database: {count_after}")
+    if logger:
+        logger.info(f"Attempted to insert {totals['attempted']} records")
+        logger.info(f"Total records in database: {count_after}")
+    
+    return True, count_after - count_before
+
+def fetch_missing_dimension_ids(logger=None):
+    """
+    Artist and album ids referenced by loaded tracks that aren't in the dimension tables yet.
+    Ids Spotify doesn't know have a row with only the id (see enrich.py), so they aren't missing.
+    
+    Returns:
+        Tuple of (artist ids, album ids)
+    """
+    connection = None
+    cursor = None
+    try:
+        connection = get_connection(logger)
+        cursor = connection.cursor()
+        
+        # Anti-joins on the primary keys, no scan of the text columns
+        cursor.execute("""
+        SELECT DISTINCT ta.artist_id FROM track_artists ta
+        LEFT JOIN artists a ON a.artist_id = ta.artist_id
+        WHERE a.artist_id IS NULL
+        """)
+        artist_ids = [row[0] for row in cursor.fetchall()]
+        
+        cursor.execute("""
+        SELECT DISTINCT t.album_id FROM tracks t
+        LEFT JOIN albums al ON al.album_id = t.album_id
+        WHERE t.album_id IS NOT NULL AND al.album_id IS NULL
+        """)
+        album_ids = [row[0] for row in cursor.fetchall()]
+        recorder.record_db_round_trips(2)
+        
+        return artist_ids, album_ids
+    
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+def load_dimensions(artist_rows, album_rows, logger=None):
+    """
+    Upsert rows into the artists and albums tables, see enrich.py for the row layout
+    
+    Returns:
+        Tuple of (artists written, albums written)
+    """
+    connection = None
+    cursor = None
+    try:
+        connection = get_connection(logger)
+        cursor = connection.cursor()
+        
+        if artist_rows:
+            cursor.executemany("""
+            INSERT INTO artists (artist_id, name, popularity, followers, genres, image_url)
+            VALUES (%s, %s, %s, %s, %s, %s) AS new
+            ON DUPLICATE KEY UPDATE name = new.name, popularity = new.popularity,
+                followers = new.followers, genres = new.genres, image_url = new.image_url
+            """, artist_rows)
+            recorder.record_db_round_trips()
+        
+        if album_rows:
+            cursor.executemany("""
+            INSERT INTO albums (album_id, name, album_type, release_date, total_tracks, label, popularity, cover_image_url)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s) AS new
+            ON DUPLICATE KEY UPDATE name = new.name, album_type = new.album_type,
+                release_date = new.release_date, total_tracks = new.total_tracks, label = new.label,
+                popularity = new.popularity, cover_image_url = new.cover_image_url
+            """, album_rows)
+            recorder.record_db_round_trips()
+        
+        if artist_rows or album_rows:
+            bump_cache_generation(cursor)  # Tracks by artist join the artist names
+        connection.commit()
+        recorder.record_db_round_trips()
+        if artist_rows or album_rows:
+            note_load()
+        return len(artist_rows), len(album_rows)
+    
+    except Error as e:
+        if logger:
+            logger.error(f"Error loading artists / albums: {e}")
+        if connection:
+            connection.rollback()
+        raise e
+    
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+# For logging ETL run info to log table in database
+def log_etl_run(run_data, logger=None, stage_metrics=None):
+    """
+    Log ETL run information to the database
+    
+    Args:
+        run_data: Dictionary containing log data
+        logger: Logger instance for logging
+        stage_metrics: Optional list of per-stage metric dicts (MetricsRecorder.to_records()),
+            saved to etl_stage_metrics under the run's log_id
+    """
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_connection(logger)
+        cursor = connection.cursor()
         
         # Insert log record
         insert_query = """
@@ -239,6 +1035,31 @@ def log_etl_run(run_data, logger=None):
             run_data['duration_seconds']
         ))
         
+        if stage_metrics:
+            log_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO etl_stage_metrics
+                (log_id, stage, wall_seconds, rows_processed, rows_per_second, api_calls,
+                 api_latency_avg_ms, api_latency_p95_ms, api_latency_histogram, retries,
+                 rate_limit_wait_seconds, cache_hits, db_round_trips, peak_rss_mb)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, [(
+                log_id,
+                metrics['stage'],
+                metrics['wall_seconds'],
+                metrics['rows_processed'],
+                metrics['rows_per_second'],
+                metrics['api_calls'],
+                metrics['api_latency_avg_ms'],
+                metrics['api_latency_p95_ms'],
+                json.dumps(metrics['api_latency_histogram']),
+                metrics['retries'],
+                metrics['rate_limit_wait_seconds'],
+                metrics['cache_hits'],
+                metrics['db_round_trips'],
+                metrics['peak_rss_mb']
+            ) for metrics in stage_metrics])
+        
         connection.commit()
         if logger:
             logger.info("ETL run logged successfully in database\n")
@@ -263,31 +1084,18 @@ def query_sample_data(limit=5):
     Args:
         limit: Number of records to display
     """
-    load_dotenv()
-    
-    config = {
-        'user': os.getenv('MYSQL_USER', 'root'),
-        'password': os.getenv('MYSQL_PASSWORD'),
-        'host': os.getenv('MYSQL_HOST', 'localhost'),
-        'database': 'spotify_db',
-        'raise_on_warnings': True
-    }
-    
-    if not config['password']:
-        config['password'] = input("Enter MySQL root password: ")
-    
     connection = None
     cursor = None
     
     try:
-        connection = mysql.connector.connect(**config)
+        connection = get_connection()
         cursor = connection.cursor()
         
-        cursor.execute(f"""
+        cursor.execute("""
         SELECT id, track_name, artist_name, popularity, total_streams 
         FROM tracks 
-        LIMIT {limit}
-        """)
+        LIMIT %s
+        """, (int(limit),))
         records = cursor.fetchall()
         
         print(f"\nSample data from database (first {limit} records):")
@@ -301,7 +1109,7 @@ def query_sample_data(limit=5):
     finally:
         if cursor:
             cursor.close()
-        if connection and connection.is_connected():
+        if connection:
             connection.close()
 
 # Testing
@@ -0,0 +1,261 @@
+# Schema migrations for spotify_db
+#
+# load.ensure_schema creates the original (version 0) tables, then migrate() applies every
+# migration newer than the highest version recorded in the schema_version table, so a
+# database created by an older release is upgraded in place the next time the ETL runs.
+#
+# Usage: python migrations.py   (apply pending migrations and print the schema history)
+
+import time
+
+import mysql.connector
+
+# Spotify ids are 22 base62 characters, and case matters
+SPOTIFY_ID = "CHAR(22) CHARACTER SET ascii COLLATE ascii_bin"
+
+# tracks gets one partition per release year from this year on, older tracks share p_old
+FIRST_PARTITION_YEAR = 2000
+
+def year_partition_definitions(first_year, through_year):
+    """PARTITION definitions for the release years first_year..through_year"""
+    return [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in range(first_year, through_year + 1)]
+
+def tracks_partitioning(through_year):
+    """PARTITION BY clause for tracks, with a catch-all partition for years after through_year"""
+    partitions = (
+        [f"PARTITION p_old VALUES LESS THAN ({FIRST_PARTITION_YEAR})"]
+        + year_partition_definitions(FIRST_PARTITION_YEAR, through_year)
+        + ["PARTITION p_future VALUES LESS THAN MAXVALUE"]
+    )
+    return f"PARTITION BY RANGE (YEAR(release_date)) ({', '.join(partitions)})"
+
+# Measure columns shared by the summary tables. They are sums (averages are sum / track_count)
+# so the coarser summaries, and any grouping a dashboard does, can roll them up.
+SUMMARY_MEASURES = """
+            track_count INT UNSIGNED NOT NULL,
+            total_streams BIGINT UNSIGNED NOT NULL,
+            popularity_sum INT UNSIGNED NOT NULL,
+            duration_min_sum DOUBLE NOT NULL,
+            danceability_sum INT UNSIGNED NOT NULL,
+            tempo_sum DOUBLE NOT NULL,
+            popularity_0_19 INT UNSIGNED NOT NULL,
+            popularity_20_39 INT UNSIGNED NOT NULL,
+            popularity_40_59 INT UNSIGNED NOT NULL,
+            popularity_60_79 INT UNSIGNED NOT NULL,
+            popularity_80_100 INT UNSIGNED NOT NULL,
+            refreshed_at DATETIME DEFAULT CURRENT_TIMESTAMP""".strip()
+
+# (version, description, statements), applied in order. Never edit a released migration,
+# add a new one instead.
+MIGRATIONS = [
+    (1, "Right-size id and text columns", [
+        f"""
+        ALTER TABLE tracks
+            MODIFY id {SPOTIFY_ID} NOT NULL,
+            MODIFY track_name VARCHAR(512),
+            MODIFY artist_name VARCHAR(1024),
+            MODIFY artist_count SMALLINT UNSIGNED,
+            MODIFY popularity TINYINT UNSIGNED,
+            MODIFY cover_image_url VARCHAR(255),
+            MODIFY album_type VARCHAR(20),
+            MODIFY album_id {SPOTIFY_ID}
+        """,
+        f"""
+        ALTER TABLE artists
+            MODIFY artist_id {SPOTIFY_ID} NOT NULL,
+            MODIFY name VARCHAR(512),
+            MODIFY popularity TINYINT UNSIGNED,
+            MODIFY genres VARCHAR(1024),
+            MODIFY image_url VARCHAR(255)
+        """,
+        f"""
+        ALTER TABLE albums
+            MODIFY album_id {SPOTIFY_ID} NOT NULL,
+            MODIFY name VARCHAR(512),
+            MODIFY album_type VARCHAR(20),
+            MODIFY label VARCHAR(512),
+            MODIFY popularity TINYINT UNSIGNED,
+            MODIFY cover_image_url VARCHAR(255)
+        """,
+        f"""
+        ALTER TABLE track_artists
+            MODIFY track_id {SPOTIFY_ID} NOT NULL,
+            MODIFY artist_id {SPOTIFY_ID} NOT NULL,
+            MODIFY artist_position TINYINT UNSIGNED NOT NULL
+        """
+    ]),
+    (2, "Index tracks on the dashboard filters", [
+        """
+        ALTER TABLE tracks
+            ADD INDEX idx_tracks_release_date (release_date),
+            ADD INDEX idx_tracks_popularity (popularity),
+            ADD INDEX idx_tracks_album_type (album_type)
+        """
+    ]),
+    # Every unique key of a partitioned table has to include the partitioning column, so the
+    # primary key becomes (id, release_date). A track's release date comes from its album and
+    # doesn't change, so duplicate ids still collide on the insert.
+    (3, "Partition tracks by release year", [
+        "ALTER TABLE tracks MODIFY release_date DATE NOT NULL, DROP PRIMARY KEY, ADD PRIMARY KEY (id, release_date)",
+        f"ALTER TABLE tracks {tracks_partitioning(time.localtime().tm_year + 1)}"
+    ]),
+    # Pre-aggregated tracks for the BI dashboards, kept up to date by summaries.py
+    (4, "Summary tables", [
+        f"""
+        CREATE TABLE summary_by_month (
+            release_month DATE NOT NULL,
+            album_type VARCHAR(20) NOT NULL,
+            artist_count SMALLINT UNSIGNED NOT NULL,
+            {SUMMARY_MEASURES},
+            PRIMARY KEY (release_month, album_type, artist_count)
+        )
+        """,
+        f"""
+        CREATE TABLE summary_by_album_type (
+            album_type VARCHAR(20) NOT NULL PRIMARY KEY,
+            {SUMMARY_MEASURES}
+        )
+        """,
+        f"""
+        CREATE TABLE summary_by_artist_count (
+            artist_count SMALLINT UNSIGNED NOT NULL PRIMARY KEY,
+            {SUMMARY_MEASURES}
+        )
+        """
+    ]),
+    # Tracks loaded before this have no hash yet, the next load that sees them rewrites them once
+    (5, "Row hashes and popularity history", [
+        "ALTER TABLE tracks ADD COLUMN row_hash BIGINT",
+        f"""
+        CREATE TABLE track_popularity_history (
+            track_id {SPOTIFY_ID} NOT NULL,
+            observed_on DATE NOT NULL,
+            popularity TINYINT UNSIGNED NOT NULL,
+            PRIMARY KEY (track_id, observed_on)
+        )
+        """
+    ]),
+    # Bumped by every load that writes tracks, artists or albums, query_api.py caches results per generation
+    (6, "Query cache generation", [
+        """
+        CREATE TABLE cache_generation (
+            name VARCHAR(32) NOT NULL PRIMARY KEY,
+            generation BIGINT UNSIGNED NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        "INSERT INTO cache_generation (name, generation) VALUES ('tracks', 0)"
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def ensure_version_table(cursor, logger=None):
+    """Create the schema_version table if it doesn't exist yet"""
+    create_version_query = """
+        CREATE TABLE schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            duration_seconds FLOAT
+        )
+    """
+    try:
+        cursor.execute(create_version_query)
+        if logger:
+            logger.info("Table 'schema_version' created")
+    except mysql.connector.Error as e:
+        if e.errno != 1050:  # Table already exists
+            raise e
+
+def current_version(cursor):
+    """Highest migration applied to the current database, 0 for an unmigrated one"""
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+def ensure_year_partitions(cursor, through_year, logger=None):
+    """
+    Split yearly partitions off p_future until there is one for through_year, so a
+    new release year doesn't pile up in the catch-all partition
+
+    Does nothing while tracks isn't partitioned yet.
+    """
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tracks' AND PARTITION_NAME IS NOT NULL
+    """)
+    years = [int(name[1:]) for (name,) in cursor.fetchall() if name[1:].isdigit()]
+    if not years or max(years) >= through_year:
+        return
+
+    new_partitions = year_partition_definitions(max(years) + 1, through_year)
+    cursor.execute(f"""
+        ALTER TABLE tracks REORGANIZE PARTITION p_future INTO (
+            {', '.join(new_partitions)},
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+    """)
+    print(f"✓ Added tracks partitions for {max(years) + 1}-{through_year}")
+    if logger:
+        logger.info(f"Added tracks partitions for {max(years) + 1}-{through_year}")
+
+def migrate(connection, cursor, logger=None):
+    """
+    Bring the current database up to LATEST_VERSION
+
+    Backfill processes start at the same time, so migrations run under a named lock
+    and the version is re-read once it's held.
+
+    Returns:
+        Schema version after migrating
+    """
+    ensure_version_table(cursor, logger)
+    cursor.execute("SELECT GET_LOCK('spotify_db_migrations', 600)")
+    if cursor.fetchone()[0] != 1:
+        raise RuntimeError("Timed out waiting for another process to finish migrating")
+
+    try:
+        version = current_version(cursor)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"Applying schema migration {number}: {description}")
+            if logger:
+                logger.info(f"Applying schema migration {number}: {description}")
+            start_time = time.time()
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, duration_seconds) VALUES (%s, %s, %s)",
+                (number, description, time.time() - start_time)
+            )
+            connection.commit()
+            version = number
+
+        ensure_year_partitions(cursor, time.localtime().tm_year + 1, logger)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('spotify_db_migrations')")
+        cursor.fetchone()
+
+    print(f"✓ Schema version {version}")
+    if logger:
+        logger.info(f"Schema version {version}")
+    return version
+
+def main():
+    # The first connection of a process runs ensure_schema, which migrates
+    from load import get_connection
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT version, description, applied_at, duration_seconds FROM schema_version ORDER BY version")
+        for version, description, applied_at, duration_seconds in cursor.fetchall():
+            print(f"{version:>3}  {applied_at}  {duration_seconds or 0:8.1f}s  {description}")
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
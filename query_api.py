@@ -0,0 +1,183 @@
+# Query API over the loaded tracks, for the dashboard service and ad-hoc scripts
+#
+# Every query is a named statement whose values are passed as parameters, never formatted
+# into the SQL text, and runs on a pooled connection (load.get_connection). At most
+# MYSQL_POOL_SIZE queries hold a connection at once, later callers wait for one. Results
+# go through a read-through cache (utils/query_cache.py): an in-process LRU, optionally backed
+# by Redis, keyed by the cache generation that every load bumps. Repeated dashboard reads are
+# answered from the cache until the next load changes the tables.
+#
+# Usage: python query_api.py top [--limit 10]
+#        python query_api.py year 2023 [--limit 10]
+#        python query_api.py artist "Taylor Swift" [--limit 10]
+
+import argparse
+import os
+import threading
+from datetime import date
+
+from dotenv import load_dotenv
+from mysql.connector import Error
+
+from load import get_connection
+from utils.metrics import recorder
+from utils.query_cache import QueryCache
+
+TRACK_FIELDS = "t.id, t.track_name, t.artist_name, t.release_date, t.popularity, t.total_streams, t.album_type"
+
+# Named queries, values are passed as parameters
+QUERIES = {
+    'top_tracks': f"""
+        SELECT {TRACK_FIELDS} FROM tracks t
+        ORDER BY t.popularity DESC, t.total_streams DESC
+        LIMIT %s
+    """,
+    # A range on release_date, so only the year's partition and index range are read
+    'tracks_by_year': f"""
+        SELECT {TRACK_FIELDS} FROM tracks t
+        WHERE t.release_date >= %s AND t.release_date < %s
+        ORDER BY t.popularity DESC, t.total_streams DESC
+        LIMIT %s
+    """,
+    'tracks_by_artist': f"""
+        SELECT {TRACK_FIELDS} FROM artists a
+        JOIN track_artists ta ON ta.artist_id = a.artist_id
+        JOIN tracks t ON t.id = ta.track_id
+        WHERE a.name = %s
+        ORDER BY t.popularity DESC, t.total_streams DESC
+        LIMIT %s
+    """,
+}
+
+# Query cache shared by every caller in this process, created on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+# Pooled connections checked out by this module, created on first use
+_checkouts = None
+_checkouts_lock = threading.Lock()
+
+def checkout_slots():
+    """
+    Semaphore sized like the connection pool. An exhausted pool raises PoolError instead of
+    waiting, so callers past MYSQL_POOL_SIZE wait here for a connection to come back.
+    """
+    global _checkouts
+    with _checkouts_lock:
+        if _checkouts is None:
+            load_dotenv()
+            _checkouts = threading.BoundedSemaphore(int(os.getenv('MYSQL_POOL_SIZE', 5)))
+        return _checkouts
+
+def fetch_generation():
+    """Current cache generation, bumped by every load (see load.bump_cache_generation)"""
+    with checkout_slots():
+        connection = get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT generation FROM cache_generation WHERE name = 'tracks'")
+            row = cursor.fetchone()
+            recorder.record_db_round_trips()
+            return row[0] if row else 0
+        finally:
+            cursor.close()
+            connection.close()
+
+def get_query_cache():
+    """
+    Query cache of this process from the environment, None if QUERY_CACHE=none
+
+    QUERY_CACHE is 'memory' (default) or 'redis' (in-process LRU in front of REDIS_URL).
+    """
+    global _cache
+    with _cache_lock:
+        backend = os.getenv('QUERY_CACHE', 'memory')
+        if backend == 'none':
+            return None
+        if _cache is None:
+            if backend not in ('memory', 'redis'):
+                raise ValueError(f"Unknown query cache backend: {backend}")
+            _cache = QueryCache(
+                fetch_generation,
+                max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 1000)),
+                redis_url=os.getenv('REDIS_URL', 'redis://localhost:6379/0') if backend == 'redis' else None,
+                ttl=int(os.getenv('QUERY_CACHE_TTL', 3600)),
+                check_interval=float(os.getenv('QUERY_CACHE_CHECK_INTERVAL', 1.0))
+            )
+        return _cache
+
+def json_value(value):
+    """Dates as ISO strings, so a result is the same whether it came from MySQL or Redis"""
+    return value.isoformat() if isinstance(value, date) else value
+
+def execute_query(name, params):
+    """
+    Run a named query on a pooled connection, bypassing the cache
+
+    Returns:
+        List of dictionaries, one per row
+    """
+    # A plain cursor: a prepared one would prepare and close the statement on every call,
+    # three round trips instead of one
+    with checkout_slots():
+        connection = get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(QUERIES[name], params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, map(json_value, row))) for row in cursor.fetchall()]
+            recorder.record_db_round_trips()
+            return rows
+        finally:
+            cursor.close()
+            connection.close()
+
+def run_query(name, params):
+    """Run a named query through the query cache, see execute_query"""
+    cache = get_query_cache()
+    if cache is None:
+        return execute_query(name, params)
+    return cache.get_or_compute(name, params, lambda: execute_query(name, params))
+
+def top_tracks(limit=50):
+    """Most popular tracks"""
+    return run_query('top_tracks', (int(limit),))
+
+def tracks_by_year(year, limit=100):
+    """Most popular tracks released in `year`"""
+    year = int(year)
+    return run_query('tracks_by_year', (date(year, 1, 1), date(year + 1, 1, 1), int(limit)))
+
+def tracks_by_artist(artist_name, limit=100):
+    """Most popular tracks credited to the artist named `artist_name` (needs ENRICH for the names)"""
+    return run_query('tracks_by_artist', (str(artist_name), int(limit)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the loaded tracks")
+    subparsers = parser.add_subparsers(dest='query', required=True)
+    subparsers.add_parser('top', help='most popular tracks')
+    subparsers.add_parser('year', help='most popular tracks of a release year').add_argument('year', type=int)
+    subparsers.add_parser('artist', help='most popular tracks of an artist').add_argument('artist_name')
+    for subparser in subparsers.choices.values():
+        subparser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        if args.query == 'top':
+            rows = top_tracks(args.limit)
+        elif args.query == 'year':
+            rows = tracks_by_year(args.year, args.limit)
+        else:
+            rows = tracks_by_artist(args.artist_name, args.limit)
+    except Error as e:
+        print(f"Error querying data: {e}")
+        return
+
+    for row in rows:
+        print(f"{row['release_date']} | Pop: {row['popularity']:>3} | Streams: {row['total_streams']:>12,} | "
+              f"{row['track_name']} - {row['artist_name']}")
+    print(f"{len(rows)} tracks")
+
+
+if __name__ == "__main__":
+    main()
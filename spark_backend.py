@@ -0,0 +1,284 @@
+# Optional PySpark execution backend for catalog-scale runs
+#
+# The pandas path (transform.py / load.py) stays the default. With BACKEND = 'spark' in
+# etl.py, raw track JSON is parallelized across local cores, flattened and transformed
+# with native Spark column expressions, and written to MySQL by parallel JDBC writers.
+
+import json
+import os
+import uuid
+
+from mysql.connector import Error
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+from pyspark.sql.types import ArrayType, LongType, StringType, StructField, StructType
+
+from extract import DEFAULT_COVER_IMAGE_URL
+from load import TRACK_COLUMNS, UPSERT_ASSIGNMENTS, bump_cache_generation, count_tracks, get_connection
+from migrations import SPOTIFY_ID
+from transform import HASHED_COLUMNS
+from utils.query_cache import note_load
+
+# Only the fields compact_track uses, so Spark never parses the rest of the JSON
+RAW_TRACK_SCHEMA = StructType([
+    StructField('id', StringType()),
+    StructField('name', StringType()),
+    StructField('duration_ms', LongType()),
+    StructField('popularity', LongType()),
+    StructField('artists', ArrayType(StructType([StructField('id', StringType()), StructField('name', StringType())]))),
+    StructField('album', StructType([
+        StructField('id', StringType()),
+        StructField('album_type', StringType()),
+        StructField('release_date', StringType()),
+        StructField('images', ArrayType(StructType([StructField('url', StringType())]))),
+    ])),
+])
+
+def _long(value):
+    """Spark literal for an unsigned 64-bit constant (stored as the equivalent signed long)"""
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return F.lit(value).cast('long')
+
+def get_spark_session(app_name='spotify_etl', master='local[*]'):
+    """
+    Get or create the Spark session
+
+    Set MYSQL_JDBC_JAR to the mysql-connector-j jar so the JDBC writers can find the driver.
+    """
+    # The seeded feature hashes rely on 64-bit integer arithmetic wrapping around
+    builder = SparkSession.builder.appName(app_name).master(master).config('spark.sql.ansi.enabled', 'false')
+    jdbc_jar = os.getenv('MYSQL_JDBC_JAR')
+    if jdbc_jar:
+        builder = builder.config('spark.jars', jdbc_jar)
+    return builder.getOrCreate()
+
+def create_spark_dataset(spark, tracks, num_partitions=None):
+    """
+    Parallelize raw track dicts across cores and flatten them into the same columns
+    as extract_record_frame
+
+    Args:
+        spark: SparkSession
+        tracks: List of raw track dicts from the search API
+        num_partitions: Number of partitions (defaults to Spark's default parallelism)
+
+    Returns:
+        Spark DataFrame
+    """
+    raw = spark.sparkContext.parallelize([json.dumps(track) for track in tracks], num_partitions)
+    return flatten_raw_tracks(spark.read.schema(RAW_TRACK_SCHEMA).json(raw))
+
+def flatten_raw_tracks(sdf):
+    """Flatten a Spark DataFrame of raw tracks (RAW_TRACK_SCHEMA) into the extract columns"""
+    release_date = F.col('album.release_date')
+    # Tracks missing a field compact_track needs are dropped, like the pandas path does
+    required = ['id', 'name', 'artists', 'duration_ms', 'popularity', 'album.release_date', 'album.album_type']
+    for column in required:
+        sdf = sdf.filter(F.col(column).isNotNull())
+
+    return sdf.select(
+        F.col('id'),
+        F.col('name').alias('track_name'),
+        F.concat_ws(', ', F.col('artists.name')).alias('artist(s)_name'),
+        F.concat_ws(',', F.col('artists.id')).alias('artist_ids'),
+        F.size('artists').alias('artist_count'),
+        # Release date - normalized to YYYY-MM-DD
+        F.when(F.length(release_date) == 10, release_date)
+         .when(F.length(release_date) == 7, F.concat(release_date, F.lit('-01')))
+         .otherwise(F.concat(release_date, F.lit('-01-01'))).alias('release_date'),
+        F.col('duration_ms'),
+        F.col('popularity'),
+        # Cover image with fallback
+        F.when(F.size('album.images') > 0, F.col('album.images').getItem(0).getField('url'))
+         .otherwise(F.lit(DEFAULT_COVER_IMAGE_URL)).alias('cover_image_url'),
+        F.col('album.album_type').alias('album_type'),
+        F.col('album.id').alias('album_id'),
+    )
+
+def _hash_track_id(id_col):
+    """FNV-1a hash of the id as a Spark expression, same keys as transform.hash_track_ids"""
+    return F.aggregate(
+        F.sequence(F.lit(1), F.length(id_col)),
+        _long(0xcbf29ce484222325),
+        lambda key, position: key.bitwiseXOR(F.ascii(id_col.substr(position, F.lit(1))).cast('long')) * _long(0x100000001b3)
+    )
+
+def _uniform(key, stream):
+    """splitmix64 counter-based uniform [0, 1), same values as transform.uniform_from_keys"""
+    z = key + F.lit(stream).cast('long') * _long(0x9E3779B97F4A7C15)
+    z = z.bitwiseXOR(F.shiftrightunsigned(z, 30)) * _long(0xBF58476D1CE4E5B9)
+    z = z.bitwiseXOR(F.shiftrightunsigned(z, 27)) * _long(0x94D049BB133111EB)
+    z = z.bitwiseXOR(F.shiftrightunsigned(z, 31))
+    return F.shiftrightunsigned(z, 11).cast('double') * F.lit(2.0 ** -53)
+
+def transform_dataset_spark(sdf):
+    """
+    Spark version of transform.transform_dataset
+
+    Same duration conversion and the same per-track seeded synthetic features, so a
+    track gets the same values whichever backend processed it (up to rounding ties).
+    """
+    # convert duration_ms into minutes, as MM.SS decimal
+    minutes = F.floor(F.col('duration_ms') / 60000)
+    seconds = (F.col('duration_ms') % 60000) / 1000
+    sdf = sdf.withColumn('duration_ms', F.round(minutes + seconds / 100, 2))
+    sdf = sdf.withColumnRenamed('duration_ms', 'duration_min').withColumnRenamed('artist(s)_name', 'artist_names')
+
+    # Seed every track's variation from its id
+    sdf = sdf.withColumn('_key', _hash_track_id(F.col('id')))
+    popularity = F.col('popularity')
+
+    total_streams = popularity * popularity * 10000 + (F.floor(_uniform(F.col('_key'), 1) * 1000000) - 500000)
+    danceability = (_uniform(F.col('_key'), 2) * 40 - 20) + popularity * 0.8
+    tempo = (_uniform(F.col('_key'), 3) * 80 - 40) + (50 + popularity / 100 * 80)
+
+    return (sdf
+            .withColumn('total_streams', F.greatest(total_streams, F.lit(50000)).cast('long'))
+            .withColumn('danceability', F.round(F.least(F.greatest(danceability, F.lit(25.0)), F.lit(100.0)), 1).cast('int'))
+            .withColumn('tempo', F.round(F.least(F.greatest(tempo, F.lit(50.0)), F.lit(200.0)), 3))
+            # Not the pandas hash, switching backends rewrites each track once
+            .withColumn('row_hash', F.xxhash64(*HASHED_COLUMNS))
+            .drop('_key'))
+
+def load_dataset_spark(sdf, logger=None, num_writers=8, batch_size=5000, popularity_history=False, months=None):
+    """
+    Write a transformed Spark DataFrame to MySQL
+
+    Rows go to a tracks staging table (and their artist links to a track_artists
+    staging table) through `num_writers` parallel JDBC writers, then set-based
+    INSERT ... SELECTs merge them into tracks and track_artists. Like the pandas
+    loader, only rows whose row_hash differs from the stored one are written, and
+    popularity_history appends new / changed popularity values. If `months` is a set,
+    the release months of the written rows and the old month of moved ones are added to it.
+
+    The staging tables are named per run, so concurrent runs never overwrite each other's.
+    Their DDL runs before the merge (MySQL commits implicitly around DDL), the merge and
+    the cache generation bump commit together, and the tables are dropped afterwards.
+
+    Returns:
+        Tuple of (success, count of new records)
+    """
+    columns = ', '.join(TRACK_COLUMNS)
+    # (track, artist) links, exploded from the comma-joined artist ids
+    track_artists = sdf.select(
+        F.col('id').alias('track_id'),
+        F.posexplode(F.split(F.col('artist_ids'), ',')).alias('artist_position', 'artist_id')
+    )
+    sdf = sdf.withColumnRenamed('artist_names', 'artist_name').select(*TRACK_COLUMNS)
+
+    host = os.getenv('MYSQL_HOST', 'localhost')
+    port = os.getenv('MYSQL_PORT', '3306')
+    url = f"jdbc:mysql://{host}:{port}/spotify_db?rewriteBatchedStatements=true"
+    run_id = uuid.uuid4().hex[:12]
+    tracks_staging = f'tracks_staging_spark_{run_id}'
+    track_artists_staging = f'track_artists_staging_spark_{run_id}'
+
+    def write_staging_table(frame, table):
+        (frame.repartition(num_writers).write
+            .format('jdbc')
+            .option('url', url)
+            .option('dbtable', table)
+            .option('user', os.getenv('MYSQL_USER', 'root'))
+            .option('password', os.getenv('MYSQL_PASSWORD'))
+            .option('driver', 'com.mysql.cj.jdbc.Driver')
+            .option('batchsize', batch_size)
+            .option('numPartitions', num_writers)
+            .mode('overwrite')
+            .save())
+
+    print("=== Loading to MySQL Database with Spark ===")
+    if logger:
+        logger.info("=== Loading to MySQL Database with Spark ===")
+
+    # Checking out a pooled connection first also makes sure the schema exists
+    connection = get_connection(logger)
+    cursor = connection.cursor()
+    try:
+        write_staging_table(sdf, tracks_staging)
+        write_staging_table(track_artists, track_artists_staging)
+
+        # Same id type as tracks, so the joins below use its primary key. DDL commits
+        # implicitly, so it runs before the merge transaction starts
+        cursor.execute(f"ALTER TABLE {tracks_staging} MODIFY id {SPOTIFY_ID} NOT NULL, ADD PRIMARY KEY (id)")
+        connection.commit()
+
+        count_before = count_tracks(cursor)
+        if months is not None:
+            # Months of new and changed rows, and the month a moved track leaves
+            cursor.execute(f"""
+            SELECT DATE_FORMAT(s.release_date, '%Y-%m') FROM {tracks_staging} s
+            LEFT JOIN tracks t ON t.id = s.id
+            WHERE t.id IS NULL OR NOT (t.row_hash <=> s.row_hash)
+            UNION
+            SELECT DATE_FORMAT(t.release_date, '%Y-%m') FROM tracks t JOIN {tracks_staging} s ON s.id = t.id
+            WHERE t.release_date <> s.release_date
+            """)
+            changed_months = {row[0] for row in cursor.fetchall()}
+        if popularity_history:
+            cursor.execute(f"""
+            INSERT INTO track_popularity_history (track_id, observed_on, popularity)
+            SELECT * FROM (
+                SELECT s.id, CURRENT_DATE AS observed_on, s.popularity FROM {tracks_staging} s
+                LEFT JOIN tracks t ON t.id = s.id
+                WHERE t.id IS NULL OR t.popularity <> s.popularity
+            ) new
+            ON DUPLICATE KEY UPDATE popularity = new.popularity
+            """)
+        # release_date is part of the primary key, drop the old row of a track that moved
+        cursor.execute(f"""
+        DELETE t FROM tracks t JOIN {tracks_staging} s ON s.id = t.id
+        WHERE t.release_date <> s.release_date
+        """)
+        # The join goes in a derived table, so the update reads the staged values as new.column
+        staged_columns = ', '.join(f's.{column}' for column in TRACK_COLUMNS)
+        cursor.execute(f"""
+        INSERT INTO tracks ({columns})
+        SELECT * FROM (
+            SELECT {staged_columns} FROM {tracks_staging} s
+            LEFT JOIN tracks t ON t.id = s.id
+            WHERE t.id IS NULL OR NOT (t.row_hash <=> s.row_hash)
+        ) new
+        ON DUPLICATE KEY UPDATE {UPSERT_ASSIGNMENTS}
+        """)
+        written = cursor.rowcount
+        inserted = count_tracks(cursor) - count_before
+        # Existing links are left alone, qualified because the staging table has the same columns
+        cursor.execute(f"""
+        INSERT INTO track_artists (track_id, artist_id, artist_position)
+        SELECT track_id, artist_id, artist_position FROM {track_artists_staging}
+        ON DUPLICATE KEY UPDATE track_artists.artist_position = track_artists.artist_position
+        """)
+        bump_cache_generation(cursor)
+        connection.commit()
+        note_load()
+        if months is not None:
+            months.update(changed_months)
+
+        # An updated row counts twice in the rowcount of INSERT ... ON DUPLICATE KEY UPDATE
+        updated = (written - inserted) // 2
+        print(f"✓ Inserted {inserted} unique new records, updated {updated} changed records")
+        if logger:
+            logger.info(f"Inserted {inserted} unique new records, updated {updated} changed records")
+        return True, inserted
+
+    except Exception as e:
+        print(f"Error loading data to MySQL with Spark: {e}")
+        if logger:
+            logger.error(f"Error loading data to MySQL with Spark: {e}")
+        connection.rollback()
+        return False, 0
+
+    finally:
+        # After the commit or rollback, so a failed run leaves no staging tables behind either.
+        # Not IF EXISTS, its note fails with raise_on_warnings
+        for table in (tracks_staging, track_artists_staging):
+            try:
+                cursor.execute(f"DROP TABLE {table}")
+            except Error as e:
+                if e.errno != 1051:  # Never created, the run failed before writing it
+                    print(f"Could not drop staging table {table}: {e}")
+                    if logger:
+                        logger.warning(f"Could not drop staging table {table}: {e}")
+        cursor.close()
+        connection.close()
@@ -0,0 +1,101 @@
+# Columnar staging layer: transformed tracks as year/genre partitioned Parquet files
+#
+# Replaces the per-run CSV dump. Each run appends new files to the dataset, keeping the
+# proper dtypes, and readers can load just the columns and partitions they need.
+
+import os
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.metrics import recorder
+
+# Column types of the staged tracks, partition columns (year, genre) are added on write
+STAGING_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('track_name', pa.string()),
+    ('artist_names', pa.string()),
+    ('artist_ids', pa.string()),
+    ('artist_count', pa.int16()),
+    ('release_date', pa.date32()),
+    ('duration_min', pa.float32()),
+    ('popularity', pa.int16()),
+    ('cover_image_url', pa.string()),
+    ('album_type', pa.dictionary(pa.int8(), pa.string())),
+    ('album_id', pa.string()),
+    ('total_streams', pa.int64()),
+    ('danceability', pa.int16()),
+    ('tempo', pa.float32()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('genre', pa.string())]), flavor='hive')
+
+def to_staging_table(df):
+    """Convert a transformed DataFrame to an Arrow table with the staging dtypes"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    columns = [name for name in STAGING_SCHEMA.names if name in table.column_names]
+    schema = pa.schema([STAGING_SCHEMA.field(name) for name in columns])
+    return table.select(columns).cast(schema)
+
+@recorder.timed('staging', count_rows=False)
+def write_staging(df, year, genre='all', base_dir='staging', compression='zstd', logger=None):
+    """
+    Append a transformed DataFrame to the staging dataset as a new Parquet file
+
+    Args:
+        df: Transformed pandas DataFrame
+        year: Year partition
+        genre: Genre partition ('all' for the general search)
+        base_dir: Root directory of the dataset
+        compression: Parquet compression codec
+        logger: Logger instance for logging
+
+    Returns:
+        Path of the partition directory written to
+    """
+    table = to_staging_table(df)
+    table = table.append_column('year', pa.array([year] * len(table), pa.int16()))
+    table = table.append_column('genre', pa.array([genre] * len(table), pa.string()))
+
+    # Unique file name per write, so runs and chunks append instead of overwriting
+    basename = f"part-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}-{{i}}.parquet"
+    ds.write_dataset(
+        table, base_dir,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=basename,
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression)
+    )
+
+    recorder.add_rows(len(table))
+    partition_dir = os.path.join(base_dir, f'year={year}', f'genre={genre}')
+    if logger:
+        logger.info(f"Staged {len(table)} tracks to '{partition_dir}'")
+    return partition_dir
+
+def read_staging(base_dir='staging', columns=None, years=None, genres=None):
+    """
+    Read staged tracks back, memory-mapped, with column projection and partition pruning
+
+    Args:
+        base_dir: Root directory of the dataset
+        columns: Columns to read (all if None)
+        years: Only read these years
+        genres: Only read these genres
+
+    Returns:
+        pandas DataFrame
+    """
+    filters = []
+    if years is not None:
+        filters.append(('year', 'in', list(years)))
+    if genres is not None:
+        filters.append(('genre', 'in', list(genres)))
+
+    table = pq.read_table(base_dir, columns=columns, filters=filters or None,
+                          partitioning=PARTITIONING, memory_map=True)
+    return table.to_pandas(date_as_object=False)
@@ -0,0 +1,162 @@
+# Summary phase - pre-aggregated tables for the BI dashboards
+#
+# summary_by_month holds one row per (release month, album_type, artist_count) with summed
+# measures. summary_by_album_type and summary_by_artist_count roll it up. After a load only
+# the release months whose rows the load changed are recomputed, with an index / partition range scan
+# of tracks. The two rollups are rebuilt from summary_by_month, which only has a few thousand rows.
+# Recomputing is idempotent, so a refresh that is repeated or interrupted never double counts.
+#
+# Usage: python summaries.py   (rebuild every summary from the full tracks table)
+
+from datetime import date
+
+from mysql.connector import Error
+
+from load import get_connection
+from utils.metrics import recorder
+
+# Measure columns of the summary tables (see migrations.py) and how each is computed from tracks
+MEASURES = [
+    ('track_count', 'COUNT(*)'),
+    ('total_streams', 'COALESCE(SUM(total_streams), 0)'),
+    ('popularity_sum', 'COALESCE(SUM(popularity), 0)'),
+    ('duration_min_sum', 'COALESCE(SUM(duration_min), 0)'),
+    ('danceability_sum', 'COALESCE(SUM(danceability), 0)'),
+    ('tempo_sum', 'COALESCE(SUM(tempo), 0)'),
+    ('popularity_0_19', 'COALESCE(SUM(popularity < 20), 0)'),
+    ('popularity_20_39', 'COALESCE(SUM(popularity BETWEEN 20 AND 39), 0)'),
+    ('popularity_40_59', 'COALESCE(SUM(popularity BETWEEN 40 AND 59), 0)'),
+    ('popularity_60_79', 'COALESCE(SUM(popularity BETWEEN 60 AND 79), 0)'),
+    ('popularity_80_100', 'COALESCE(SUM(popularity >= 80), 0)'),
+]
+
+# Coarser summaries and the summary_by_month column they group by
+ROLLUPS = {
+    'summary_by_album_type': 'album_type',
+    'summary_by_artist_count': 'artist_count',
+}
+
+def month_start(month):
+    year, month = map(int, month.split('-'))
+    return date(year, month, 1)
+
+def next_month(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+def month_ranges(months):
+    """Merge months into contiguous [start, end) date ranges"""
+    ranges = []
+    for start in sorted(month_start(month) for month in months):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = next_month(start)
+        else:
+            ranges.append([start, next_month(start)])
+    return ranges
+
+def refresh_month_summary(cursor, months=None):
+    """
+    Recompute the summary_by_month rows of `months` (every month if None) from tracks
+
+    Returns:
+        Number of summary rows written
+    """
+    columns = ', '.join(column for column, _ in MEASURES)
+    expressions = ', '.join(expression for _, expression in MEASURES)
+
+    where = ''
+    params = []
+    if months is not None:
+        ranges = month_ranges(months)
+        # Range conditions on release_date, so only the index / partitions of those months are read
+        where = 'WHERE ' + ' OR '.join(['(release_date >= %s AND release_date < %s)'] * len(ranges))
+        params = [day for date_range in ranges for day in date_range]
+        cursor.execute(
+            f"DELETE FROM summary_by_month WHERE release_month IN ({', '.join(['%s'] * len(months))})",
+            [month_start(month) for month in months]
+        )
+    else:
+        cursor.execute("DELETE FROM summary_by_month")
+
+    cursor.execute(f"""
+    INSERT INTO summary_by_month (release_month, album_type, artist_count, {columns})
+    SELECT release_date - INTERVAL (DAYOFMONTH(release_date) - 1) DAY, COALESCE(album_type, ''),
+        COALESCE(artist_count, 0), {expressions}
+    FROM tracks
+    {where}
+    GROUP BY 1, 2, 3
+    """, params)
+    return cursor.rowcount
+
+def refresh_rollups(cursor):
+    """Rebuild the coarser summaries from summary_by_month"""
+    columns = ', '.join(column for column, _ in MEASURES)
+    sums = ', '.join(f'SUM({column})' for column, _ in MEASURES)
+    for table, key in ROLLUPS.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+        INSERT INTO {table} ({key}, {columns})
+        SELECT {key}, {sums} FROM summary_by_month GROUP BY {key}
+        """)
+
+@recorder.timed('summaries', count_rows=False)
+def refresh_summaries(months=None, logger=None):
+    """
+    Bring the summary tables up to date after a load, in one transaction
+
+    Args:
+        months: Release months ('YYYY-MM') the load changed, None rebuilds every month.
+            An empty summary_by_month (e.g. right after the migration) is always rebuilt.
+        logger: Logger instance for logging
+
+    Returns:
+        Number of summary_by_month rows written
+    """
+    if months is not None and not months:
+        return 0
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_connection(logger)
+        cursor = connection.cursor()
+
+        # Concurrent refreshes would deadlock on the rollups, so they take turns
+        cursor.execute("SELECT GET_LOCK('spotify_db_summaries', 300)")
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Timed out waiting for another summary refresh")
+        try:
+            cursor.execute("SELECT 1 FROM summary_by_month LIMIT 1")
+            if not cursor.fetchall():
+                months = None
+
+            written = refresh_month_summary(cursor, months)
+            refresh_rollups(cursor)
+            connection.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('spotify_db_summaries')")
+            cursor.fetchone()
+        recorder.record_db_round_trips(6 + 2 * len(ROLLUPS))
+        recorder.add_rows(written)
+
+        scope = 'all months' if months is None else f"{len(months)} release months"
+        print(f"✓ Summary tables refreshed for {scope} ({written} rows)")
+        if logger:
+            logger.info(f"Summary tables refreshed for {scope} ({written} rows)")
+        return written
+
+    except Error as e:
+        if logger:
+            logger.error(f"Error refreshing summary tables: {e}")
+        if connection:
+            connection.rollback()
+        raise e
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+
+if __name__ == "__main__":
+    refresh_summaries()
@@ -2,38 +2,177 @@
 # Note: date column has already been transformed into standard YYYY-MM-DD format
 
 import numpy as np
+import pandas as pd
 
-def transform_dataset(df):
-    # convert duration_ms into minutes
-    minutes = df['duration_ms'] // 60000  # Get whole minutes
-    seconds = (df['duration_ms'] % 60000) / 1000  # Get remaining seconds
-    df['duration_ms'] = (minutes + (seconds / 100)).round(2)  # Combine as MM.SS decimal
+from utils.metrics import recorder
 
-    df.rename(columns={'duration_ms': 'duration_min', 'artist(s)_name':'artist_names'}, inplace=True)
+# FNV-1a constants for hashing track ids
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
 
-    # Spotify API doesn't provide the number of streams of track, but it feels important 
-    # Here we generate dummy values using popularity
-    df['total_streams'] = (
-        # Base: squared popularity for exponential effect
-        (df['popularity'] ** 2) * 10000 + 
-        # Add random variation (±50% of base)
-        np.random.randint(-500000, 500000, len(df))).clip(lower=50000).astype(int) 
+# Columns that go into row_hash: everything written for a track except its id
+HASHED_COLUMNS = [
+    'track_name', 'artist_names', 'artist_ids', 'artist_count', 'release_date', 'duration_min', 'popularity',
+    'cover_image_url', 'album_type', 'album_id', 'total_streams', 'danceability', 'tempo'
+]
 
-    # Spotify API has recently deprecated 'get track's audio features' from the API
-    # Here we generate dummy values using popularity
-    df['danceability'] = (
-        # Base: use popularity directly as base
-        df['popularity'] * 0.8 +  # Scale to max 80 to leave room for randomness
-        # Add random variation (±20)
-        np.random.uniform(-20, 20, len(df))).clip(lower=25, upper=100).round(1).astype(int)  # Keep within 0-100 range and convert to integer
+# Target dtypes of the transformed columns, the same as staging.STAGING_SCHEMA. Columns that
+# aren't listed (ids, names, urls) stay strings.
+TRACK_SCHEMA = {
+    'artist_count': np.int16,
+    'release_date': 'datetime64[s]',
+    'duration_min': np.float32,
+    'popularity': np.int16,
+    'album_type': 'category',
+    'total_streams': np.int64,  # BIGINT in tracks, int64 in staging
+    'danceability': np.int16,
+    'tempo': np.float32,
+}
+
+SYNTHETIC_COLUMNS = ('total_streams', 'danceability', 'tempo')
+
+# Rows evaluated at a time by transform_dataset, bounds the size of every temporary array
+BLOCK_ROWS = 65536
+
+# Independent random streams drawn from each track's key, one per synthetic feature
+_STREAM_TOTAL_STREAMS = 1
+_STREAM_DANCEABILITY = 2
+_STREAM_TEMPO = 3
+
+def hash_track_ids(ids):
+    """
+    Stable 64-bit FNV-1a hash of every track id, computed a byte column at a time
+
+    Unlike Python's hash() this is the same on every run, so a track always gets the
+    same synthetic values.
+    """
+    raw = np.char.encode(np.asarray(ids, dtype=str), 'utf-8')
+    codes = raw.view(np.uint8).reshape(len(raw), -1)
+    
+    keys = np.full(len(raw), _FNV_OFFSET, dtype=np.uint64)
+    for column in codes.T:
+        # Shorter ids are zero padded, skip the padding so the hash doesn't depend on the batch
+        mixed = (keys ^ column) * _FNV_PRIME
+        np.copyto(keys, mixed, where=(column != 0))
+    return keys
 
+def uniform_from_keys(keys, stream, dtype=np.float64):
+    """
+    Counter-based generator: uniform [0, 1) values for each key on the given stream
+
+    This is the splitmix64 output function evaluated on (key, stream), which gives every
+    track its own generator while drawing all tracks in one vectorized pass.
+    """
+    with np.errstate(over='ignore'):
+        z = keys + np.uint64(stream) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    return ((z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53).astype(dtype, copy=False)
+
+def generate_synthetic_features(ids, popularity, dtype=np.float64):
+    """
+    Deterministic total_streams, danceability and tempo for each track
+
+    Args:
+        ids: Track ids, the random variation of each track is seeded from its id
+        popularity: Popularity values (0-100)
+        dtype: Float dtype for tempo and intermediate arrays (np.float32 halves memory)
+
+    Returns:
+        Dictionary of numpy arrays, one per feature
+    """
+    keys = hash_track_ids(ids)
+    popularity = np.asarray(popularity, dtype=dtype)
+    
+    # Spotify API doesn't provide the number of streams of track, but it feels important 
+    # Base: squared popularity for exponential effect, plus random variation (±500k)
+    noise = uniform_from_keys(keys, _STREAM_TOTAL_STREAMS)
+    total_streams = (popularity.astype(np.int64) ** 2) * 10000 + (np.floor(noise * 1000000).astype(np.int64) - 500000)
+    np.maximum(total_streams, 50000, out=total_streams)
+    
+    # Spotify API has recently deprecated 'get track's audio features' from the API
+    # Base: popularity scaled to max 80 to leave room for randomness, plus variation (±20)
+    danceability = uniform_from_keys(keys, _STREAM_DANCEABILITY, dtype)
+    danceability *= 40
+    danceability -= 20
+    danceability += popularity * dtype(0.8)
+    np.clip(danceability, 25, 100, out=danceability)
+    
     # similarly, for Tempo a.k.a BPM (Beats Per Minute)
-    # Generate tempo based on popularity (50-200 BPM)
-    df['tempo'] = (
-        # Base: map popularity to tempo range (50-160 BPM)
-        50 + (df['popularity'] / 100) * 80 +  # Base range from 50 to 130 BPM
-        # Add random variation (±40 BPM)
-        np.random.uniform(-40, 40, len(df))).clip(lower=50, upper=200).round(3)  # Keep within reasonable BPM range
+    # Base: map popularity to 50-130 BPM, plus variation (±40 BPM), kept within 50-200
+    tempo = uniform_from_keys(keys, _STREAM_TEMPO, dtype)
+    tempo *= 80
+    tempo -= 40
+    tempo += 50 + popularity / 100 * 80
+    np.clip(tempo, 50, 200, out=tempo)
+    
+    return {
+        'total_streams': total_streams,
+        'danceability': np.round(danceability, 1).astype(np.int64),
+        'tempo': np.round(tempo, 3)
+    }
 
-    return df
+def hash_rows(df):
+    """
+    64-bit content hash of each row's HASHED_COLUMNS, as a signed int64 so every database
+    can store it. The loader compares it with the stored tracks.row_hash to skip unchanged tracks.
+    """
+    columns = [column for column in HASHED_COLUMNS if column in df]
+    # Mostly unique strings, hashing them directly beats factorizing them first
+    return pd.util.hash_pandas_object(df[columns], index=False, categorize=False).to_numpy().view(np.int64)
+
+def convert_duration(duration_ms, out):
+    """duration_ms as MM.SS decimal minutes (3:25 -> 3.25), written into `out`"""
+    minutes, remainder = np.divmod(duration_ms, 60000)  # Whole minutes, remaining milliseconds
+    out[...] = np.round(minutes + remainder / 1000 / 100, 2)
+
+def empty_column(column, rows):
+    """Uninitialized array of the column's TRACK_SCHEMA dtype"""
+    return np.empty(rows, dtype=TRACK_SCHEMA[column])
+
+@recorder.timed('transform')
+def transform_dataset(df, dtype=np.float64):
+    """
+    Transform an extracted DataFrame into TRACK_SCHEMA dtypes
+
+    Every row-wise step is evaluated BLOCK_ROWS rows at a time straight into an array of its
+    target dtype, so temporaries (id bytes, float64 intermediates, parsed dates, hash inputs)
+    never get bigger than one block. `dtype` is the float dtype used inside a block (see
+    generate_synthetic_features).
+    """
+    rows = len(df)
+    ids = df['id']
+    duration_ms = df['duration_ms'].to_numpy()
+    popularity = df['popularity'].to_numpy()
+    release_dates = None if pd.api.types.is_datetime64_any_dtype(df['release_date']) else df['release_date']
+
+    columns = {column: empty_column(column, rows) for column in ('duration_min', *SYNTHETIC_COLUMNS)}
+    if release_dates is not None:
+        columns['release_date'] = empty_column('release_date', rows)
+    for start in range(0, rows, BLOCK_ROWS):
+        block = slice(start, start + BLOCK_ROWS)
+        convert_duration(duration_ms[block], out=columns['duration_min'][block])
 
+        # Synthetic features, seeded per track so re-runs give every track the same values
+        features = generate_synthetic_features(ids.iloc[block].to_numpy(), popularity[block], dtype=dtype)
+        for column, values in features.items():
+            columns[column][block] = values
+
+        if release_dates is not None:
+            columns['release_date'][block] = pd.to_datetime(release_dates.iloc[block], format='%Y-%m-%d')
+
+    df = df.rename(columns={'duration_ms': 'duration_min', 'artist(s)_name': 'artist_names'})
+    for column, values in columns.items():
+        df[column] = values
+
+    # Narrow the remaining extracted columns (int64 -> int16, album_type -> category)
+    df = df.astype({column: dtype for column, dtype in TRACK_SCHEMA.items() if column in df})
+
+    # Change detection for the loader, the hash of a row doesn't depend on the rest of the block
+    row_hash = np.empty(rows, dtype=np.int64)
+    for start in range(0, rows, BLOCK_ROWS):
+        row_hash[start:start + BLOCK_ROWS] = hash_rows(df.iloc[start:start + BLOCK_ROWS])
+    df['row_hash'] = row_hash
+
+    return df
@@ -0,0 +1,182 @@
+# checkpoint.py
+# Resumable runs: every fetched search page is spilled to a compressed journal and every
+# staged / loaded chunk is recorded, so a restarted run replays the journal instead of
+# calling the API again and skips chunks that already made it into MySQL
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import zlib
+
+from utils.metrics import recorder
+from utils.search_cache import search_cache_key
+
+
+class RunCheckpoint:
+    """
+    On-disk checkpoint of one ETL run, kept until the run completes
+
+    Layout of `path`:
+        pages.jsonl.gz  append-only journal, one fetched search page per line
+        manifest.jsonl  append-only list of completed pages and of chunks done per stage
+
+    A page's manifest line is only written once its journal line is flushed, so a
+    page cut off by a crash is never replayed, it's just fetched again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = os.path.join(path, 'pages.jsonl.gz')
+        self.manifest_path = os.path.join(path, 'manifest.jsonl')
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self.completed_pages = set()
+        self.done_chunks = set()
+        self._read_manifest()
+        self.pages = self._read_journal()
+
+        # Appending opens a new gzip member, readers see one continuous stream
+        self.journal = gzip.open(self.journal_path, 'at', encoding='utf-8')
+        self.manifest = open(self.manifest_path, 'a', encoding='utf-8')
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Last line cut off by a crash
+                if 'page' in entry:
+                    self.completed_pages.add(entry['page'])
+                else:
+                    self.done_chunks.add((entry['stage'], entry['chunk']))
+
+    def _read_journal(self):
+        """Completed pages from the journal, rewriting it if its tail was cut off"""
+        pages = {}
+        if not os.path.exists(self.journal_path):
+            return pages
+
+        truncated = False
+        try:
+            with gzip.open(self.journal_path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        truncated = True
+                        break
+                    if entry['key'] in self.completed_pages:
+                        pages[entry['key']] = entry['results']
+        except (EOFError, OSError, zlib.error):
+            truncated = True
+
+        # Members appended after a broken one couldn't be read back, so start a clean journal
+        if truncated:
+            tmp_path = f"{self.journal_path}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                for key, results in pages.items():
+                    f.write(json.dumps({'key': key, 'results': results}) + '\n')
+            os.replace(tmp_path, self.journal_path)
+        return pages
+
+    def get_page(self, key):
+        return self.pages.get(key)
+
+    def record_page(self, key, results):
+        with self.lock:
+            self.journal.write(json.dumps({'key': key, 'results': results}) + '\n')
+            self.journal.flush()
+            self.manifest.write(json.dumps({'page': key}) + '\n')
+            self.manifest.flush()
+            self.completed_pages.add(key)
+
+    @staticmethod
+    def chunk_key(df):
+        """Identify a chunk by the ids it holds, so a replayed run finds the same chunks"""
+        return hashlib.sha1('\n'.join(df['id']).encode('utf-8')).hexdigest()
+
+    def is_chunk_done(self, stage, key):
+        return (stage, key) in self.done_chunks
+
+    def mark_chunk_done(self, stage, key):
+        """Record that `stage` ('staging', 'load') committed the chunk"""
+        with self.lock:
+            self.manifest.write(json.dumps({'chunk': key, 'stage': stage}) + '\n')
+            self.manifest.flush()
+            self.done_chunks.add((stage, key))
+
+    def close(self):
+        with self.lock:
+            self.journal.close()
+            self.manifest.close()
+
+    def complete(self):
+        """The run finished, the next run starts fresh"""
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class CheckpointedSpotify:
+    """Wraps a spotipy client so search() replays journaled pages and journals new ones"""
+
+    def __init__(self, sp, checkpoint):
+        self.sp = sp
+        self.checkpoint = checkpoint
+        self.replayed = 0
+        self.fetched = 0
+
+    def cached_search(self, q, limit=10, offset=0, type='track', market=None):
+        """
+        The journaled page of a search, or the wrapped client's cached one (journaled on the
+        way), None if it has to be fetched. Never calls the API.
+        """
+        key = search_cache_key(q, type=type, limit=limit, offset=offset, market=market)
+        results = self.checkpoint.get_page(key)
+        if results is not None:
+            self.replayed += 1
+            recorder.record_cache_hit()
+            return results
+
+        cached_search = getattr(self.sp, 'cached_search', None)
+        results = cached_search(q, limit=limit, offset=offset, type=type, market=market) if cached_search else None
+        if results is not None:
+            self.checkpoint.record_page(key, results)
+        return results
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        results = self.cached_search(q, limit=limit, offset=offset, type=type, market=market)
+        if results is not None:
+            return results
+
+        key = search_cache_key(q, type=type, limit=limit, offset=offset, market=market)
+        results = self.sp.search(q=q, limit=limit, offset=offset, type=type, market=market)
+        self.fetched += 1
+        self.checkpoint.record_page(key, results)
+        return results
+
+    def __getattr__(self, name):
+        # Everything other than search goes straight to the wrapped client
+        return getattr(self.sp, name)
+
+
+def open_checkpoint(name, base_dir='checkpoints', logger=None):
+    """
+    Open (or resume) the checkpoint of the run called `name`
+
+    Returns:
+        RunCheckpoint instance
+    """
+    checkpoint = RunCheckpoint(os.path.join(base_dir, name))
+    if checkpoint.completed_pages or checkpoint.done_chunks:
+        loaded = sum(1 for stage, _ in checkpoint.done_chunks if stage == 'load')
+        message = f"Resuming run '{name}': {len(checkpoint.pages)} journaled pages, {loaded} loaded chunks"
+        print(message)
+        if logger:
+            logger.info(message)
+    return checkpoint
@@ -0,0 +1,299 @@
+# metrics.py
+# Per-stage instrumentation for ETL runs: wall time, rows/sec, API calls and latency,
+# retries, rate-limit waits, DB round trips and peak RSS
+import functools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Upper bounds (seconds) of the API latency histogram buckets, plus an implicit +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
+
+
+class StageMetrics:
+    """Counters for one ETL stage, accumulated over every time the stage is entered"""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.rows = 0
+        self.api_calls = 0
+        self.api_latency_seconds = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.retries = 0
+        self.rate_limit_wait_seconds = 0.0
+        self.cache_hits = 0
+        self.db_round_trips = 0
+        self.peak_rss_mb = None
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    @property
+    def api_latency_avg_ms(self):
+        return self.api_latency_seconds / self.api_calls * 1000 if self.api_calls else None
+
+    def latency_quantile_ms(self, q):
+        """Approximate latency quantile: upper bound of the histogram bucket it falls in"""
+        if not self.api_calls:
+            return None
+        target = q * self.api_calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            seen += count
+            if seen >= target:
+                return bound * 1000
+        return None  # Falls in the +Inf bucket
+
+    def histogram(self):
+        """Latency bucket counts keyed by upper bound, as stored in etl_stage_metrics"""
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        return dict(zip(bounds, self.latency_buckets))
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'rows_processed': self.rows,
+            'rows_per_second': round(self.rows_per_second, 1),
+            'api_calls': self.api_calls,
+            'api_latency_avg_ms': self.api_latency_avg_ms,
+            'api_latency_p95_ms': self.latency_quantile_ms(0.95),
+            'api_latency_histogram': self.histogram(),
+            'retries': self.retries,
+            'rate_limit_wait_seconds': round(self.rate_limit_wait_seconds, 3),
+            'cache_hits': self.cache_hits,
+            'db_round_trips': self.db_round_trips,
+            'peak_rss_mb': self.peak_rss_mb,
+        }
+
+
+class MetricsRecorder:
+    """
+    Collects StageMetrics for the current run
+
+    Stages are entered with the `stage` context manager, the `timed` decorator or
+    `iter_stage` for generators. Counters go to the innermost stage the recording
+    thread is in. Helper threads that never enter a stage themselves (the search
+    workers) record into the most recently entered stage of any thread, and counters
+    are dropped when no stage is active at all. Time spent in a nested stage is not
+    counted again in the enclosing one. A stage entered by several threads at once
+    (the concurrent loaders) adds up the time of each thread.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.active = []
+        self.thread_stacks = {}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Forget everything recorded so far, called at the start of each run"""
+        with self.lock:
+            self.stages = {}
+            self.active = []
+            self.thread_stacks = {}
+
+    def get_stage(self, name):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        metrics = self.get_stage(name)
+        ident = threading.get_ident()
+        with self.lock:
+            stack = self.thread_stacks.setdefault(ident, [])
+            stack.append(metrics)
+            self.active.append(metrics)
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                # Interleaved generators can exit out of order, drop the last entry for this stage
+                for entries in (stack, self.active):
+                    for i in range(len(entries) - 1, -1, -1):
+                        if entries[i] is metrics:
+                            del entries[i]
+                            break
+                metrics.wall_seconds += elapsed
+                if stack:
+                    stack[-1].wall_seconds -= elapsed
+                elif self.thread_stacks.get(ident) is stack:
+                    del self.thread_stacks[ident]
+                metrics.peak_rss_mb = peak_rss_mb()
+
+    def timed(self, name, count_rows=True):
+        """Decorator running a function as (part of) a stage, counting len() of its result as rows"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    result = func(*args, **kwargs)
+                    if count_rows and hasattr(result, '__len__'):
+                        self.add_rows(len(result))
+                    return result
+            return wrapper
+        return decorator
+
+    def iter_stage(self, name, iterable):
+        """Pull each item of `iterable` inside a stage, counting len() of every item as rows"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                if hasattr(item, '__len__'):
+                    self.add_rows(len(item))
+            yield item
+
+    def _record(self, update):
+        with self.lock:
+            stack = self.thread_stacks.get(threading.get_ident())
+            if stack:
+                update(stack[-1])
+            elif self.active:
+                update(self.active[-1])
+
+    def add_rows(self, count):
+        def update(metrics):
+            metrics.rows += count
+        self._record(update)
+
+    def record_api_call(self, seconds):
+        """Record one API request actually sent and its latency, cache hits never get here"""
+        def update(metrics):
+            metrics.api_calls += 1
+            metrics.api_latency_seconds += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    metrics.latency_buckets[i] += 1
+                    break
+            else:
+                metrics.latency_buckets[-1] += 1
+        self._record(update)
+
+    def record_cache_hit(self):
+        """Record one search page (or query result) answered by a cache instead of a request"""
+        def update(metrics):
+            metrics.cache_hits += 1
+        self._record(update)
+
+    def record_retry(self):
+        def update(metrics):
+            metrics.retries += 1
+        self._record(update)
+
+    def record_rate_limit_wait(self, seconds):
+        if seconds <= 0:
+            return
+
+        def update(metrics):
+            metrics.rate_limit_wait_seconds += seconds
+        self._record(update)
+
+    def record_db_round_trips(self, count=1):
+        def update(metrics):
+            metrics.db_round_trips += count
+        self._record(update)
+
+    def to_records(self):
+        """One dict per stage, in the order the stages first ran"""
+        with self.lock:
+            return [metrics.as_dict() for metrics in self.stages.values()]
+
+    def log_summary(self, logger=None):
+        for record in self.to_records():
+            line = (f"Stage {record['stage']}: {record['wall_seconds']:.2f}s, "
+                    f"{record['rows_processed']} rows ({record['rows_per_second']:.0f}/s), "
+                    f"{record['api_calls']} API calls, {record['retries']} retries, "
+                    f"{record['rate_limit_wait_seconds']:.2f}s rate-limit wait, "
+                    f"{record['db_round_trips']} DB round trips")
+            print(line)
+            if logger:
+                logger.info(line)
+
+    def write_prometheus(self, path, labels=None):
+        """
+        Write the stage metrics in the Prometheus text format, e.g. for the node_exporter
+        textfile collector. The file is replaced atomically.
+
+        Args:
+            path: Output .prom file
+            labels: Extra labels added to every sample, e.g. {'year': 2023}
+        """
+        labels = labels or {}
+
+        def label_string(stage, **extra):
+            pairs = {**labels, 'stage': stage, **extra}
+            return ','.join(f'{key}="{value}"' for key, value in pairs.items())
+
+        gauges = [
+            ('wall_seconds', 'Wall time spent in the stage', lambda m: m.wall_seconds),
+            ('rows', 'Rows processed by the stage', lambda m: m.rows),
+            ('rows_per_second', 'Stage throughput', lambda m: m.rows_per_second),
+            ('api_calls', 'Spotify API calls made by the stage', lambda m: m.api_calls),
+            ('retries', 'Rate-limited API calls that were retried', lambda m: m.retries),
+            ('rate_limit_wait_seconds', 'Time spent waiting on the rate limiter', lambda m: m.rate_limit_wait_seconds),
+            ('cache_hits', 'Search pages answered by the cache', lambda m: m.cache_hits),
+            ('db_round_trips', 'MySQL round trips made by the stage', lambda m: m.db_round_trips),
+            ('peak_rss_bytes', 'Peak RSS of the process at the end of the stage',
+             lambda m: (m.peak_rss_mb or 0) * 1024 * 1024),
+        ]
+
+        with self.lock:
+            stages = list(self.stages.values())
+
+        lines = []
+        for suffix, help_text, value in gauges:
+            name = f'spotify_etl_stage_{suffix}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for metrics in stages:
+                lines.append(f'{name}{{{label_string(metrics.name)}}} {value(metrics)}')
+
+        name = 'spotify_etl_api_latency_seconds'
+        lines.append(f'# HELP {name} Spotify API call latency')
+        lines.append(f'# TYPE {name} histogram')
+        for metrics in stages:
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ['+Inf'], metrics.latency_buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_string(metrics.name, le=bound)}}} {cumulative}')
+            lines.append(f'{name}_sum{{{label_string(metrics.name)}}} {metrics.api_latency_seconds}')
+            lines.append(f'{name}_count{{{label_string(metrics.name)}}} {metrics.api_calls}')
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+# Shared recorder for the process, instrumented modules record into it
+recorder = MetricsRecorder()
@@ -0,0 +1,127 @@
+# query_cache.py
+# Read-through cache of query results for query_api.py, invalidated by a generation counter
+#
+# Every load that writes tracks, artists or albums bumps cache_generation in the same
+# transaction (load.bump_cache_generation). Results are cached under the generation they
+# were read at, so a bump makes every older entry unreachable at once. Nothing has to be
+# deleted, old generations fall out of the LRU and expire in Redis. Readers look the current
+# generation up at most once every `check_interval` seconds, which bounds how stale a result
+# can get. Loads committed by the same process are seen right away (note_load).
+import json
+import threading
+import time
+
+from utils.lru_cache import LRUCache
+from utils.metrics import recorder
+
+# Loads committed by this process, compared by every QueryCache on lookup
+_local_loads = 0
+_local_lock = threading.Lock()
+
+def note_load():
+    """Tell the query caches of this process that a load just committed"""
+    global _local_loads
+    with _local_lock:
+        _local_loads += 1
+
+def query_cache_key(generation, name, params):
+    """Build the cache key for one query result"""
+    return json.dumps([generation, name, list(params)], default=str)
+
+
+class RedisQueryStore:
+    """
+    Query results shared through Redis, so every dashboard process reads a result from
+    MySQL once per generation
+
+    Args:
+        url: Redis connection URL
+        ttl: Seconds a result stays in Redis, results of old generations just expire
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', ttl=3600, prefix='spotify_etl:query:'):
+        import redis  # Only needed when the Redis backend is selected
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, int(self.ttl), json.dumps(value))
+
+
+class QueryCache:
+    """
+    In-process LRU of query results, optionally backed by Redis
+
+    Args:
+        fetch_generation: Function returning the current cache generation from the database
+        max_entries: Results kept in the in-process LRU
+        redis_url: Also share results through Redis at this URL
+        ttl: Seconds a result stays in Redis
+        check_interval: Most seconds between two generation lookups
+    """
+
+    def __init__(self, fetch_generation, max_entries=1000, redis_url=None, ttl=3600, check_interval=1.0):
+        self.fetch_generation = fetch_generation
+        self.local = LRUCache(max_entries=max_entries)
+        self.shared = RedisQueryStore(redis_url, ttl=ttl) if redis_url else None
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.current_generation = None
+        self.checked_at = 0.0
+        self.seen_loads = _local_loads
+        self.shared_hits = 0
+        self.generation_lookups = 0
+
+    def generation(self):
+        """Current generation, looked up again once check_interval has passed or after a local load"""
+        with self.lock:
+            now = time.monotonic()
+            if (self.current_generation is None or now - self.checked_at >= self.check_interval
+                    or self.seen_loads != _local_loads):
+                self.seen_loads = _local_loads
+                self.current_generation = self.fetch_generation()
+                self.checked_at = now
+                self.generation_lookups += 1
+            return self.current_generation
+
+    def get_or_compute(self, name, params, compute):
+        """
+        Cached result of query `name` with `params`, calling compute() and caching what it
+        returns on a miss. Results are shared between callers, treat them as read-only.
+        """
+        key = query_cache_key(self.generation(), name, params)
+        rows = self.local.get(key)
+        if rows is not None:
+            recorder.record_cache_hit()
+            return rows
+
+        if self.shared is not None:
+            rows = self.shared.get(key)
+            if rows is not None:
+                self.shared_hits += 1
+                recorder.record_cache_hit()
+                self.local.set(key, rows)
+                return rows
+
+        rows = compute()
+        self.local.set(key, rows)
+        if self.shared is not None:
+            self.shared.set(key, rows)
+        return rows
+
+    def clear(self):
+        """Drop the in-process results and look the generation up again on the next query"""
+        with self.lock:
+            self.current_generation = None
+        self.local.clear()
+
+    def stats(self):
+        """Hits and misses of the in-process LRU, Redis hits count as misses there"""
+        return {'hits': self.local.hits, 'misses': self.local.misses, 'shared_hits': self.shared_hits,
+                'generation_lookups': self.generation_lookups, 'entries': len(self.local)}
@@ -0,0 +1,123 @@
+# query_planner.py
+# Plans the search terms of a run around Spotify's search offset cap
+#
+# Search stops paging at offset 1000, so a term with more results than that leaves the rest
+# out of reach however high tracks_per_term is. The planner probes the first page of every
+# term and reads the result count from its `total`. Only the terms whose paging actually
+# reaches the cap (tracks_per_term up to 1000 and more results than that) are split into
+# narrower sub-queries: by genre, then by tag, then by a free-text keyword. A term whose
+# first page is mostly tracks that earlier terms already returned is pruned to that one page,
+# and extract.iter_term_pages stops paging a term at the first page that is.
+#
+# Search has no month filter (year: only takes whole years), so release months can't be
+# split server-side; the year filter on release_date happens after the search as before.
+
+SEARCH_OFFSET_CAP = 1000  # Highest offset + limit the search endpoint accepts
+
+# Share of a page already returned by earlier terms at which a term stops paging
+PRUNE_DUPLICATE_RATE = 0.8
+
+# Sub-query dimensions, tried in this order on a term that hits the cap
+SPLIT_GENRES = [
+    'pop', 'hip-hop', 'rock', 'electronic', 'dance', 'r-n-b', 'latin', 'country', 'indie', 'alternative',
+    'metal', 'punk', 'jazz', 'soul', 'blues', 'folk', 'classical', 'house', 'k-pop', 'reggaeton'
+]
+SPLIT_TAGS = ['new', 'hipster']  # Released in the last two weeks / lowest 10% popularity
+SPLIT_KEYWORDS = list('abcdefghijklmnopqrstuvwxyz')
+
+def is_subquery(term, other):
+    """True if `term` is a sub-query split off `other` (or off one of its sub-queries)"""
+    return term.startswith(other + ' ')
+
+def duplicate_rate(ids, term, seen_terms):
+    """
+    Share of `ids` already returned by earlier terms, then records the rest as returned by `term`
+
+    `seen_terms` maps each track id to the first term that returned it. Tracks a sub-query
+    shares with the term it was split off don't count, its first pages always overlap the
+    top results of that term and its later pages are the ones past the cap.
+    """
+    if not ids:
+        return 0.0
+    duplicates = 0
+    for track_id in ids:
+        first_term = seen_terms.setdefault(track_id, term)
+        if first_term != term and not is_subquery(term, first_term):
+            duplicates += 1
+    return duplicates / len(ids)
+
+def split_term(term):
+    """Narrower sub-queries of a search term, along the first dimension it doesn't filter on yet"""
+    tokens = term.split()
+    if not any(token.startswith('genre:') for token in tokens):
+        return [f'{term} genre:{genre}' for genre in SPLIT_GENRES]
+    if not any(token.startswith('tag:') for token in tokens):
+        return [f'{term} tag:{tag}' for tag in SPLIT_TAGS]
+    if all(':' in token for token in tokens):
+        return [f'{term} {keyword}' for keyword in SPLIT_KEYWORDS]
+    return []
+
+def plan_search_terms(probe, root_terms, tracks_per_term, max_terms=100, prune_duplicate_rate=PRUNE_DUPLICATE_RATE):
+    """
+    Decide which search terms to page through and how far
+
+    Terms are probed level by level and judged in order, so the plan doesn't depend on
+    which probe returned first. A term is only split when its last page would reach the
+    offset cap, below that its own pages already get every track the run asks for. A term
+    that gets split is still paged itself, its sub-queries reach the results past its cap.
+
+    Args:
+        probe: Function taking a list of terms and returning {term: first page results},
+            with None for a term whose search failed
+        root_terms: Terms to start from, always probed
+        tracks_per_term: Most tracks paged per term, capped at SEARCH_OFFSET_CAP
+        max_terms: Most terms probed in total, each probe is one API call
+        prune_duplicate_rate: Share of a first page already returned by earlier terms at
+            which the term is pruned to that page
+
+    Returns:
+        List of planned terms in search order, dictionaries with term, total, first_page,
+        limit (tracks to page), duplicate_rate and action ('fetch', 'split' or 'prune')
+    """
+    tracks_per_term = min(tracks_per_term, SEARCH_OFFSET_CAP)
+    first_batch = min(50, tracks_per_term)
+    max_terms = max(max_terms, len(root_terms))
+
+    plan = []
+    planned_terms = set(root_terms)
+    seen_terms = {}
+    level = list(root_terms)
+    while level:
+        level = level[:max_terms - len(plan)]
+        first_pages = probe(level)
+        next_level = []
+        for term in level:
+            results = first_pages.get(term)
+            entry = {'term': term, 'total': None, 'first_page': results, 'limit': tracks_per_term,
+                     'duplicate_rate': 0.0, 'action': 'fetch'}
+            plan.append(entry)
+            if results is None:
+                continue  # Searched again when the term is paged, which reports the error
+
+            ids = [track['id'] for track in results['tracks']['items'] if track]
+            entry['total'] = results['tracks'].get('total', len(ids))
+            entry['duplicate_rate'] = duplicate_rate(ids, term, seen_terms)
+
+            if ids and entry['duplicate_rate'] >= prune_duplicate_rate:
+                entry['action'] = 'prune'
+                entry['limit'] = first_batch
+            elif tracks_per_term >= SEARCH_OFFSET_CAP and entry['total'] > SEARCH_OFFSET_CAP:
+                children = [child for child in split_term(term) if child not in planned_terms]
+                if children:
+                    entry['action'] = 'split'
+                    planned_terms.update(children)
+                    next_level.extend(children)
+        level = next_level
+    return plan
+
+def summarize_plan(plan):
+    """One line description of a search plan"""
+    actions = [entry['action'] for entry in plan]
+    capped = sum(1 for entry in plan if (entry['total'] or 0) > SEARCH_OFFSET_CAP)
+    return (f"{len(plan)} terms probed, {capped} over the offset cap, {actions.count('split')} split, "
+            f"{actions.count('prune')} pruned as duplicates")
@@ -0,0 +1,71 @@
+# rate_limiter.py
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Adaptive token-bucket rate limiter shared by concurrent API workers
+
+    Tokens refill at `rate` per second up to `capacity`. A 429 response halves the
+    rate and blocks every caller until Retry-After has passed, each successful call
+    then nudges the rate back up towards the configured maximum.
+    """
+
+    def __init__(self, rate=10.0, capacity=None, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self):
+        """Block until a token is available and return the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def backoff(self, retry_after=None):
+        """Slow down after a 429, pausing all callers for Retry-After seconds"""
+        with self.lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after else 1.0 / self.rate
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = 0
+            self.updated = self.blocked_until
+
+    def success(self):
+        """Additively recover the rate after a successful call"""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def retry_after_seconds(error, default=1.0):
+    """Read the Retry-After header (in seconds) from a SpotifyException"""
+    headers = getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
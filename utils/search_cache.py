@@ -0,0 +1,176 @@
+# search_cache.py
+# Persistent cache for Spotify search pages, so re-runs and backfills skip the API round trip
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.metrics import recorder
+
+def search_cache_key(q, type='track', limit=10, offset=0, market=None):
+    """Build the cache key for one search page"""
+    return json.dumps([q, type, limit, offset, market])
+
+
+class SQLiteSearchCache:
+    """
+    Local SQLite backend with TTL expiry and size-bounded LRU eviction
+
+    Args:
+        path: SQLite file the pages are stored in
+        ttl: Seconds a cached page stays valid
+        max_entries: Least recently used pages are evicted beyond this count
+    """
+
+    def __init__(self, path='cache/search_cache.sqlite', ttl=86400, max_entries=50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache (accessed)")
+        self.connection.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, created FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self.connection.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self.connection.commit()
+                return None
+            self.connection.execute("UPDATE search_cache SET accessed = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            # Drop the least recently used pages once we're over the size bound
+            self.connection.execute("""
+                DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM search_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class RedisSearchCache:
+    """
+    Optional Redis backend, pages expire through Redis TTLs and a sorted set of
+    access times keeps the cache size-bounded
+
+    Args:
+        url: Redis connection URL
+        ttl: Seconds a cached page stays valid
+        max_entries: Least recently used pages are evicted beyond this count
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', ttl=86400, max_entries=50000, prefix='spotify_etl:search:'):
+        import redis  # Only needed when the Redis backend is selected
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.lru_key = prefix + 'lru'
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        self.client.zadd(self.lru_key, {key: time.time()})
+        return json.loads(value)
+
+    def set(self, key, value):
+        pipe = self.client.pipeline()
+        pipe.setex(self.prefix + key, int(self.ttl), json.dumps(value))
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.zcard(self.lru_key)
+        size = pipe.execute()[-1]
+
+        if size > self.max_entries:
+            evicted = self.client.zpopmin(self.lru_key, size - self.max_entries)
+            if evicted:
+                self.client.delete(*[self.prefix + member.decode() for member, _ in evicted])
+
+    def close(self):
+        self.client.close()
+
+
+class CachedSpotify:
+    """Wraps a spotipy client so search() reads through the response cache"""
+
+    def __init__(self, sp, cache):
+        self.sp = sp
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def cached_search(self, q, limit=10, offset=0, type='track', market=None):
+        """The cached page of a search, None if it has to be fetched. Never calls the API."""
+        results = self.cache.get(search_cache_key(q, type=type, limit=limit, offset=offset, market=market))
+        if results is not None:
+            self.hits += 1
+            recorder.record_cache_hit()
+        return results
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        results = self.cached_search(q, limit=limit, offset=offset, type=type, market=market)
+        if results is not None:
+            return results
+
+        key = search_cache_key(q, type=type, limit=limit, offset=offset, market=market)
+        self.misses += 1
+        results = self.sp.search(q=q, limit=limit, offset=offset, type=type, market=market)
+        self.cache.set(key, results)
+        return results
+
+    def __getattr__(self, name):
+        # Everything other than search goes straight to the wrapped client
+        return getattr(self.sp, name)
+
+
+def create_search_cache(backend='sqlite', ttl=86400, max_entries=50000,
+                        path='cache/search_cache.sqlite', redis_url=None):
+    """
+    Build a search cache for the given backend
+
+    Args:
+        backend: 'sqlite', 'redis' or 'none'
+        ttl: Seconds a cached page stays valid
+        max_entries: Maximum number of cached pages
+        path: SQLite file for the sqlite backend
+        redis_url: Connection URL for the redis backend
+
+    Returns:
+        Cache instance, or None if caching is disabled
+    """
+    if not backend or backend == 'none':
+        return None
+    if backend == 'sqlite':
+        return SQLiteSearchCache(path=path, ttl=ttl, max_entries=max_entries)
+    if backend == 'redis':
+        return RedisSearchCache(url=redis_url or 'redis://localhost:6379/0', ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"Unknown search cache backend: {backend}")
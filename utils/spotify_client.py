@@ -0,0 +1,199 @@
+# spotify_client.py
+# Shared Spotify clients: one pooled keep-alive HTTP session and one access token per process
+#
+# A client credentials token is valid for an hour. It is kept in memory and in a shared store
+# (a file under cache/ or Redis), so parallel workers and backfill processes reuse one token
+# instead of each fetching their own. Clients are cached per process, so repeated partitions
+# and the enrichment step reuse the same connections instead of opening new TLS sessions.
+import json
+import os
+import threading
+import time
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import CacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+TOKEN_EXPIRY_MARGIN = 60  # Seconds before expiry at which a token is refreshed, same as spotipy
+
+# Clients shared by every caller in this process, keyed by (client_id, retry_rate_limits).
+# A forked process (backfill workers) can't reuse the parent's sockets, so the pid is checked.
+_clients = {}
+_client_pid = None
+_client_lock = threading.Lock()
+
+def client_settings():
+    """HTTP session and token cache settings from the environment"""
+    return {
+        'pool_size': int(os.getenv('SPOTIFY_POOL_SIZE', 10)),
+        'retries': int(os.getenv('SPOTIFY_RETRIES', 3)),
+        'backoff_factor': float(os.getenv('SPOTIFY_BACKOFF', 0.3)),
+        'timeout': (float(os.getenv('SPOTIFY_CONNECT_TIMEOUT', 3.05)), float(os.getenv('SPOTIFY_READ_TIMEOUT', 10))),
+        'token_cache': os.getenv('SPOTIFY_TOKEN_CACHE', 'file'),
+        'token_cache_path': os.getenv('SPOTIFY_TOKEN_CACHE_PATH', 'cache/spotify_token-{client_id}.json'),
+        'redis_url': os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    }
+
+def create_session(pool_size=10, retries=3, backoff_factor=0.3, status_forcelist=RETRY_STATUS_CODES):
+    """
+    Keep-alive HTTP session with a connection pool and retries on connection errors and
+    the given status codes
+
+    Args:
+        pool_size: Connections kept open per host, should be at least the number of
+            threads sharing the session
+        retries: Retries per request
+        backoff_factor: Sleep between retries is backoff_factor * 2 ** (retry - 1) seconds
+        status_forcelist: Status codes retried by the session itself
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class FileTokenStore:
+    """Token kept in a JSON file, written atomically so other processes never read half a token"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def get(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, token_info):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(token_info, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+
+class RedisTokenStore:
+    """Token kept in Redis, expiring with the token itself"""
+
+    def __init__(self, url, key):
+        import redis  # Only needed when the Redis token cache is selected
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def get(self):
+        value = self.client.get(self.key)
+        return json.loads(value) if value else None
+
+    def save(self, token_info):
+        ttl = int(token_info['expires_at'] - time.time())
+        if ttl > 0:
+            self.client.set(self.key, json.dumps(token_info), ex=ttl)
+
+
+class SharedTokenCache(CacheHandler):
+    """
+    spotipy cache handler keeping the token in memory in front of a shared store
+
+    spotipy asks its cache handler for the token on every request, so the store is only
+    read when there is no token in memory or it is about to expire. `store` None keeps
+    the token in memory only.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self.token_info = None
+        self.lock = threading.Lock()
+
+    def get_cached_token(self):
+        token_info = self.token_info
+        if token_info and token_info['expires_at'] - time.time() >= TOKEN_EXPIRY_MARGIN:
+            return token_info
+        if self.store is None:
+            return token_info
+        with self.lock:
+            self.token_info = self.store.get() or token_info
+            return self.token_info
+
+    def save_token_to_cache(self, token_info):
+        self.token_info = token_info
+        if self.store is not None:
+            self.store.save(token_info)
+
+
+def create_token_cache(client_id, backend='file', path='cache/spotify_token-{client_id}.json', redis_url=None):
+    """
+    Token cache for one client id
+
+    Args:
+        backend: 'file', 'redis' or 'memory' (no sharing across processes)
+        path: Token file for the file backend, `{client_id}` is filled in
+        redis_url: Connection URL for the redis backend
+    """
+    if backend == 'memory':
+        return SharedTokenCache()
+    if backend == 'redis':
+        return SharedTokenCache(RedisTokenStore(redis_url or 'redis://localhost:6379/0',
+                                                f'spotify_etl:token:{client_id}'))
+    if backend == 'file':
+        return SharedTokenCache(FileTokenStore(path.format(client_id=client_id)))
+    raise ValueError(f"Unknown token cache backend '{backend}'")
+
+def get_spotify_client(client_id, client_secret, retry_rate_limits=True):
+    """
+    Spotify client shared by every caller in this process
+
+    The first call for a client id creates its token cache, HTTP session and client,
+    later calls return the same client. With retry_rate_limits False, 429s are not
+    retried by the session, so they surface to our own rate limiter.
+    """
+    global _client_pid
+    key = (client_id, retry_rate_limits)
+    with _client_lock:
+        if _client_pid != os.getpid():
+            _clients.clear()
+            _client_pid = os.getpid()
+        sp = _clients.get(key)
+        if sp is None:
+            settings = client_settings()
+            status_forcelist = RETRY_STATUS_CODES if retry_rate_limits else (500, 502, 503, 504)
+            session = create_session(settings['pool_size'], settings['retries'], settings['backoff_factor'],
+                                     status_forcelist)
+            # Both retry modes of a client id share one token
+            credentials = next((client.auth_manager for (other_id, _), client in _clients.items()
+                                if other_id == client_id), None)
+            if credentials is None:
+                credentials = SpotifyClientCredentials(
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    requests_session=session,
+                    requests_timeout=settings['timeout'],
+                    cache_handler=create_token_cache(client_id, settings['token_cache'],
+                                                     settings['token_cache_path'], settings['redis_url'])
+                )
+            sp = spotipy.Spotify(auth_manager=credentials, requests_session=session,
+                                 requests_timeout=settings['timeout'])
+            _clients[key] = sp
+        return sp
+
+def reset_clients():
+    """Close the shared sessions, the next get_spotify_client call creates new ones"""
+    with _client_lock:
+        for sp in _clients.values():
+            sp._session.close()
+        _clients.clear()
@@ -0,0 +1,18 @@
+# state_file.py
+# Small JSON state files (backfill progress, last successful runs)
+import json
+import os
+
+def load_state(path, default=None):
+    """Read a JSON state file, returns `default` (or an empty dict) if there is none yet"""
+    if not os.path.exists(path):
+        return default if default is not None else {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(path, state):
+    """Write the state file atomically so a crash never leaves it half written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)